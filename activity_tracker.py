@@ -1,10 +1,19 @@
+import threading
 import time
-from dateutil import tz
-from datetime import datetime
 from pynput import mouse, keyboard
+from log_writer import LogWriter, TextEncoder
+from binary_log import BinaryEncoder
+from event_aggregator import EventAggregator
+from scripted_detector import ScriptedActivityDetector
+from scheduler import PAUSE
+from timezone_manager import TimestampService
+import metrics
+import startup_report
 
 class ActivityTracker:
-    def __init__(self, log_file, tz_manager):
+    def __init__(self, log_file, tz_manager, log_batch_size=100, log_flush_interval=1.0,
+                 aggregate_events=False, aggregate_window=5, scripted_detector=None,
+                 log_format='text', log_rotator=None, spool=None, index=None):
         self.mouse_activity = False
         self.keyboard_activity = False
         self.last_activity_time = time.time()
@@ -14,69 +23,145 @@ class ActivityTracker:
         self.mouse_listener = None
         self.keyboard_listener = None
         self.tz_manager = tz_manager
-        self.time_diffs = []
+        self.clock = TimestampService(tz_manager)  # Cached tzinfo and minute prefix, anchored to a suspend-aware clock
+        self.activity_waiters = []  # Callbacks to run once on the next input event
+        self.waiters_lock = threading.Lock()
+        self.scheduler = None
+        self.tick_job = None
+        # Called from the listener threads with each input event; the asyncio runtime replaces it
+        # to hand events to its loop instead of handling them on the listener thread
+        self.dispatch = self.handle_event
+        self.index = index  # Optional HourlyIndex receiving event counts per window
 
-    def log_activity(self, activity_type):
-        """Logs activity to the log file with a timestamp."""
-        try:
-            # Use dateutil's tz library to handle various timezone formats
-            local_tz = tz.gettz(self.tz_manager.current_timezone)  # Will work for "India Standard Time"
-            timestamp = datetime.now(local_tz).strftime('%Y-%m-%d %H:%M:%S')
-            
-            with open(self.log_file, 'a') as log:
-                log.write(f"{timestamp} - {activity_type}\n")
-            print(f"Activity logged: {timestamp} - {activity_type}")
-        except Exception as e:
-            print(f"Error logging activity: {e}")
-
-    def detect_scripted_activity(self):
-        """Detects if scripted activity is occurring based on time differences and patterns."""
-        current_time = time.time()
-        time_diff = current_time - self.last_activity_time
-        self.time_diffs.append(time_diff)
-        
-        # Keep a sliding window of recent time differences
-        if len(self.time_diffs) > 10:  # Adjust the window size as needed
-            self.time_diffs.pop(0)
-
-        # Check for consistently small time differences
-        if all(diff < 0.015 for diff in self.time_diffs):  # Detect fast repeated actions
-            self.scripted_activity = True
-            self.log_activity("Scripted activity detected!")
-        else:
-            self.scripted_activity = False  # Reset if no scripted activity detected
+        # Streaming detector over the gaps between input events
+        self.scripted_detector = scripted_detector or ScriptedActivityDetector()
+        self.scripted_detector.on_change = self.on_scripted_activity_change
+
+        # Records are formatted and written in batches by a background thread
+        self.log_writer = LogWriter(
+            log_file,
+            BinaryEncoder() if log_format == 'binary' else TextEncoder(self.format_log_line),
+            batch_size=log_batch_size,
+            flush_interval=log_flush_interval,
+            rotator=log_rotator,
+            spool=spool
+        )
+        self.log_writer.start()
+
+        # Per-window event counts; in aggregate mode one summary per event type is logged per window
+        self.aggregate_events = aggregate_events
+        self.event_aggregator = EventAggregator(
+            window=aggregate_window,
+            emit=self.log_writer.write if aggregate_events else None,
+            format_time=self.format_clock,
+            on_window=index.add_events if index is not None else None
+        )
+        metrics.registry.add_collector(self.collect_metrics)
+
+    def collect_metrics(self):
+        """Event rates by type over the last aggregation window, read when metrics are exported."""
+        values = {f"events_per_second.{kind}": rate for kind, rate in self.event_rates().items()}
+        values['scripted_activity'] = self.scripted_activity
+        values['log_queue_depth'] = self.log_writer.records.qsize()
+        return values
+
+    def event_rates(self):
+        """Events per second by type over the last completed aggregation window."""
+        window = self.event_aggregator.window
+        return {kind: count / window for kind, count in self.last_window_counts.items()}
 
+    def format_log_line(self, ts, activity_type):
+        """Formats a queued record as a log line; runs on the writer thread."""
+        return f"{self.clock.format(ts)} - {activity_type}\n"
+
+    def format_clock(self, ts):
+        """Formats the time of day of a timestamp for aggregated summaries."""
+        return self.clock.format_clock(ts)
+
+    def log_activity(self, activity_type, timestamp=None):
+        """Queues an activity record for the log writer."""
+        self.log_writer.write(activity_type, self.clock.now() if timestamp is None else timestamp)
+
+    def record_event(self, kind, activity_type):
+        """Counts an input event and logs it unless events are being aggregated."""
+        now = self.last_activity_time  # Read from the clock by detect_scripted_activity for this event
+        self.event_aggregator.add(kind, now)
+        if not self.aggregate_events:
+            self.log_activity(activity_type, now)
+
+    @property
+    def event_counts(self):
+        """Event counts by type for the current aggregation window."""
+        return self.event_aggregator.current_counts
+
+    @property
+    def last_window_counts(self):
+        """Event counts by type for the last completed aggregation window."""
+        return self.event_aggregator.last_window_counts
+
+    def detect_scripted_activity(self, current_time=None):
+        """Feeds the time since the previous event to the scripted activity detector."""
+        if current_time is None:
+            current_time = self.clock.now()
+        self.scripted_activity = self.scripted_detector.update(current_time - self.last_activity_time)
         self.last_activity_time = current_time
+        if self.activity_waiters:
+            self.wake_activity_waiters()
+
+    def notify_on_activity(self, callback):
+        """Calls `callback()` once, on the listener thread, when the next input event arrives."""
+        with self.waiters_lock:
+            self.activity_waiters.append(callback)
+
+    def wake_activity_waiters(self):
+        with self.waiters_lock:
+            waiters, self.activity_waiters = self.activity_waiters, []
+        for callback in waiters:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error waking on activity: {e}")
+
+    def on_scripted_activity_change(self, active, check_name):
+        """Logs scripted activity only when it starts or stops."""
+        if active:
+            self.log_activity(f"Scripted activity detected! ({check_name})")
+            if self.index is not None:
+                self.index.add_events(time.time(), {'scripted': 1})
+        else:
+            self.log_activity("Scripted activity stopped")
+
+    def handle_event(self, kind, activity_type, now=None):
+        """Handles one input event; `now` is when it happened, if it was queued."""
+        if kind == 'key':
+            self.keyboard_activity = True
+        else:
+            self.mouse_activity = True
+        self.detect_scripted_activity(now)
+        self.record_event(kind, activity_type)
 
     def on_mouse_move(self, x, y):
         """Handles mouse movement events."""
-        self.mouse_activity = True
-        self.detect_scripted_activity()
-        self.log_activity("Mouse Moved")
+        self.dispatch('move', "Mouse Moved")
 
     def on_click(self, x, y, button, pressed):
         """Handles mouse click events."""
-        self.mouse_activity = True
-        self.detect_scripted_activity()
-        self.log_activity("Mouse Clicked")
+        self.dispatch('click', "Mouse Clicked")
 
     def on_scroll(self, x, y, dx, dy):
         """Handles mouse scroll events."""
-        self.mouse_activity = True
-        self.detect_scripted_activity()
-        self.log_activity("Mouse Scrolled")
+        self.dispatch('scroll', "Mouse Scrolled")
 
     def on_key_press(self, key):
         """Handles key press events."""
-        self.keyboard_activity = True
-        self.detect_scripted_activity()
         try:
-            self.log_activity(f"Key Pressed: {key.char}")
+            activity_type = f"Key Pressed: {key.char}"
         except AttributeError:
-            self.log_activity(f"Special Key Pressed: {key}")
+            activity_type = f"Special Key Pressed: {key}"
+        self.dispatch('key', activity_type)
 
-    def start_tracking(self):
-        """Starts tracking mouse and keyboard activities."""
+    def start_listeners(self):
+        """Starts the mouse and keyboard listener threads."""
         self.mouse_listener = mouse.Listener(
             on_move=self.on_mouse_move,
             on_click=self.on_click,
@@ -86,16 +171,49 @@ class ActivityTracker:
 
         self.mouse_listener.start()
         self.keyboard_listener.start()
+        startup_report.mark("input tracking started")
 
-        # Keep the tracking alive until explicitly stopped
-        while self.running:
-            time.sleep(0.1)  # Reduce CPU usage while waiting
-
-    def stop_tracking(self):
-        """Stops tracking mouse and keyboard activities."""
-        self.running = False
+    def stop_listeners(self):
+        """Stops the listener threads; no further events are dispatched."""
         if self.mouse_listener:
             self.mouse_listener.stop()
+            self.mouse_listener = None
         if self.keyboard_listener:
             self.keyboard_listener.stop()
-        
+            self.keyboard_listener = None
+
+    def start_tracking(self, scheduler):
+        """Starts tracking mouse and keyboard activities; window rollover runs on `scheduler`."""
+        self.start_listeners()
+
+        # Report windows that ended without further input; the first run lands just after the current window ends
+        self.scheduler = scheduler
+        aggregator = self.event_aggregator
+        self.tick_job = scheduler.every(
+            'aggregate', aggregator.window, self.roll_aggregate_window,
+            delay=max(0.0, aggregator.window_end - time.time()) + 0.05
+        )
+
+    def roll_aggregate_window(self):
+        """Scheduled once per window; pauses while idle and is resumed by the next input event."""
+        aggregator = self.event_aggregator
+        aggregator.roll_if_due()
+        if not self.running:
+            return PAUSE
+        if any(aggregator.last_window_counts.values()) or any(aggregator.current_counts.values()):
+            return None
+        # Idle for a whole window: stop waking up until there is input again
+        job = self.tick_job
+        self.scheduler.pause_until(job, lambda: self.notify_on_activity(lambda: self.scheduler.resume(job)))
+        if any(aggregator.current_counts.values()):
+            self.scheduler.resume(job)  # An event arrived before the waiter was registered
+        return PAUSE
+
+    def stop_tracking(self):
+        """Stops tracking mouse and keyboard activities."""
+        self.running = False
+        if self.tick_job is not None:
+            self.scheduler.cancel(self.tick_job)
+        self.stop_listeners()
+        self.event_aggregator.flush()  # Log the counts of the window still open
+        self.log_writer.close()  # Flush any records still queued
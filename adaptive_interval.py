@@ -0,0 +1,199 @@
+import os
+import sys
+import time
+
+# Settings that change how often the capture job runs; the schedule is re-applied when one of them changes
+INTERVAL_KEYS = ('screenshot_interval', 'capture_display_intervals', 'capture_adaptive', 'capture_min_interval',
+                 'capture_max_interval')
+
+# How much one event of each kind counts towards activity; mouse moves arrive by the dozen per second
+EVENT_WEIGHTS = {
+    'key': 1.0,
+    'click': 1.0,
+    'scroll': 0.5,
+    'move': 0.02,
+}
+
+
+class ResourceMonitor:
+    """Samples CPU load, battery and spool usage, at most once every `sample_interval` seconds.
+
+    CPU and battery come from psutil when it is installed. Without it, CPU is the load
+    average on Unix and the battery is read from /sys on Linux or GetSystemPowerStatus
+    on Windows; readings that are not available are None.
+    """
+
+    def __init__(self, spool=None, sample_interval=10):
+        self.spool = spool
+        self.sample_interval = sample_interval
+        self.last_sample = None
+        self.sampled_at = 0.0
+        try:
+            import psutil
+            self.psutil = psutil
+            psutil.cpu_percent(interval=None)  # The first call only starts the measurement
+        except ImportError:
+            self.psutil = None
+
+    def sample(self):
+        """Returns {'cpu': percent, 'battery': percent, 'plugged': bool, 'spool': fraction of quota}."""
+        now = time.monotonic()
+        if self.last_sample is None or now - self.sampled_at >= self.sample_interval:
+            battery, plugged = self.battery()
+            self.last_sample = {'cpu': self.cpu_percent(), 'battery': battery, 'plugged': plugged,
+                                'spool': self.spool_fraction()}
+            self.sampled_at = now
+        return self.last_sample
+
+    def cpu_percent(self):
+        if self.psutil is not None:
+            return self.psutil.cpu_percent(interval=None)
+        try:
+            return os.getloadavg()[0] / (os.cpu_count() or 1) * 100
+        except (AttributeError, OSError):
+            return None  # Windows without psutil
+
+    def battery(self):
+        """Returns (charge percent, plugged in), or (None, True) on a machine without a battery."""
+        if self.psutil is not None:
+            battery = self.psutil.sensors_battery() if hasattr(self.psutil, 'sensors_battery') else None
+            if battery is None:
+                return None, True
+            return battery.percent, bool(battery.power_plugged)
+        if sys.platform == 'win32':
+            return windows_battery()
+        return sysfs_battery()
+
+    def spool_fraction(self):
+        if self.spool is None:
+            return None
+        used, quota = self.spool.usage()
+        return used / quota if quota else None
+
+
+def windows_battery():
+    import ctypes
+
+    class SystemPowerStatus(ctypes.Structure):
+        _fields_ = [('ACLineStatus', ctypes.c_ubyte), ('BatteryFlag', ctypes.c_ubyte),
+                    ('BatteryLifePercent', ctypes.c_ubyte), ('SystemStatusFlag', ctypes.c_ubyte),
+                    ('BatteryLifeTime', ctypes.c_ulong), ('BatteryFullLifeTime', ctypes.c_ulong)]
+
+    status = SystemPowerStatus()
+    if not ctypes.windll.kernel32.GetSystemPowerStatus(ctypes.byref(status)) or status.BatteryFlag & 128:
+        return None, True  # No system battery
+    percent = status.BatteryLifePercent if status.BatteryLifePercent <= 100 else None
+    return percent, status.ACLineStatus != 0
+
+
+def sysfs_battery():
+    directory = '/sys/class/power_supply'
+    try:
+        for name in sorted(os.listdir(directory)):
+            if name.startswith('BAT'):
+                with open(os.path.join(directory, name, 'capacity')) as f:
+                    percent = int(f.read())
+                with open(os.path.join(directory, name, 'status')) as f:
+                    plugged = f.read().strip() != 'Discharging'
+                return percent, plugged
+    except (OSError, ValueError):
+        pass
+    return None, True
+
+
+class AdaptiveInterval:
+    """Chooses the capture interval between `min_interval` and `max_interval` from activity and resource pressure.
+
+    Activity is the weighted input event rate and the diff score of the last capture
+    per `min_interval` (a longer wait accumulates more change, which should not by
+    itself shorten the interval), each scaled to 0..1 and combined by taking the
+    larger. The target interval falls geometrically from the maximum at no activity to
+    the minimum at full activity. A screen that did not change halves the activity,
+    since capturing it again is wasted.
+    The interval shortens to the target at once, so a burst of work is covered, but
+    lengthens by at most `growth` per `min_interval`, so a short pause does not drop
+    straight to the slowest rate. High CPU load, running on battery and a nearly full
+    spool each multiply the target, up to `max_interval`.
+    """
+
+    def __init__(self, min_interval=15, max_interval=300, busy_rate=6.0, busy_diff=0.2, diff_threshold=0.01,
+                 growth=1.5, cpu_limit=80, battery_limit=30, spool_limit=0.8, monitor=None):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.busy_rate = busy_rate  # Weighted events per second that count as full activity
+        self.busy_diff = busy_diff  # Diff score per min_interval that counts as full activity
+        self.diff_threshold = diff_threshold
+        self.growth = growth
+        self.cpu_limit = cpu_limit  # Percent of all cores
+        self.battery_limit = battery_limit  # Percent charge, when not plugged in
+        self.spool_limit = spool_limit  # Fraction of the spool quota
+        self.monitor = monitor
+        self.interval = min_interval
+        self.diff_score = None  # Highest diff score of the last capture run
+        self.diff_rate = None  # The same per min_interval
+        self.reasons = []  # Pressures currently lengthening the interval
+        self.updated_at = None
+
+    @classmethod
+    def from_config(cls, config, monitor=None):
+        """Builds the controller from the capture_* configuration keys."""
+        adaptive = cls(monitor=monitor)
+        adaptive.configure(config)
+        adaptive.interval = adaptive.min_interval  # Start fast until there is activity to go by
+        return adaptive
+
+    def configure(self, config):
+        self.min_interval = config.get('capture_min_interval', 15)
+        self.max_interval = max(self.min_interval, config.get('capture_max_interval', 300))
+        self.diff_threshold = config.get('screenshot_diff_threshold', 0.01)
+        self.cpu_limit = config.get('capture_cpu_limit', 80)
+        self.battery_limit = config.get('capture_battery_limit', 30)
+        self.spool_limit = config.get('capture_spool_limit', 0.8)
+        self.interval = min(max(self.interval, self.min_interval), self.max_interval)
+
+    def observe_diff(self, score):
+        """Records the highest diff score of a capture run, which covers about one interval of change."""
+        self.diff_score = score
+        self.diff_rate = score * self.min_interval / max(self.interval, self.min_interval)
+
+    def activity(self, rates):
+        """Returns activity from 0 to 1 for event rates by kind and the last diff score."""
+        weighted = sum(rate * EVENT_WEIGHTS.get(kind, 1.0) for kind, rate in rates.items())
+        activity = min(1.0, weighted / self.busy_rate)
+        if self.diff_score is not None:
+            activity = max(activity, min(1.0, self.diff_rate / self.busy_diff))
+            if self.diff_score < self.diff_threshold:
+                activity /= 2
+        return activity
+
+    def pressure(self, sample):
+        """Returns (factor, reasons) by which resource pressure lengthens the interval."""
+        factor, reasons = 1.0, []
+        if sample.get('cpu') is not None and sample['cpu'] >= self.cpu_limit:
+            factor *= 2
+            reasons.append('cpu')
+        if not sample.get('plugged', True):
+            low = sample.get('battery') is not None and sample['battery'] <= self.battery_limit
+            factor *= 3 if low else 1.5
+            reasons.append('battery low' if low else 'on battery')
+        if sample.get('spool') is not None and sample['spool'] >= self.spool_limit:
+            factor *= 4 if sample['spool'] >= 1 else 2
+            reasons.append('spool')
+        return factor, reasons
+
+    def update(self, rates, now=None):
+        """Recomputes the interval from event rates per second by kind; returns it."""
+        now = time.monotonic() if now is None else now
+        target = self.max_interval * (self.min_interval / self.max_interval) ** self.activity(rates)
+        if self.monitor is not None:
+            factor, self.reasons = self.pressure(self.monitor.sample())
+            target *= factor
+        target = min(max(target, self.min_interval), self.max_interval)
+
+        if target <= self.interval:
+            self.interval = target
+        else:
+            elapsed = 0.0 if self.updated_at is None else now - self.updated_at
+            self.interval = min(target, self.interval * self.growth ** (elapsed / self.min_interval))
+        self.updated_at = now
+        return self.interval
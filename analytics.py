@@ -0,0 +1,430 @@
+"""Offline analytics over activity logs: sessions, idle gaps, per-hour histograms and scripted spans.
+
+Text logs, binary logs and directories of rotated segments are streamed in chunks of
+records, so memory stays bounded however large the logs are. Every chunk is parsed into
+NumPy arrays and folded into running totals in a single pass; only the results (one
+entry per session, idle gap, hour and scripted span) are kept.
+
+Usage:
+    python analytics.py [--idle-gap SECONDS] [--format json|csv] [--output PATH] LOG_OR_DIRECTORY...
+
+JSON is printed, or written to --output. CSV writes sessions.csv, idle_gaps.csv, hours.csv
+and scripted_spans.csv to the --output directory.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import binary_log
+import log_reader
+from log_rotation import SUMMARY_SUFFIX
+
+# Common in-memory form of text and binary records; `ts` is in epoch seconds
+CHUNK_DTYPE = np.dtype([
+    ('ts', '<f8'),
+    ('event', 'u1'),
+    ('flags', 'u1'),
+    ('count', '<u4'),
+    ('payload', '<u4'),
+])
+
+CHUNK_RECORDS = 1 << 18  # Binary records per chunk
+CHUNK_BYTES = 4 * 1024 * 1024  # Text read per chunk
+
+# Input events, in histogram column order; their codes are consecutive
+INPUT_EVENTS = [binary_log.MOUSE_MOVE, binary_log.MOUSE_CLICK, binary_log.MOUSE_SCROLL,
+                binary_log.KEY_PRESS, binary_log.SPECIAL_KEY]
+INPUT_NAMES = ['mouse_moves', 'mouse_clicks', 'mouse_scrolls', 'key_presses', 'special_keys']
+
+
+def format_time(ts):
+    return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def is_binary_log(path):
+    with open(path, 'rb') as f:
+        return f.read(len(binary_log.MAGIC)) == binary_log.MAGIC
+
+
+def log_files(paths):
+    """Expands directories of rotated segments into their log files, oldest first."""
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        manifest_file = os.path.join(path, 'index.json')
+        if os.path.exists(manifest_file):
+            # Read directly rather than through SegmentManifest, which would close the agent's open segment
+            with open(manifest_file, 'r') as f:
+                entries = sorted(json.load(f).get('segments', []), key=lambda entry: entry['start'])
+            files.extend(os.path.join(path, entry['path']) for entry in entries
+                         if os.path.exists(os.path.join(path, entry['path'])))
+            continue
+        for root, _, names in sorted(os.walk(path)):
+            files.extend(os.path.join(root, name) for name in sorted(names) if name.endswith(('.txt', '.bin')))
+    return files
+
+
+# Activities recognised without leaving NumPy: (text, event); key presses match any one ASCII character
+FAST_ACTIVITIES = [
+    (b'Mouse Moved', binary_log.MOUSE_MOVE),
+    (b'Mouse Clicked', binary_log.MOUSE_CLICK),
+    (b'Mouse Scrolled', binary_log.MOUSE_SCROLL),
+    (b'Key Pressed: ?', binary_log.KEY_PRESS),
+]
+# Positions of the digits in 'YYYY-mm-dd HH:MM:SS - ', and the separators expected around them
+DIGIT_POSITIONS = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
+SEPARATORS = {4: b'-', 7: b'-', 10: b' ', 13: b':', 16: b':', 19: b' ', 20: b'-', 21: b' '}
+ACTIVITY_OFFSET = 22
+HEAD_BYTES = ACTIVITY_OFFSET + max(len(text) for text, _ in FAST_ACTIVITIES)
+
+
+def parse_text_block(data, minutes, activities):
+    """Parses whole lines of a text log into a CHUNK_DTYPE array; malformed lines are skipped.
+
+    Columns of bytes at fixed offsets are compared and converted for every line at once.
+    Each distinct minute is converted to epoch seconds once, and only activities other
+    than plain mouse events and key presses are decoded line by line, through a cache.
+    Key codes are not kept, since the analysis does not use them.
+    """
+    buf = np.frombuffer(data + bytes(HEAD_BYTES), dtype=np.uint8)  # Padded, so every line has HEAD_BYTES to read
+    ends = np.flatnonzero(buf == ord('\n'))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    ends = ends - (buf[ends - 1] == ord('\r'))
+    keep = ends - starts > ACTIVITY_OFFSET
+    starts, ends = starts[keep], ends[keep]
+    heads = np.lib.stride_tricks.sliding_window_view(buf, HEAD_BYTES)[starts]  # One row of leading bytes per line
+
+    def column(offset):
+        return heads[:, offset]
+
+    valid = np.ones(len(starts), dtype=bool)
+    for offset, separator in SEPARATORS.items():
+        valid &= column(offset) == separator[0]
+    digits = {}
+    for offset in DIGIT_POSITIONS:
+        digits[offset] = column(offset).astype(np.int64) - ord('0')
+        valid &= (digits[offset] >= 0) & (digits[offset] <= 9)
+
+    def number(*offsets):
+        value = 0
+        for offset in offsets:
+            value = value * 10 + digits[offset]
+        return value
+
+    # YYYYmmddHHMM as one integer per line, then epoch seconds per distinct minute
+    minute_keys = number(0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15)
+    unique_keys, inverse = np.unique(np.where(valid, minute_keys, 0), return_inverse=True)
+    epochs = np.empty(len(unique_keys))
+    for index, key in enumerate(unique_keys.tolist()):
+        epoch = minutes.get(key)
+        if epoch is None:
+            try:
+                epoch = datetime(key // 10 ** 8, key // 10 ** 6 % 100, key // 10 ** 4 % 100,
+                                 key // 100 % 100, key % 100).timestamp()
+            except (ValueError, OverflowError):
+                epoch = np.nan
+            if len(minutes) > 10000:
+                minutes.clear()
+            minutes[key] = epoch
+        epochs[index] = epoch
+    ts = epochs[inverse.ravel()] + number(17, 18)
+    valid &= ~np.isnan(ts)
+
+    chunk = np.zeros(len(starts), dtype=CHUNK_DTYPE)
+    chunk['ts'] = ts
+    chunk['count'] = 1
+    lengths = ends - starts - ACTIVITY_OFFSET
+    known = np.zeros(len(starts), dtype=bool)
+    for text, event in FAST_ACTIVITIES:
+        match = lengths == len(text)
+        for offset, byte in enumerate(text):
+            if byte == ord('?'):
+                match &= column(ACTIVITY_OFFSET + offset) < 0x80
+            else:
+                match &= column(ACTIVITY_OFFSET + offset) == byte
+        chunk['event'][match] = event
+        known |= match
+
+    others = np.flatnonzero(valid & ~known)
+    if len(others):
+        rows = []
+        for start, end in zip((starts[others] + ACTIVITY_OFFSET).tolist(), ends[others].tolist()):
+            activity = data[start:end]
+            parsed = activities.get(activity)
+            if parsed is None:
+                parsed = binary_log.parse_activity(activity.decode('utf-8', errors='replace'))
+                if not parsed[1] & binary_log.FLAG_AGGREGATE and len(activities) < 10000:
+                    activities[activity] = parsed  # Summaries are unique, so only single events are cached
+            rows.append(parsed)
+        for field, values in zip(('event', 'flags', 'count', 'payload'), zip(*rows)):
+            chunk[field][others] = values
+    return chunk[valid]
+
+
+def text_chunks(path, chunk_bytes=CHUNK_BYTES):
+    """Yields CHUNK_DTYPE arrays parsed from a text log, reading about `chunk_bytes` at a time."""
+    minutes = {}  # YYYYmmddHHMM -> epoch seconds of that local minute
+    activities = {}  # Activity bytes -> (event, flags, count, payload)
+    tail = b''
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(chunk_bytes)
+            data = tail + block
+            if not block:
+                if not data:
+                    return
+                data += b'\n'  # Last line without a newline
+                tail = b''
+            else:
+                cut = data.rfind(b'\n') + 1
+                data, tail = data[:cut], data[cut:]
+            if data:
+                chunk = parse_text_block(data, minutes, activities)
+                if len(chunk):
+                    yield chunk
+            if not block:
+                return
+
+
+def binary_chunks(path, chunk_records=CHUNK_RECORDS):
+    """Yields CHUNK_DTYPE arrays read from a binary log, joining small chunks into larger ones."""
+    record_dtype = np.dtype(log_reader.RECORD_DTYPE)
+    pending, pending_records = [], 0
+
+    def convert():
+        records = np.frombuffer(b''.join(pending), dtype=record_dtype)
+        chunk = np.empty(len(records), dtype=CHUNK_DTYPE)
+        chunk['ts'] = records['ts_ms'] / 1000
+        for field in ('event', 'flags', 'count', 'payload'):
+            chunk[field] = records[field]
+        return chunk
+
+    for data in log_reader.iter_chunks(path):
+        pending.append(data)
+        pending_records += len(data) // record_dtype.itemsize
+        if pending_records >= chunk_records:
+            yield convert()
+            pending, pending_records = [], 0
+    if pending_records:
+        yield convert()
+
+
+def read_chunks(path):
+    return binary_chunks(path) if is_binary_log(path) else text_chunks(path)
+
+
+class ActivityAnalyzer:
+    """Folds chunks of records, in log order, into sessions, idle gaps, hourly counts and scripted spans.
+
+    A session is a run of input events where no gap between consecutive events reaches
+    `idle_gap` seconds; the gaps that do are the idle gaps between sessions. Aggregated
+    summaries count as `count` events spanning their window.
+    """
+
+    def __init__(self, idle_gap=300):
+        self.idle_gap = idle_gap
+        self.records = 0
+        self.first = self.last = None
+        self.totals = np.zeros(len(INPUT_EVENTS), dtype=np.int64)
+        self.last_end = -np.inf  # End of the latest input event seen
+        self.session = None  # [start, end, events] of the session still open
+        self.sessions = []
+        self.idle_gaps = []
+        self.hours = {}  # 'YYYY-mm-dd HH:00' -> event counts in INPUT_EVENTS order
+        self.hour_labels = {}  # Quarter hour since the epoch -> local hour label
+        self.scripted = None  # (start, check) of the scripted span still open
+        self.scripted_spans = []
+
+    def add(self, chunk):
+        if not len(chunk):
+            return
+        self.records += len(chunk)
+        ts = chunk['ts']
+        first, last = float(ts.min()), float(ts.max())
+        self.first = first if self.first is None else min(self.first, first)
+        self.last = last if self.last is None else max(self.last, last)
+
+        event = chunk['event']
+        for index in np.flatnonzero((event == binary_log.SCRIPTED_START) | (event == binary_log.SCRIPTED_STOP)):
+            self.add_scripted(float(ts[index]), int(event[index]), int(chunk['payload'][index]))
+
+        inputs = chunk[(event >= INPUT_EVENTS[0]) & (event <= INPUT_EVENTS[-1])]
+        if len(inputs):
+            inputs = inputs[np.argsort(inputs['ts'], kind='stable')]  # Summaries are logged after their window
+            self.add_sessions(inputs)
+            self.add_hours(inputs)
+
+    def add_scripted(self, ts, event, payload):
+        if event == binary_log.SCRIPTED_START and self.scripted is None:
+            checks = binary_log.SCRIPTED_CHECKS
+            self.scripted = (ts, checks[payload] if payload < len(checks) else 'unknown')
+        elif event == binary_log.SCRIPTED_STOP and self.scripted is not None:
+            start, check = self.scripted
+            self.scripted_spans.append((start, ts, check))
+            self.scripted = None
+
+    def add_sessions(self, inputs):
+        ts = inputs['ts']
+        counts = inputs['count'].astype(np.int64)
+        aggregated = (inputs['flags'] & binary_log.FLAG_AGGREGATE) != 0
+        ends = np.maximum.accumulate(np.where(aggregated, ts + inputs['payload'] / 1000, ts))
+        ends = np.maximum(ends, self.last_end)
+        previous_ends = np.concatenate(([self.last_end], ends[:-1]))
+        cumulative = np.cumsum(counts)
+
+        # Each session starts at a gap of at least idle_gap; only those indices are visited in Python
+        starts = np.flatnonzero(ts - previous_ends >= self.idle_gap).tolist()
+        new_session = bool(starts) and starts[0] == 0
+        bounds = ([] if new_session else [0]) + starts + [len(ts)]
+        for begin, end in zip(bounds, bounds[1:]):
+            if begin or new_session:
+                if self.session is not None:
+                    self.sessions.append(self.session)
+                    self.idle_gaps.append((self.session[1], float(ts[begin])))
+                self.session = [float(ts[begin]), float(ts[begin]), 0]
+            self.session[1] = max(self.session[1], float(ends[end - 1]))
+            self.session[2] += int(cumulative[end - 1] - (cumulative[begin - 1] if begin else 0))
+        self.last_end = float(ends[-1])
+
+    def add_hours(self, inputs):
+        # Every time zone offset is a multiple of 15 minutes, so a quarter hour lies within one local hour
+        quarters, inverse = np.unique((inputs['ts'] // 900).astype(np.int64), return_inverse=True)
+        columns = len(INPUT_EVENTS)
+        counts = np.bincount(
+            inverse.ravel() * columns + (inputs['event'] - INPUT_EVENTS[0]),
+            weights=inputs['count'], minlength=len(quarters) * columns
+        ).reshape(len(quarters), columns).astype(np.int64)
+        self.totals += counts.sum(axis=0)
+        for quarter, row in zip(quarters.tolist(), counts):
+            label = self.hour_labels.get(quarter)
+            if label is None:
+                label = self.hour_labels[quarter] = datetime.fromtimestamp(quarter * 900).strftime('%Y-%m-%d %H:00')
+            if label in self.hours:
+                self.hours[label] += row
+            else:
+                self.hours[label] = row.copy()
+
+    def active_seconds_by_hour(self, sessions):
+        """Splits session time at local hour boundaries."""
+        active = {}
+        for start, end, _ in sessions:
+            t = start
+            while t < end:
+                local = datetime.fromtimestamp(t)
+                hour_start = local.replace(minute=0, second=0, microsecond=0)
+                next_hour = (hour_start + timedelta(hours=1)).timestamp()
+                label = hour_start.strftime('%Y-%m-%d %H:00')
+                active[label] = active.get(label, 0.0) + min(end, next_hour) - t
+                t = next_hour
+        return active
+
+    def result(self):
+        """Returns the summary as a JSON-serialisable dict; sessions and spans still open end at the last record."""
+        sessions = self.sessions + ([self.session] if self.session is not None else [])
+        scripted_spans = list(self.scripted_spans)
+        if self.scripted is not None:
+            scripted_spans.append((self.scripted[0], self.last, self.scripted[1]))
+        active_by_hour = self.active_seconds_by_hour(sessions)
+
+        hours = []
+        for label in sorted(self.hours):
+            counts = self.hours[label]
+            row = {'hour': label, 'events': int(counts.sum()), 'active_seconds': round(active_by_hour.get(label, 0.0), 1)}
+            row.update((name, int(count)) for name, count in zip(INPUT_NAMES, counts))
+            hours.append(row)
+
+        return {
+            'first': format_time(self.first) if self.first is not None else None,
+            'last': format_time(self.last) if self.last is not None else None,
+            'records': self.records,
+            'events': int(self.totals.sum()),
+            'events_by_type': {name: int(count) for name, count in zip(INPUT_NAMES, self.totals)},
+            'idle_gap': self.idle_gap,
+            'active_seconds': round(sum(end - start for start, end, _ in sessions), 1),
+            'idle_seconds': round(sum(end - start for start, end in self.idle_gaps), 1),
+            'sessions': [
+                {'start': format_time(start), 'end': format_time(end), 'seconds': round(end - start, 1), 'events': events}
+                for start, end, events in sessions
+            ],
+            'idle_gaps': [
+                {'start': format_time(start), 'end': format_time(end), 'seconds': round(end - start, 1)}
+                for start, end in self.idle_gaps
+            ],
+            'hours': hours,
+            'scripted_spans': [
+                {'start': format_time(start), 'end': format_time(end), 'seconds': round(end - start, 1), 'check': check}
+                for start, end, check in scripted_spans
+            ],
+        }
+
+
+def analyze(paths, idle_gap=300):
+    """Analyzes log files and segment directories in one pass; returns the summary dict."""
+    analyzer = ActivityAnalyzer(idle_gap)
+    files = log_files(paths)
+    for path in files:
+        try:
+            for chunk in read_chunks(path):
+                analyzer.add(chunk)
+        except (OSError, ValueError) as e:
+            print(f"Error reading activity log {path}: {e}", file=sys.stderr)
+    summary = analyzer.result()
+    summary['files'] = len(files)
+    return summary
+
+
+def summarize_segment(path, idle_gap=300):
+    """Writes the summary of a closed log segment next to it; returns the summary's path."""
+    summary_path = path + SUMMARY_SUFFIX
+    temp_file = f"{summary_path}.tmp"
+    with open(temp_file, 'w') as f:
+        json.dump(analyze([path], idle_gap), f, separators=(',', ':'))
+    os.replace(temp_file, summary_path)
+    return summary_path
+
+
+def write_csv(summary, directory):
+    """Writes the sessions, idle gaps, hours and scripted spans of a summary as CSV tables."""
+    os.makedirs(directory, exist_ok=True)
+    columns = {
+        'sessions': ['start', 'end', 'seconds', 'events'],
+        'idle_gaps': ['start', 'end', 'seconds'],
+        'hours': ['hour', 'events', 'active_seconds'] + INPUT_NAMES,
+        'scripted_spans': ['start', 'end', 'seconds', 'check'],
+    }
+    for table, fields in columns.items():
+        with open(os.path.join(directory, f"{table}.csv"), 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(summary[table])
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Summarizes activity logs into sessions, idle gaps and hourly counts.")
+    parser.add_argument('paths', nargs='+', help="text or binary logs, or directories of rotated segments")
+    parser.add_argument('--idle-gap', type=float, default=300, help="seconds without input that end a session")
+    parser.add_argument('--format', default='json', choices=['json', 'csv'])
+    parser.add_argument('--output', help="JSON file, or directory for the CSV tables")
+    args = parser.parse_args(argv)
+
+    summary = analyze(args.paths, args.idle_gap)
+    if args.format == 'csv':
+        write_csv(summary, args.output or '.')
+    elif args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=1)
+    else:
+        json.dump(summary, sys.stdout, indent=1)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
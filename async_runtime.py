@@ -0,0 +1,245 @@
+import asyncio
+import concurrent.futures
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from scheduler import PAUSE
+from adaptive_interval import INTERVAL_KEYS
+
+
+class AsyncRuntime:
+    """Runs the agent's periodic work as tasks on one asyncio event loop.
+
+    Input callbacks only timestamp events and hand them to the loop through a bounded
+    `asyncio.Queue`; a full queue drops events and counts them rather than blocking the
+    listener threads. Screen capture is blocking, so it runs in a small dedicated
+    executor; the blocking upload drain runs on a daemon thread. `request_stop` may be
+    called from any thread and shuts down in order: stop input, handle queued events,
+    flush the log, finish encoding and give running uploads `upload_timeout` seconds to
+    complete.
+    """
+
+    def __init__(self, activity_tracker, screenshot_manager, tz_manager, config_store,
+                 upload=None, event_queue_size=10000, config_check_interval=2, timezone_check_interval=60,
+                 jobs=(), on_started=None, wake_upload=None, upload_timeout=30):
+        self.activity_tracker = activity_tracker
+        self.screenshot_manager = screenshot_manager
+        self.tz_manager = tz_manager
+        self.config = config_store
+        self.upload = upload  # Blocking callable(stop_event) that drains the upload queue, or None
+        self.wake_upload = wake_upload  # Called once upload_stop_event is set, to wake an idle drain
+        self.upload_timeout = upload_timeout
+        self.event_queue_size = event_queue_size
+        self.config_check_interval = config_check_interval
+        self.timezone_check_interval = timezone_check_interval
+        self.jobs = list(jobs)  # (interval, blocking callback) pairs run in the maintenance executor
+        self.on_started = on_started  # Called once every task has been started
+        self.dropped_events = 0
+        self.loop = None
+        self.events = None
+        self.stopping = None
+        self.activity = None  # Set by input events; idle tasks wait on it instead of waking up
+        self.interval_changed = None
+        self.upload_stop_event = threading.Event()
+        # Bounded pools for blocking work, so a slow disk or network never starves the loop
+        self.capture_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Capture")
+        self.maintenance_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Maintenance")
+
+    def run(self):
+        """Runs the agent until `request_stop` is called or the process is interrupted."""
+        try:
+            asyncio.run(self.main())
+        except KeyboardInterrupt:
+            pass  # Windows has no signal handlers on the loop; shutdown already ran as the task was cancelled
+
+    def request_stop(self):
+        """Starts a coordinated shutdown; safe to call from any thread."""
+        if self.loop is not None:
+            self.call_in_loop(self.stopping.set)
+
+    def dispatch(self, kind, activity_type):
+        """Replaces ActivityTracker.dispatch: runs on the listener threads, so it only queues the event."""
+        event = (kind, activity_type, self.activity_tracker.clock.now())
+        self.call_in_loop(lambda: self.offer(event))
+
+    def offer(self, event):
+        try:
+            self.events.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped_events += 1
+            if self.dropped_events % 1000 == 1:
+                print(f"Input event queue is full, dropped {self.dropped_events} events so far")
+
+    def call_in_loop(self, callback):
+        try:
+            self.loop.call_soon_threadsafe(callback)
+        except RuntimeError:
+            pass  # Loop already closed during shutdown
+
+    def on_config_changed(self, changed):
+        if any(key in changed for key in INTERVAL_KEYS):
+            self.call_in_loop(self.interval_changed.set)
+
+    def on_activity(self):
+        self.call_in_loop(self.activity.set)
+
+    async def wait_for(self, event, timeout=None):
+        """Waits for `event` or shutdown, at most `timeout` seconds; returns True unless it timed out."""
+        waiters = [asyncio.ensure_future(event.wait()), asyncio.ensure_future(self.stopping.wait())]
+        done, pending = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        for waiter in pending:
+            waiter.cancel()
+        return bool(done)
+
+    async def wait_for_activity(self, since):
+        """Sleeps until the first input event after `since` instead of polling an idle machine."""
+        self.activity.clear()
+        self.activity_tracker.notify_on_activity(self.on_activity)
+        # Input handled between the idle check and registering the waiter would never wake it
+        if self.activity_tracker.last_activity_time > since:
+            return
+        await self.wait_for(self.activity)
+
+    def handle_event(self, kind, activity_type, now):
+        try:
+            self.activity_tracker.handle_event(kind, activity_type, now)
+        except Exception as e:
+            print(f"Error handling {kind} event: {e}")
+
+    async def consume_events(self):
+        while True:
+            kind, activity_type, now = await self.events.get()
+            self.handle_event(kind, activity_type, now)
+
+    async def roll_aggregate_windows(self):
+        """Closes aggregation windows that ended without further input."""
+        aggregator = self.activity_tracker.event_aggregator
+        clock = self.activity_tracker.clock
+        while not self.stopping.is_set():
+            await self.wait_for(self.stopping, max(0.0, aggregator.window_end - time.time()) + 0.05)
+            aggregator.roll_if_due()
+            if not any(aggregator.last_window_counts.values()) and not any(aggregator.current_counts.values()):
+                await self.wait_for_activity(clock.now())
+
+    async def capture_screenshots(self):
+        """Captures on monotonic deadlines; interval changes apply at once and idle periods are slept through."""
+        manager = self.screenshot_manager
+        deadline = time.monotonic()
+        while not self.stopping.is_set():
+            last_capture = time.monotonic()
+            checked_at = self.activity_tracker.clock.now()
+            result = await self.loop.run_in_executor(self.capture_executor, manager.capture_screenshot)
+            if result == PAUSE:
+                print("No activity detected, pausing screenshots until there is activity.")
+                await self.wait_for_activity(checked_at)
+
+            # Advance from the previous deadline so capture time does not drift the schedule
+            interval = manager.capture_interval()
+            deadline += interval
+            now = time.monotonic()
+            if deadline <= now:
+                deadline = now + interval - (now - deadline) % interval  # Next slot on the cadence; skip missed ones
+            self.interval_changed.clear()
+            while await self.wait_for(self.interval_changed, deadline - time.monotonic()):
+                if self.stopping.is_set():
+                    return
+                # New interval: count it from the last capture rather than waiting out the old one
+                self.interval_changed.clear()
+                deadline = last_capture + manager.capture_interval()
+
+    async def every(self, interval, callback, executor=None):
+        """Runs a callback every `interval` seconds, on the loop or, if it blocks, in `executor`."""
+        deadline = time.monotonic()
+        while True:
+            deadline += interval
+            if await self.wait_for(self.stopping, max(0.0, deadline - time.monotonic())):
+                return
+            try:
+                if executor is None:
+                    callback()
+                else:
+                    await self.loop.run_in_executor(executor, callback)
+            except Exception as e:
+                print(f"Error in periodic task: {e}")
+
+    async def main(self):
+        self.loop = asyncio.get_running_loop()
+        self.events = asyncio.Queue(maxsize=self.event_queue_size)
+        self.stopping = asyncio.Event()
+        self.activity = asyncio.Event()
+        self.interval_changed = asyncio.Event()
+        try:
+            self.loop.add_signal_handler(signal.SIGINT, self.stopping.set)
+            self.loop.add_signal_handler(signal.SIGTERM, self.stopping.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: Ctrl+C raises KeyboardInterrupt instead
+
+        self.config.subscribe(self.on_config_changed)
+        # From here on the listeners only queue events; main.py usually started them during startup
+        self.activity_tracker.dispatch = self.dispatch
+        if self.activity_tracker.mouse_listener is None:
+            self.activity_tracker.start_listeners()
+
+        consumer = asyncio.ensure_future(self.consume_events())
+        tasks = [
+            asyncio.ensure_future(self.roll_aggregate_windows()),
+            asyncio.ensure_future(self.capture_screenshots()),
+            asyncio.ensure_future(self.every(self.config_check_interval, self.config.reload_if_changed)),
+            asyncio.ensure_future(self.every(self.timezone_check_interval, self.tz_manager.check_time_zone_change)),
+        ]
+        tasks += [
+            asyncio.ensure_future(self.every(interval, callback, self.maintenance_executor))
+            for interval, callback in self.jobs
+        ]
+        upload = None
+        if self.upload is not None:
+            future = concurrent.futures.Future()
+            threading.Thread(target=self.run_upload, args=(future,), name="UploadDrain", daemon=True).start()
+            upload = asyncio.wrap_future(future)
+        if self.on_started is not None:
+            self.on_started()
+
+        try:
+            await self.stopping.wait()
+        finally:
+            await self.shutdown(consumer, tasks, upload)
+
+    def run_upload(self, future):
+        """Runs the upload drain; on a daemon thread so an upload that never finishes cannot block exit."""
+        try:
+            self.upload(self.upload_stop_event)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(None)
+
+    async def shutdown(self, consumer, tasks, upload):
+        print("Shutting down...")
+        self.stopping.set()
+        self.activity_tracker.stop_listeners()
+        await asyncio.sleep(0)  # Let events already handed over reach the queue
+        # Handle the events still queued, then stop the periodic tasks
+        while not self.events.empty():
+            self.handle_event(*self.events.get_nowait())
+        consumer.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        # Flush the aggregation window and log, finish encoding, and let running uploads complete
+        await self.loop.run_in_executor(None, self.activity_tracker.stop_tracking)
+        await self.loop.run_in_executor(None, self.screenshot_manager.stop_capturing)
+        self.upload_stop_event.set()
+        if self.wake_upload is not None:
+            self.wake_upload()
+        if upload is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(upload), self.upload_timeout)
+            except asyncio.TimeoutError:
+                print(f"Uploads still running after {self.upload_timeout} seconds, exiting without them")
+            except Exception as e:
+                print(f"Error finishing uploads: {e}")
+        self.capture_executor.shutdown(wait=True)
+        self.maintenance_executor.shutdown(wait=True)
+        if self.dropped_events:
+            print(f"Dropped {self.dropped_events} input events while the event queue was full")
+        print("Shutdown complete.")
@@ -0,0 +1,181 @@
+"""Simulated working day comparing fixed capture intervals with the adaptive interval.
+
+A synthetic trace of typing, reading, editing bursts, idle time and periods on
+battery and with a full spool is replayed second by second in simulated time. Input
+rates feed AdaptiveInterval the way ActivityTracker.event_rates does, and the screen
+changes at random with each phase's probability and size. Captures follow the same
+rules as ScreenshotManager: no captures after screenshot_interval (60s for every
+policy, so only the interval differs) without input, and frames changing less than
+the diff threshold are not saved. Reports, per policy: screenshots saved, MB stored
+(at the size of an encoded synthetic 1080p frame), the share of screen changes shown
+in a screenshot within --min-interval seconds (changes never captured count as
+missed), and the mean delay from a screen change to the screenshot showing it.
+
+Run from the repository root:
+    python benchmarks/bench_adaptive_interval.py [--hours 8] [--seed 0]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adaptive_interval import AdaptiveInterval
+
+DIFF_THRESHOLD = 0.01
+SCREENSHOT_INTERVAL = 60  # Seconds without input after which capture pauses, as in the default config
+PLUGGED = {'cpu': 20, 'battery': None, 'plugged': True, 'spool': 0.3}
+
+# (name, minutes, events per second by kind, screen change probability per second, change size, resources)
+PHASES = [
+    ('typing', 25, {'key': 4.0, 'move': 5.0, 'click': 0.1}, 0.4, 0.02, PLUGGED),
+    ('reading', 20, {'scroll': 0.2, 'move': 1.0}, 0.03, 0.3, PLUGGED),
+    ('editing burst', 10, {'key': 3.0, 'click': 1.0, 'move': 40.0, 'scroll': 0.5}, 0.7, 0.1, PLUGGED),
+    ('idle', 15, {}, 0.0, 0.0, PLUGGED),
+    ('slow browsing', 20, {'move': 2.0, 'click': 0.05, 'scroll': 0.1}, 0.02, 0.5, PLUGGED),
+    ('typing on battery', 20, {'key': 4.0, 'move': 5.0}, 0.4, 0.02,
+     {'cpu': 20, 'battery': 25, 'plugged': False, 'spool': 0.3}),
+    ('typing, spool full', 10, {'key': 4.0, 'move': 5.0}, 0.4, 0.02, dict(PLUGGED, spool=0.95)),
+    ('busy CPU', 10, {'key': 2.0, 'move': 10.0, 'click': 0.2}, 0.3, 0.05, dict(PLUGGED, cpu=95)),
+]
+
+
+class TraceMonitor:
+    """Stands in for ResourceMonitor, returning the resources of the current phase."""
+
+    def __init__(self):
+        self.current = PLUGGED
+
+    def sample(self):
+        return self.current
+
+
+def trace(hours, seed):
+    """Yields (second, phase name, events this second by kind, screen change size or 0, resources)."""
+    rng = random.Random(seed)
+    second = 0
+    while second < hours * 3600:
+        for name, minutes, rates, change_probability, change_size, resources in PHASES:
+            for _ in range(minutes * 60):
+                events = {kind: rng.random() < rate if rate < 1 else int(rng.gauss(rate, rate / 4) + 0.5)
+                          for kind, rate in rates.items()}
+                change = change_size * rng.uniform(0.5, 1.5) if rng.random() < change_probability else 0.0
+                yield second, name, {kind: int(count) for kind, count in events.items()}, change, resources
+                second += 1
+                if second >= hours * 3600:
+                    return
+
+
+def simulate(events, interval=None, adaptive=None, window=5, bound=15):
+    """Replays the trace with a fixed `interval` or an AdaptiveInterval; returns the results.
+
+    A screen change counts as covered if a screenshot shows it within `bound` seconds.
+    """
+    monitor = adaptive.monitor if adaptive is not None else None
+    tick = adaptive.min_interval if adaptive is not None else interval
+    last_input = -10 ** 9
+    last_capture = None
+    next_tick = 0
+    window_counts = []  # Event counts of the last `window` seconds
+    pending = 0.0  # Share of the screen changed since the last saved screenshot
+    unsaved_changes = []  # Seconds at which changes not yet in a screenshot happened
+    saved = unchanged = 0
+    delays = []
+    changes = covered = 0
+    intervals = []  # (phase, adaptive interval) at every check
+
+    for second, phase, counts, change, resources in events:
+        if any(counts.values()):
+            last_input = second
+        window_counts.append(counts)
+        if len(window_counts) > window:
+            window_counts.pop(0)
+        if change:
+            pending = min(1.0, pending + change)
+            unsaved_changes.append(second)
+            changes += 1
+        if monitor is not None:
+            monitor.current = resources
+
+        if second < next_tick:
+            continue
+        next_tick = second + tick
+        if second - last_input > SCREENSHOT_INTERVAL:
+            continue  # Paused until the next input event
+        if adaptive is not None:
+            rates = {}
+            for window_count in window_counts:
+                for kind, count in window_count.items():
+                    rates[kind] = rates.get(kind, 0) + count / window
+            current = adaptive.update(rates, now=second)
+            intervals.append((phase, current))
+            if last_capture is not None and second - last_capture < current - tick / 2:
+                continue
+        last_capture = second
+        score = pending
+        if adaptive is not None:
+            adaptive.observe_diff(score)
+        if score < DIFF_THRESHOLD and saved:
+            unchanged += 1
+            continue
+        saved += 1
+        pending = 0.0
+        delays.extend(second - changed_at for changed_at in unsaved_changes)
+        covered += sum(1 for changed_at in unsaved_changes if second - changed_at <= bound)
+        unsaved_changes = []
+
+    return {
+        'saved': saved,
+        'unchanged': unchanged,
+        'coverage': covered / changes if changes else 1.0,
+        'delay': sum(delays) / len(delays) if delays else 0.0,
+        'intervals': intervals,
+    }
+
+
+def frame_bytes():
+    """Size of a synthetic 1080p desktop encoded as PNG, the default screenshot format."""
+    try:
+        from bench_screenshot_encoding import synthetic_frame
+        from screenshot_manager import encode_screenshot
+    except ImportError:
+        return 400 * 1024  # Without Pillow: a typical 1080p desktop screenshot
+    with tempfile.TemporaryDirectory() as directory:
+        return encode_screenshot(synthetic_frame(1920, 1080), os.path.join(directory, 'frame.png'))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--hours', type=float, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--min-interval', type=int, default=15)
+    parser.add_argument('--max-interval', type=int, default=300)
+    args = parser.parse_args(argv)
+
+    size = frame_bytes()
+    events = list(trace(args.hours, args.seed))
+    print(f"{args.hours:g} simulated hours, {size / 1024:.0f} KB per saved screenshot")
+    covered_header = f"changes in {args.min_interval}s"
+    print(f"{'policy':>22} {'saved':>7} {'unchanged':>10} {'MB stored':>10} {covered_header:>16} {'mean delay s':>13}")
+    policies = [(f"fixed {interval}s", interval, None) for interval in (15, 60, 300)]
+    adaptive = AdaptiveInterval(args.min_interval, args.max_interval, diff_threshold=DIFF_THRESHOLD,
+                                monitor=TraceMonitor())
+    policies.append((f"adaptive {args.min_interval}-{args.max_interval}s", None, adaptive))
+    for name, interval, controller in policies:
+        result = simulate(events, interval, controller, bound=args.min_interval)
+        print(f"{name:>22} {result['saved']:>7} {result['unchanged']:>10} {result['saved'] * size / 2 ** 20:>10.1f} "
+              f"{result['coverage']:>16.0%} {result['delay']:>13.1f}")
+
+    # Where the adaptive interval settled in each phase of the run above
+    print()
+    print(f"{'phase':>22} {'mean adaptive interval s':>25}")
+    for phase, *_ in PHASES:
+        intervals = [current for name, current in result['intervals'] if name == phase]
+        mean = f"{sum(intervals) / len(intervals):.0f}" if intervals else 'paused'
+        print(f"{phase:>22} {mean:>25}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,189 @@
+"""End-to-end agent benchmark: input load, screen replay and uploads, reported per hour.
+
+1. Input: each synthetic stream (human, burst, scripted at 1, 5 and 10 kHz) drives
+   ActivityTracker's listener callbacks for --seconds. Reports events/s, p50/p99
+   callback latency, CPU seconds and log bytes per hour.
+2. Screens: one simulated hour of captures at --interval, with generated frames (or
+   the screenshots in --frames) replayed through a capture backend, plus --displays
+   more displays showing a static screen. Reports capture latency, frames saved, CPU
+   seconds and bytes per hour.
+3. Uploads: everything produced above is drained from an UploadQueue by DataUploader
+   into moto's local S3 server (pip install "moto[server]"). Reports throughput and
+   bytes uploaded per hour of agent activity.
+
+Run from the repository root:
+    python benchmarks/bench_agent.py [--seconds 10] [--aggregate] [--frames DIR] [--displays N] [--skip-upload]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+import screenshot_manager
+from activity_tracker import ActivityTracker
+from config_store import ConfigStore
+from data_uploader import DataUploader
+from screenshot_manager import ScreenshotManager
+from timezone_manager import TimeZoneManager
+from upload_queue import UploadQueue
+
+from harness import (STREAMS, ActiveUser, ReplayBackend, SimulatedClock, directory_size, drive,
+                     generated_frames, percentile, recorded_frames, start_fake_s3)
+
+BUCKET = 'benchmark-bucket'
+
+
+def bench_input(directory, scenarios, seconds, aggregate, log_format, queue):
+    """Returns the log bytes written per hour by the human stream, or the first stream run."""
+    print(f"\nInput: {seconds}s per stream, aggregate_events={aggregate}, log_format={log_format}")
+    print(f"{'stream':>13} {'events':>9} {'events/s':>9} {'p50 us':>8} {'p99 us':>8} {'CPU s/h':>8} {'log MB/h':>9}")
+    per_hour = {}
+    for name in scenarios:
+        log_file = os.path.join(directory, f"activity_{name}.log")
+        tracker = ActivityTracker(log_file, TimeZoneManager(), aggregate_events=aggregate, log_format=log_format)
+        cpu_start = time.process_time()
+        events, wall, latencies = drive(tracker, STREAMS[name](), seconds)
+        tracker.stop_tracking()  # Flushes the log, so the writer's CPU is included
+        cpu = time.process_time() - cpu_start
+        log_bytes = os.path.getsize(log_file) if os.path.exists(log_file) else 0
+        per_hour[name] = log_bytes / wall * 3600
+        print(f"{name:>13} {events:>9} {events / wall:>9.0f} {percentile(latencies, 0.5) / 1000:>8.1f} "
+              f"{percentile(latencies, 0.99) / 1000:>8.1f} {cpu / wall * 3600:>8.1f} {per_hour[name] / 1e6:>9.2f}")
+        if log_bytes:
+            queue.enqueue(log_file, f"logs/{os.path.basename(log_file)}")
+    return per_hour.get('human', next(iter(per_hour.values()), 0))
+
+
+def bench_screens(directory, frames, interval, image_format, quality, queue, static_displays=0):
+    """Captures one simulated hour of screenshots; returns the bytes saved."""
+    screens_directory = os.path.join(directory, 'screenshots')
+    config = ConfigStore(os.path.join(directory, 'config.json'))
+    config.ensure_exists()
+    config.update({
+        'screenshot_interval': interval,
+        'screenshot_format': image_format,
+        'screenshot_quality': quality,
+        'screenshot_encode_workers': 1,  # One worker, so a no-op task marks when a frame is saved
+    })
+    captures = int(3600 / interval)
+    print(f"\nScreens: {captures} captures (1 simulated hour at {interval}s), {len(frames)} distinct frames, "
+          f"{static_displays} static displays, {image_format} quality {quality}")
+
+    original_datetime = screenshot_manager.datetime
+    clock = SimulatedClock(interval)
+    screenshot_manager.datetime = clock
+    try:
+        manager = ScreenshotManager(
+            screens_directory, ActiveUser(), config, upload_queue=queue, backend=ReplayBackend(frames, static_displays)
+        )
+        latencies = []
+        cpu_start = time.process_time()
+        for _ in range(captures):
+            before = time.perf_counter_ns()
+            manager.capture_screenshot()
+            latencies.append(time.perf_counter_ns() - before)
+            manager.get_encoder().submit(lambda: None).result()  # Wait for the frame, as the interval would
+            clock.advance()
+        manager.stop_capturing()
+        cpu = time.process_time() - cpu_start
+    finally:
+        screenshot_manager.datetime = original_datetime
+
+    saved = sum(
+        1 for _, _, files in os.walk(screens_directory) for name in files if not name.endswith('.txt')
+    )
+    size = directory_size(screens_directory)
+    print(f"{'p50 ms':>8} {'p99 ms':>8} {'saved':>6} {'CPU s/h':>8} {'MB/h':>8}")
+    print(f"{percentile(latencies, 0.5) / 1e6:>8.1f} {percentile(latencies, 0.99) / 1e6:>8.1f} {saved:>6} "
+          f"{cpu:>8.1f} {size / 1e6:>8.2f}")
+    return size
+
+
+def bench_upload(directory, queue, workers, produced_per_hour, timeout=300):
+    try:
+        server, endpoint = start_fake_s3(BUCKET)
+    except ImportError as e:
+        print(f"\nUploads: skipped ({e}); install moto[server] to run them")
+        return
+
+    metrics.registry.enabled = True  # Read the uploader's byte counters
+    uploader = DataUploader(
+        base_directory=os.path.join(directory, 'uploaded'),
+        cloud_upload=True,
+        bucket_name=BUCKET,
+        aws_access_key_id='testing',
+        aws_secret_access_key='testing',
+        max_workers=workers,
+        endpoint_url=endpoint,
+        bundle_target_size=32 * 1024 * 1024,
+        bundle_max_age=0  # The backlog is complete; do not wait for more files to bundle
+    )
+    pending = queue.pending_count()
+    print(f"\nUploads: {pending} queued files, {workers} workers")
+    stop_event = threading.Event()
+    drain = threading.Thread(target=uploader.drain_queue, args=(queue, stop_event))
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    drain.start()
+    try:
+        while queue.pending_count() and time.perf_counter() - start < timeout:
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - start
+    finally:
+        stop_event.set()
+        queue.item_added.set()  # Wake the drain if it is waiting for new items
+        drain.join()
+        uploader.shutdown()
+        server.stop()
+    cpu = time.process_time() - cpu_start
+
+    values = metrics.registry.snapshot()
+    raw = values.get('upload_raw_bytes_total', 0)
+    sent = values.get('upload_sent_bytes_total', 0)
+    ratio = sent / raw if raw else 1.0
+    print(f"{'seconds':>8} {'MB/s':>7} {'raw MB':>8} {'sent MB':>8} {'ratio':>6} {'CPU s':>6} {'left':>5} {'upload MB/h':>12}")
+    print(f"{elapsed:>8.2f} {sent / elapsed / 1e6:>7.2f} {raw / 1e6:>8.2f} {sent / 1e6:>8.2f} {ratio:>6.0%} "
+          f"{cpu:>6.1f} {queue.pending_count():>5} {produced_per_hour * ratio / 1e6:>12.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--seconds', type=float, default=10, help="wall time per input stream")
+    parser.add_argument('--streams', nargs='+', default=list(STREAMS), choices=list(STREAMS))
+    parser.add_argument('--aggregate', action='store_true', help="log one summary per window")
+    parser.add_argument('--log-format', default='text', choices=['text', 'binary'])
+    parser.add_argument('--frames', help="directory of recorded screenshots to replay")
+    parser.add_argument('--interval', type=float, default=60, help="simulated screenshot interval")
+    parser.add_argument('--format', default='png', choices=list(screenshot_manager.FORMATS))
+    parser.add_argument('--quality', type=int, default=80)
+    parser.add_argument('--displays', type=int, default=0, help="extra displays showing a static screen")
+    parser.add_argument('--workers', type=int, default=4, help="upload workers")
+    parser.add_argument('--skip-screens', action='store_true')
+    parser.add_argument('--skip-upload', action='store_true')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='agent-bench-')
+    queue = UploadQueue(os.path.join(directory, 'upload_queue.db'))
+    try:
+        log_per_hour = bench_input(directory, args.streams, args.seconds, args.aggregate, args.log_format, queue)
+        screens_per_hour = 0
+        if not args.skip_screens:
+            frames = recorded_frames(args.frames) if args.frames else generated_frames(24)
+            screens_per_hour = bench_screens(
+                directory, frames, args.interval, args.format, args.quality, queue, args.displays
+            )
+        if not args.skip_upload:
+            bench_upload(directory, queue, args.workers, log_per_hour + screens_per_hour)
+    finally:
+        queue.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
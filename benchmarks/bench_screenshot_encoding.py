@@ -0,0 +1,69 @@
+"""Bytes and CPU time per frame for each screenshot format, quality and scale.
+
+Uses a generated desktop-like frame, or a real screenshot passed on the command line.
+Run from the repository root:
+    python benchmarks/bench_screenshot_encoding.py [screenshot.png]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+
+from screenshot_manager import encode_screenshot, screenshot_extension
+
+FRAMES = 5
+SETTINGS = [
+    ('png', 80, 1.0),
+    ('png', 80, 0.5),
+    ('jpeg', 85, 1.0),
+    ('jpeg', 70, 1.0),
+    ('jpeg', 70, 0.5),
+    ('webp', 80, 1.0),
+    ('webp', 60, 1.0),
+    ('webp', 60, 0.5),
+]
+
+
+def synthetic_frame(width=2560, height=1440, seed=0):
+    """Draws windows, title bars and lines of 'text' roughly like a busy desktop."""
+    rng = random.Random(seed)
+    image = Image.new('RGB', (width, height), (32, 96, 160))
+    draw = ImageDraw.Draw(image)
+    for _ in range(6):
+        x, y = rng.randrange(0, width - 600), rng.randrange(0, height - 400)
+        w, h = rng.randrange(500, 1400), rng.randrange(300, 900)
+        draw.rectangle((x, y, x + w, y + h), fill=(250, 250, 250), outline=(90, 90, 90))
+        draw.rectangle((x, y, x + w, y + 28), fill=(220, 220, 230))
+        for line in range(y + 40, y + h - 20, 18):
+            words = x + 12
+            while words < x + w - 80:
+                length = rng.randrange(20, 90)
+                draw.rectangle((words, line, words + length, line + 9), fill=(40, 40, 40))
+                words += length + 8
+    return image
+
+
+def main():
+    frame = Image.open(sys.argv[1]).convert('RGB') if len(sys.argv) > 1 else synthetic_frame()
+    print(f"Frame {frame.width}x{frame.height}, {FRAMES} frames per setting")
+    print(f"{'format':>7} {'quality':>8} {'scale':>6} {'KB/frame':>10} {'CPU ms/frame':>13} {'blur CPU ms':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        for image_format, quality, scale in SETTINGS:
+            path = os.path.join(directory, f"frame{screenshot_extension(image_format)}")
+            results = []
+            for blur in (False, True):
+                start = time.process_time()
+                for _ in range(FRAMES):
+                    size = encode_screenshot(frame, path, image_format, quality, scale, blur)
+                results.append(((time.process_time() - start) / FRAMES * 1000, size))
+            (cpu_ms, size), (blur_ms, _) = results
+            print(f"{image_format:>7} {quality:>8} {scale:>6} {size / 1024:>10.1f} {cpu_ms:>13.1f} {blur_ms:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
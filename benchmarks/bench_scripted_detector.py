@@ -0,0 +1,53 @@
+"""Per-event cost of scripted activity detection for growing window sizes.
+
+Run from the repository root:
+    python benchmarks/bench_scripted_detector.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripted_detector import ScriptedActivityDetector, FastRepeatCheck, LowJitterCheck, PeriodicityCheck
+
+EVENTS = 200_000
+
+
+def legacy_detector(window_size):
+    """The list based detector ActivityTracker used before, for comparison."""
+    time_diffs = []
+
+    def update(diff):
+        time_diffs.append(diff)
+        if len(time_diffs) > window_size:
+            time_diffs.pop(0)
+        return all(d < 0.015 for d in time_diffs)
+    return update
+
+
+def run(update, gaps):
+    start = time.perf_counter()
+    for gap in gaps:
+        update(gap)
+    return (time.perf_counter() - start) / len(gaps) * 1e9
+
+
+def main():
+    rng = random.Random(0)
+    # Mostly machine-speed gaps so the legacy all() scan cannot stop early
+    gaps = [rng.uniform(0.001, 0.014) for _ in range(EVENTS)]
+
+    print(f"{'window':>8} {'legacy ns/event':>16} {'streaming ns/event':>19} {'all checks ns/event':>20}")
+    for window_size in (10, 100, 1000, 10000):
+        legacy = run(legacy_detector(window_size), gaps)
+        streaming = run(ScriptedActivityDetector(window_size).update, gaps)
+        all_checks = ScriptedActivityDetector(
+            window_size, checks=[FastRepeatCheck(), LowJitterCheck(), PeriodicityCheck()]
+        )
+        print(f"{window_size:>8} {legacy:>16.0f} {streaming:>19.0f} {run(all_checks.update, gaps):>20.0f}")
+
+
+if __name__ == "__main__":
+    main()
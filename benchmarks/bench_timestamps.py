@@ -0,0 +1,44 @@
+"""Per-event cost of timestamping a log record, before and after TimestampService.
+
+"before" is what ActivityTracker did per record: tz.gettz() on the zone name, then
+datetime.fromtimestamp().strftime(). "after" reads TimestampService.now() and formats
+with the cached tzinfo and minute prefix. Run from the repository root:
+    python benchmarks/bench_timestamps.py [events]
+"""
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dateutil import tz
+
+from timezone_manager import TimeZoneManager, TimestampService
+
+
+def before(tz_manager, events):
+    for _ in range(events):
+        local_tz = tz.gettz(tz_manager.current_timezone)
+        f"{datetime.fromtimestamp(time.time(), local_tz).strftime('%Y-%m-%d %H:%M:%S')} - Mouse Moved\n"
+
+
+def after(tz_manager, events):
+    clock = TimestampService(tz_manager)
+    for _ in range(events):
+        f"{clock.format(clock.now())} - Mouse Moved\n"
+
+
+def main():
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    tz_manager = TimeZoneManager()
+    print(f"Zone {tz_manager.current_timezone}, {events} events")
+    for name, run in (('before', before), ('after', after)):
+        start = time.perf_counter()
+        run(tz_manager, events)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>7} {elapsed / events * 1e9:>8.0f} ns/event")
+
+
+if __name__ == "__main__":
+    main()
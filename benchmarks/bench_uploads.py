@@ -0,0 +1,79 @@
+"""Serial vs concurrent uploads through DataUploader against a local S3 stand-in.
+
+Needs moto with its server extra (pip install "moto[server]"). Run from the repository root:
+    python benchmarks/bench_uploads.py [file count] [file size in KB]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import boto3
+from moto.server import ThreadedMotoServer
+
+from data_uploader import DataUploader
+
+BUCKET = 'benchmark-bucket'
+PORT = 5123
+
+
+def make_files(directory, count, size):
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"screenshot_{i:05d}.png")
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+        paths.append(path)
+    return paths
+
+
+def run(endpoint, source_dir, count, size, workers):
+    work_dir = tempfile.mkdtemp(dir=source_dir)
+    paths = make_files(work_dir, count, size)
+    uploader = DataUploader(
+        base_directory=work_dir,
+        cloud_upload=True,
+        bucket_name=BUCKET,
+        aws_access_key_id='testing',
+        aws_secret_access_key='testing',
+        max_workers=workers,
+        endpoint_url=endpoint
+    )
+    start = time.perf_counter()
+    results = uploader.upload_multiple_files(paths)
+    elapsed = time.perf_counter() - start
+    uploader.shutdown()
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return elapsed, sum(results)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    size = int(sys.argv[2]) * 1024 if len(sys.argv) > 2 else 256 * 1024
+
+    server = ThreadedMotoServer(port=PORT, verbose=False)
+    server.start()
+    endpoint = f"http://127.0.0.1:{PORT}"
+    try:
+        boto3.client(
+            's3', endpoint_url=endpoint, region_name='us-east-1',
+            aws_access_key_id='testing', aws_secret_access_key='testing'
+        ).create_bucket(Bucket=BUCKET)
+
+        source_dir = tempfile.mkdtemp()
+        print(f"{count} files of {size // 1024} KB")
+        print(f"{'workers':>8} {'seconds':>9} {'files/s':>9} {'MB/s':>8} {'uploaded':>9}")
+        for workers in (1, 2, 4, 8, 16):
+            elapsed, uploaded = run(endpoint, source_dir, count, size, workers)
+            print(f"{workers:>8} {elapsed:>9.2f} {count / elapsed:>9.1f} "
+                  f"{count * size / elapsed / 1e6:>8.1f} {uploaded:>9}")
+        shutil.rmtree(source_dir, ignore_errors=True)
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Synthetic input, screen replay and fake S3 helpers shared by the agent benchmarks.
+
+Nothing here needs a desktop: input events are produced by calling ActivityTracker's
+listener callbacks directly, frames come from a replay capture backend, and uploads go
+to moto's local S3 server.
+"""
+import glob
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from capture_backends import CaptureBackend, Display
+
+
+class Key:
+    """Stands in for a pynput key; only `char` is read by the tracker."""
+
+    def __init__(self, char):
+        self.char = char
+
+
+def human_stream(seed=0):
+    """Yields (gap seconds, kind) like a person: typing runs, mouse strokes, clicks and pauses."""
+    rng = random.Random(seed)
+    while True:
+        action = rng.random()
+        if action < 0.4:
+            for _ in range(rng.randint(5, 40)):
+                yield max(0.03, rng.gauss(0.14, 0.05)), 'key'
+        elif action < 0.8:
+            for _ in range(rng.randint(20, 120)):
+                yield rng.uniform(0.008, 0.02), 'move'
+            yield rng.uniform(0.1, 0.4), 'click'
+        else:
+            for _ in range(rng.randint(3, 15)):
+                yield rng.uniform(0.02, 0.06), 'scroll'
+        yield rng.expovariate(1 / 1.5), 'move'  # Pause before the next action
+
+
+def burst_stream(seed=0, rate=1000):
+    """Yields high-rate mouse bursts (e.g. a gaming mouse at 1 kHz) separated by short pauses."""
+    rng = random.Random(seed)
+    while True:
+        for _ in range(int(rate * rng.uniform(0.2, 0.6))):
+            yield 1 / rate, 'move'
+        yield rng.uniform(0.2, 1.0), 'click'
+
+
+def scripted_stream(rate, kind='key'):
+    """Yields perfectly regular events at `rate` per second, like an auto-typer or mouse jiggler."""
+    while True:
+        yield 1 / rate, kind
+
+
+STREAMS = {
+    'human': lambda: human_stream(),
+    'burst': lambda: burst_stream(),
+    'scripted-1k': lambda: scripted_stream(1000),
+    'scripted-5k': lambda: scripted_stream(5000),
+    'scripted-10k': lambda: scripted_stream(10000),
+}
+
+
+def drive(tracker, stream, seconds):
+    """Calls the tracker's callbacks on the stream's schedule for `seconds` of wall time.
+
+    Sleeps only when more than a millisecond ahead of schedule, so kHz streams run
+    back to back instead of spinning, and harness overhead stays out of the CPU figures.
+    Returns (events, wall seconds, callback latencies in ns).
+    """
+    key = Key('a')
+    callbacks = {
+        'move': lambda: tracker.on_mouse_move(0, 0),
+        'click': lambda: tracker.on_click(0, 0, None, True),
+        'scroll': lambda: tracker.on_scroll(0, 0, 0, 1),
+        'key': lambda: tracker.on_key_press(key),
+    }
+    latencies = []
+    clock = time.perf_counter_ns
+    start = time.perf_counter()
+    target = start
+    end = start + seconds
+    for gap, kind in stream:
+        target += gap
+        if target >= end:
+            break
+        ahead = target - time.perf_counter()
+        if ahead > 0.001:
+            time.sleep(ahead)
+        callback = callbacks[kind]
+        before = clock()
+        callback()
+        latencies.append(clock() - before)
+    remaining = end - time.perf_counter()
+    if remaining > 0:
+        time.sleep(remaining)
+    return len(latencies), time.perf_counter() - start, latencies
+
+
+def percentile(values, q):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ActiveUser:
+    """Stands in for ActivityTracker in ScreenshotManager: the user is always active."""
+
+    @property
+    def last_activity_time(self):
+        return time.time()
+
+    def notify_on_activity(self, callback):
+        pass
+
+
+def generated_frames(count, seed=0, idle_fraction=0.5, width=1920, height=1080):
+    """Desktop-like frames where about `idle_fraction` repeat the previous one and the rest show typing or scrolling."""
+    from PIL import ImageDraw
+    from bench_screenshot_encoding import synthetic_frame
+
+    rng = random.Random(seed)
+    frame = synthetic_frame(width, height, seed=seed)
+    frames = []
+    for _ in range(count):
+        if rng.random() >= idle_fraction:
+            frame = frame.copy()
+            if rng.random() < 0.7:
+                # A few new lines of text in one window
+                draw = ImageDraw.Draw(frame)
+                x, y = rng.randrange(0, frame.width - 800), rng.randrange(0, frame.height - 200)
+                for line in range(y, y + rng.randrange(18, 180), 18):
+                    draw.rectangle((x, line, x + rng.randrange(200, 780), line + 9), fill=(40, 40, 40))
+            else:
+                # Scroll: shift a region up
+                box = (0, 100, frame.width, frame.height)
+                frame.paste(frame.crop(box), (0, 100 - rng.randrange(50, 400)))
+        frames.append(frame)
+    return frames
+
+
+def recorded_frames(directory):
+    """Frames from a directory of screenshots, in name order."""
+    from PIL import Image
+
+    frames = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.png')) + glob.glob(os.path.join(directory, '*.jpg'))):
+        with Image.open(path) as image:
+            frames.append(image.convert('RGB'))
+    return frames
+
+
+class ReplayBackend(CaptureBackend):
+    """Capture backend replaying frames on the first display; `static_displays` more displays never change."""
+
+    name = 'replay'
+
+    def __init__(self, frames, static_displays=0):
+        super().__init__()
+        self.frames = frames
+        self.index = 0
+        width, height = frames[0].size
+        self.replay_displays = [Display(str(number + 1), number * width, 0, width, height)
+                                for number in range(1 + static_displays)]
+
+    def enumerate_displays(self):
+        return self.replay_displays
+
+    def grab(self, bbox):
+        if bbox[0] >= self.replay_displays[0].bbox[2]:
+            return self.frames[0]  # A static display
+        frame = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        return frame
+
+
+class SimulatedClock:
+    """Replaces datetime in screenshot_manager so replayed captures are named one interval apart."""
+
+    def __init__(self, interval, start=None):
+        self.interval = interval
+        self.current = start or datetime.now().replace(minute=0, second=0, microsecond=0)
+
+    def now(self, tz=None):
+        return self.current
+
+    def advance(self):
+        self.current += timedelta(seconds=self.interval)
+
+
+def start_fake_s3(bucket, port=5123):
+    """Starts moto's S3 server on localhost with `bucket` created; returns (server, endpoint url)."""
+    import boto3
+    from moto.server import ThreadedMotoServer
+
+    server = ThreadedMotoServer(port=port, verbose=False)
+    server.start()
+    endpoint = f"http://127.0.0.1:{port}"
+    boto3.client(
+        's3', endpoint_url=endpoint, region_name='us-east-1',
+        aws_access_key_id='testing', aws_secret_access_key='testing'
+    ).create_bucket(Bucket=bucket)
+    return server, endpoint
+
+
+def directory_size(directory):
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
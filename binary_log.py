@@ -0,0 +1,185 @@
+"""Compact binary format for the activity log.
+
+A file starts with an 8 byte header followed by any number of chunks. Each chunk is
+a small header with its record count and the records themselves, which are fixed
+width so a file can be memory-mapped and read as columns:
+
+    file header   <4sBBH   magic b'ATLG', version, record size, reserved
+    chunk header  <4sI     magic b'CHNK', record count
+    record        <qBBHI   epoch ms, event type, flags, count, payload
+
+`count` is 1 for single events and the number of folded events for aggregated
+summaries; a summary of more than 65535 events is split into several records with
+the same timestamp and window. `payload` holds the key code for key presses, the
+check index for scripted activity and the window length in ms for aggregated summaries.
+
+Two mappings lose information, and a warning is printed the first time each happens:
+key presses reporting several characters (e.g. from an input method) keep only the
+first one, and activity strings the format does not know are stored as OTHER.
+"""
+import re
+import struct
+import time
+from datetime import datetime
+
+MAGIC = b'ATLG'
+CHUNK_MAGIC = b'CHNK'
+VERSION = 1
+
+FILE_HEADER = struct.Struct('<4sBBH')
+CHUNK_HEADER = struct.Struct('<4sI')
+RECORD = struct.Struct('<qBBHI')
+
+# Event types
+OTHER = 0
+MOUSE_MOVE = 1
+MOUSE_CLICK = 2
+MOUSE_SCROLL = 3
+KEY_PRESS = 4
+SPECIAL_KEY = 5
+SCRIPTED_START = 6
+SCRIPTED_STOP = 7
+
+EVENT_NAMES = {
+    OTHER: "Unknown activity",
+    MOUSE_MOVE: "Mouse Moved",
+    MOUSE_CLICK: "Mouse Clicked",
+    MOUSE_SCROLL: "Mouse Scrolled",
+    KEY_PRESS: "Key Pressed",
+    SPECIAL_KEY: "Special Key Pressed",
+    SCRIPTED_START: "Scripted activity detected!",
+    SCRIPTED_STOP: "Scripted activity stopped",
+}
+
+# Flags
+FLAG_AGGREGATE = 0x01  # Summary of `count` events over a window of `payload` ms
+FLAG_VIRTUAL_KEY = 0x02  # Special key given by its virtual key code, e.g. <65437>
+FLAG_TRUNCATED = 0x04  # Key press that reported several characters; only the first is kept
+
+MAX_COUNT = 0xFFFF  # Largest count one record holds
+
+NO_CHAR = 0xFFFFFFFF  # Key press without a character (pynput reports None)
+
+# pynput special key names; only ever append so existing files keep decoding
+SPECIAL_KEYS = [
+    'alt', 'alt_l', 'alt_r', 'alt_gr', 'backspace', 'caps_lock', 'cmd', 'cmd_l', 'cmd_r',
+    'ctrl', 'ctrl_l', 'ctrl_r', 'delete', 'down', 'end', 'enter', 'esc',
+    'f1', 'f2', 'f3', 'f4', 'f5', 'f6', 'f7', 'f8', 'f9', 'f10',
+    'f11', 'f12', 'f13', 'f14', 'f15', 'f16', 'f17', 'f18', 'f19', 'f20',
+    'home', 'left', 'page_down', 'page_up', 'right', 'shift', 'shift_l', 'shift_r',
+    'space', 'tab', 'up', 'media_play_pause', 'media_volume_mute', 'media_volume_down',
+    'media_volume_up', 'media_previous', 'media_next', 'insert', 'menu', 'num_lock',
+    'pause', 'print_screen', 'scroll_lock',
+]
+SPECIAL_KEY_CODES = {name: code for code, name in enumerate(SPECIAL_KEYS)}
+
+# Scripted activity checks, in the order used for the payload
+SCRIPTED_CHECKS = ['fast_repeat', 'low_jitter', 'periodicity']
+
+EVENT_TYPES = {name: event for event, name in EVENT_NAMES.items()}
+
+AGGREGATE_PATTERN = re.compile(r'^(.+) x(\d+), (\d\d):(\d\d):(\d\d)–(\d\d):(\d\d):(\d\d)$')
+SCRIPTED_PATTERN = re.compile(r'^Scripted activity detected! \((\w+)\)$')
+
+warned = set()  # Lossy mappings already reported
+
+
+def warn_once(kind, message):
+    if kind not in warned:
+        warned.add(kind)
+        print(f"Binary log: {message}")
+
+
+def parse_activity(activity_type):
+    """Maps an activity string as written to the text log to (event, flags, count, payload)."""
+    if activity_type == "Mouse Moved":
+        return MOUSE_MOVE, 0, 1, 0
+    if activity_type.startswith("Key Pressed: "):
+        char = activity_type[len("Key Pressed: "):]
+        if char == 'None':
+            return KEY_PRESS, 0, 1, NO_CHAR
+        if len(char) == 1:
+            return KEY_PRESS, 0, 1, ord(char)
+        if char:
+            warn_once('truncated', f"key presses with several characters keep only the first ({char!r})")
+            return KEY_PRESS, FLAG_TRUNCATED, 1, ord(char[0])
+        return OTHER, 0, 1, 0
+    if activity_type.startswith("Special Key Pressed: "):
+        key = activity_type[len("Special Key Pressed: "):]
+        if key.startswith('Key.') and key[4:] in SPECIAL_KEY_CODES:
+            return SPECIAL_KEY, 0, 1, SPECIAL_KEY_CODES[key[4:]]
+        if key.startswith('<') and key.endswith('>') and key[1:-1].isdigit():
+            return SPECIAL_KEY, FLAG_VIRTUAL_KEY, 1, int(key[1:-1])
+        return OTHER, 0, 1, 0
+    if activity_type in EVENT_TYPES:
+        return EVENT_TYPES[activity_type], 0, 1, 0
+
+    match = SCRIPTED_PATTERN.match(activity_type)
+    if match:
+        check = match.group(1)
+        return SCRIPTED_START, 0, 1, SCRIPTED_CHECKS.index(check) if check in SCRIPTED_CHECKS else NO_CHAR
+
+    match = AGGREGATE_PATTERN.match(activity_type)
+    if match and match.group(1) in EVENT_TYPES:
+        h1, m1, s1, h2, m2, s2 = (int(g) for g in match.groups()[2:])
+        span = ((h2 * 3600 + m2 * 60 + s2) - (h1 * 3600 + m1 * 60 + s1)) % 86400
+        return EVENT_TYPES[match.group(1)], FLAG_AGGREGATE, int(match.group(2)), span * 1000
+    warn_once('other', f"activity not known to the binary format is stored as OTHER ({activity_type!r})")
+    return OTHER, 0, 1, 0
+
+
+def format_activity(ts_ms, event, flags, count, payload, format_clock=None):
+    """Turns a decoded record back into the activity string used by the text log."""
+    if flags & FLAG_AGGREGATE:
+        format_clock = format_clock or (lambda ts: time.strftime('%H:%M:%S', time.localtime(ts)))
+        start = ts_ms / 1000
+        return f"{EVENT_NAMES[event]} x{count}, {format_clock(start)}–{format_clock(start + payload / 1000)}"
+    if event == KEY_PRESS:
+        return f"Key Pressed: {'None' if payload == NO_CHAR else chr(payload)}"
+    if event == SPECIAL_KEY:
+        if flags & FLAG_VIRTUAL_KEY:
+            return f"Special Key Pressed: <{payload}>"
+        return f"Special Key Pressed: Key.{SPECIAL_KEYS[payload] if payload < len(SPECIAL_KEYS) else 'unknown'}"
+    if event == SCRIPTED_START and payload < len(SCRIPTED_CHECKS):
+        return f"Scripted activity detected! ({SCRIPTED_CHECKS[payload]})"
+    return EVENT_NAMES.get(event, EVENT_NAMES[OTHER])
+
+
+def file_header():
+    """Header written at the start of every binary log file."""
+    return FILE_HEADER.pack(MAGIC, VERSION, RECORD.size, 0)
+
+
+def encode_chunk(records):
+    """Encodes (timestamp, activity_type) records as one chunk."""
+    parsed = []
+    for ts, activity_type in records:
+        event, flags, count, payload = parse_activity(activity_type)
+        ts_ms = int(ts * 1000)
+        while count > MAX_COUNT:
+            # Oversized summaries are split rather than clamped, so readers summing counts get the total
+            parsed.append((ts_ms, event, flags, MAX_COUNT, payload))
+            count -= MAX_COUNT
+        parsed.append((ts_ms, event, flags, count, payload))
+    buffer = bytearray(CHUNK_HEADER.size + RECORD.size * len(parsed))
+    CHUNK_HEADER.pack_into(buffer, 0, CHUNK_MAGIC, len(parsed))
+    offset = CHUNK_HEADER.size
+    for record in parsed:
+        RECORD.pack_into(buffer, offset, *record)
+        offset += RECORD.size
+    return bytes(buffer)
+
+
+class BinaryEncoder:
+    """LogWriter encoder producing the binary format."""
+
+    def header(self):
+        return file_header()
+
+    def encode(self, batch):
+        return encode_chunk(batch)
+
+
+def format_timestamp(ts_ms):
+    """Formats a record timestamp the way the text log does."""
+    return datetime.fromtimestamp(ts_ms / 1000).strftime('%Y-%m-%d %H:%M:%S')
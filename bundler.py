@@ -0,0 +1,183 @@
+"""Packs many small files into one compressed tar bundle with an embedded manifest.
+
+Bundles are tar archives compressed with gzip or, when the zstandard package is
+installed, zstd. The first member is manifest.json listing every file with its
+size and SHA-256, so a bundle can be verified after download.
+
+Usage:
+    python bundler.py list bundle.tar.gz
+    python bundler.py verify bundle.tar.gz
+    python bundler.py extract bundle.tar.gz output_directory
+"""
+import hashlib
+import io
+import json
+import os
+import sys
+import tarfile
+import time
+
+MANIFEST_NAME = 'manifest.json'
+
+# File extension for each codec
+EXTENSIONS = {
+    'gzip': '.tar.gz',
+    'zstd': '.tar.zst',
+}
+
+
+def available_codec(codec):
+    """Returns the codec to use, falling back to gzip when zstandard is not installed."""
+    if codec == 'zstd':
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            print("zstandard is not installed, bundling with gzip instead")
+            return 'gzip'
+    return codec if codec in EXTENSIONS else 'gzip'
+
+
+def sha256_of(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def open_compressed(path, mode, codec, level=None):
+    """Opens the compressed stream underneath the tar archive."""
+    if codec == 'zstd':
+        import zstandard
+        raw = open(path, mode + 'b')
+        if mode == 'w':
+            return zstandard.ZstdCompressor(level=level or 3).stream_writer(raw, closefd=True)
+        return zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+    import gzip
+    return gzip.open(path, mode + 'b', compresslevel=level or 6) if mode == 'w' else gzip.open(path, 'rb')
+
+
+def detect_codec(path):
+    """Guesses the codec of a bundle from its magic bytes."""
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    return 'zstd' if magic == b'\x28\xb5\x2f\xfd' else 'gzip'
+
+
+def create_bundle(entries, bundle_path, codec='gzip', level=None):
+    """Writes (path, archive name) entries into a bundle; returns the manifest."""
+    codec = available_codec(codec)
+    files = []
+    for path, name in entries:
+        stat = os.stat(path)
+        files.append({'name': name, 'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': sha256_of(path)})
+    manifest = {'created': time.time(), 'codec': codec, 'files': files}
+
+    with open_compressed(bundle_path, 'w', codec, level) as stream:
+        # Stream mode, so the archive never needs to seek in the compressed output
+        with tarfile.open(fileobj=stream, mode='w|') as tar:
+            data = json.dumps(manifest, indent=1).encode('utf-8')
+            info = tarfile.TarInfo(MANIFEST_NAME)
+            info.size = len(data)
+            info.mtime = int(manifest['created'])
+            tar.addfile(info, io.BytesIO(data))
+            for path, name in entries:
+                tar.add(path, arcname=name, recursive=False)
+    return manifest
+
+
+def iter_members(bundle_path):
+    """Yields (TarInfo, file object) for every member of a bundle, in archive order."""
+    with open_compressed(bundle_path, 'r', detect_codec(bundle_path)) as stream:
+        with tarfile.open(fileobj=stream, mode='r|') as tar:
+            for member in tar:
+                yield member, tar.extractfile(member) if member.isfile() else None
+
+
+def read_manifest(bundle_path):
+    for member, f in iter_members(bundle_path):
+        if member.name == MANIFEST_NAME:
+            return json.load(f)
+        break
+    raise ValueError(f"{bundle_path} has no manifest")
+
+
+def verify_bundle(bundle_path, output_directory=None):
+    """Checks every file of a bundle against the manifest, extracting them if `output_directory` is given.
+
+    Returns a list of problems; an empty list means the bundle is intact.
+    """
+    problems = []
+    manifest = None
+    seen = set()
+    for member, f in iter_members(bundle_path):
+        if manifest is None:
+            if member.name != MANIFEST_NAME:
+                return [f"{bundle_path} has no manifest"]
+            manifest = {entry['name']: entry for entry in json.load(f)['files']}
+            continue
+        entry = manifest.get(member.name)
+        if entry is None:
+            problems.append(f"{member.name}: not listed in the manifest")
+            continue
+        seen.add(member.name)
+
+        digest = hashlib.sha256()
+        out = None
+        if output_directory is not None:
+            target = os.path.realpath(os.path.join(output_directory, member.name))
+            if not target.startswith(os.path.realpath(output_directory) + os.sep):
+                problems.append(f"{member.name}: refusing to extract outside {output_directory}")
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            out = open(target, 'wb')
+        size = 0
+        try:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+                size += len(chunk)
+                if out is not None:
+                    out.write(chunk)
+        finally:
+            if out is not None:
+                out.close()
+        if size != entry['size']:
+            problems.append(f"{member.name}: size {size} does not match the manifest ({entry['size']})")
+        elif digest.hexdigest() != entry['sha256']:
+            problems.append(f"{member.name}: checksum does not match the manifest")
+
+    if manifest is None:
+        return [f"{bundle_path} is empty"]
+    for name in manifest:
+        if name not in seen:
+            problems.append(f"{name}: listed in the manifest but missing from the bundle")
+    return problems
+
+
+def extract_bundle(bundle_path, output_directory):
+    """Extracts a bundle, verifying every file; returns the list of problems found."""
+    os.makedirs(output_directory, exist_ok=True)
+    return verify_bundle(bundle_path, output_directory)
+
+
+def main(argv):
+    if len(argv) == 2 and argv[0] == 'list':
+        manifest = read_manifest(argv[1])
+        for entry in manifest['files']:
+            print(f"{entry['size']:>12} {entry['name']}")
+        return 0
+    if len(argv) == 2 and argv[0] == 'verify':
+        problems = verify_bundle(argv[1])
+    elif len(argv) == 3 and argv[0] == 'extract':
+        problems = extract_bundle(argv[1], argv[2])
+    else:
+        print(__doc__)
+        return 1
+    for problem in problems:
+        print(problem)
+    print("Bundle is intact." if not problems else f"{len(problems)} problem(s) found.")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,224 @@
+import sys
+import threading
+import time
+
+# How often the display layout is enumerated again, to pick up monitors being (un)plugged
+DISPLAY_REFRESH_INTERVAL = 30
+
+
+class Display:
+    """A monitor and its position on the virtual desktop, in physical pixels."""
+
+    def __init__(self, name, left, top, width, height):
+        self.name = name
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+
+    @property
+    def bbox(self):
+        return (self.left, self.top, self.left + self.width, self.top + self.height)
+
+    def __repr__(self):
+        return f"Display({self.name!r}, {self.width}x{self.height} at {self.left},{self.top})"
+
+
+def intersect(bbox, region):
+    """Returns the part of `bbox` inside `region`, or None if they do not overlap."""
+    left, top = max(bbox[0], region[0]), max(bbox[1], region[1])
+    right, bottom = min(bbox[2], region[2]), min(bbox[3], region[3])
+    if left >= right or top >= bottom:
+        return None
+    return (left, top, right, bottom)
+
+
+def windows_displays():
+    """Enumerates the monitors with EnumDisplayMonitors, in physical pixels."""
+    import ctypes
+    from ctypes import wintypes
+
+    user32 = ctypes.windll.user32
+    try:
+        # Per-monitor DPI aware, matching the coordinates ImageGrab uses on scaled 4K displays
+        previous = user32.SetThreadDpiAwarenessContext(ctypes.c_void_p(-4))
+    except AttributeError:
+        previous = None  # Before Windows 10 1607
+    rects = []
+    callback_type = ctypes.WINFUNCTYPE(
+        ctypes.c_int, wintypes.HMONITOR, wintypes.HDC, ctypes.POINTER(wintypes.RECT), wintypes.LPARAM
+    )
+
+    def collect(monitor, dc, rect, data):
+        rects.append((rect.contents.left, rect.contents.top, rect.contents.right, rect.contents.bottom))
+        return 1
+
+    try:
+        user32.EnumDisplayMonitors(None, None, callback_type(collect), 0)
+    finally:
+        if previous:
+            user32.SetThreadDpiAwarenessContext(previous)
+    return [Display(str(index + 1), left, top, right - left, bottom - top)
+            for index, (left, top, right, bottom) in enumerate(rects)]
+
+
+def foreground_window_bbox():
+    """Returns the bounding box of the focused window on Windows, or None elsewhere or without one."""
+    if sys.platform != 'win32':
+        return None
+    import ctypes
+    from ctypes import wintypes
+
+    user32 = ctypes.windll.user32
+    window = user32.GetForegroundWindow()
+    rect = wintypes.RECT()
+    if not window or not user32.GetWindowRect(window, ctypes.byref(rect)):
+        return None
+    return (rect.left, rect.top, rect.right, rect.bottom)
+
+
+class CaptureBackend:
+    """Base class for capture backends: enumerates displays and grabs a box of the virtual desktop."""
+
+    name = None
+
+    def __init__(self):
+        self.cached_displays = None
+        self.displays_checked = 0.0
+
+    def displays(self):
+        """Returns the current displays, enumerating them again every DISPLAY_REFRESH_INTERVAL seconds."""
+        now = time.monotonic()
+        if self.cached_displays is None or now - self.displays_checked >= DISPLAY_REFRESH_INTERVAL:
+            self.cached_displays = self.enumerate_displays()
+            self.displays_checked = now
+        return self.cached_displays
+
+    def enumerate_displays(self):
+        raise NotImplementedError
+
+    def grab(self, bbox):
+        """Returns a PIL image of `bbox` on the virtual desktop."""
+        raise NotImplementedError
+
+    def finish_run(self):
+        """Called after the displays of one capture run have been grabbed."""
+        pass
+
+    def close(self):
+        pass
+
+
+class PillowBackend(CaptureBackend):
+    """Captures with PIL.ImageGrab.
+
+    Monitors are enumerated on Windows, where ImageGrab can only grab the whole virtual
+    desktop; it is grabbed once per capture run and each display is cropped from it.
+    Elsewhere the screen is treated as one display, whose size is taken from the full
+    screen grabs of the capture runs; the screen is only grabbed just to measure it
+    before the first capture, or when every capture is cropped to a region.
+    """
+
+    name = 'pillow'
+
+    def __init__(self):
+        super().__init__()
+        self.desktop = None  # (left, top, image) of the virtual desktop grabbed in this run
+        self.screen_size = None  # (width, height) of the last full screen grab, outside Windows
+        self.size_seen = False  # Whether a full grab measured the screen since the last enumeration
+
+    def enumerate_displays(self):
+        if sys.platform == 'win32':
+            displays = windows_displays()
+            if displays:
+                return displays
+        if self.screen_size is None or not self.size_seen:
+            from PIL import ImageGrab
+            self.screen_size = ImageGrab.grab().size
+        self.size_seen = False
+        width, height = self.screen_size
+        return [Display('1', 0, 0, width, height)]
+
+    def grab(self, bbox):
+        from PIL import ImageGrab
+        if sys.platform != 'win32':
+            if self.screen_size is not None and bbox != (0, 0) + self.screen_size:
+                return ImageGrab.grab(bbox=bbox)
+            image = ImageGrab.grab()  # The whole screen, so it also tells whether its size changed
+            self.screen_size = image.size
+            self.size_seen = True
+            return image
+        if self.desktop is None:
+            displays = self.displays()
+            left = min(display.left for display in displays)
+            top = min(display.top for display in displays)
+            self.desktop = (left, top, ImageGrab.grab(all_screens=True))
+        left, top, image = self.desktop
+        return image.crop((bbox[0] - left, bbox[1] - top, bbox[2] - left, bbox[3] - top))
+
+    def finish_run(self):
+        self.desktop = None  # Do not hold a full desktop bitmap between runs
+
+
+class MssBackend(CaptureBackend):
+    """Captures with mss (pip install mss), which enumerates monitors on Windows, macOS and X11.
+
+    It grabs each monitor directly instead of the whole virtual desktop, and runs
+    headless on Linux under Xvfb. mss handles are per thread, so one is kept per thread.
+    """
+
+    name = 'mss'
+
+    def __init__(self):
+        super().__init__()
+        import mss  # Raises ImportError when it is not installed
+        self.mss = mss
+        self.local = threading.local()
+        self.handles = []
+        self.handles_lock = threading.Lock()
+
+    def handle(self):
+        handle = getattr(self.local, 'handle', None)
+        if handle is None:
+            handle = self.local.handle = self.mss.mss()
+            with self.handles_lock:
+                self.handles.append(handle)
+        return handle
+
+    def enumerate_displays(self):
+        # monitors[0] is the bounding box of all monitors; the rest are the monitors themselves
+        return [Display(str(index), monitor['left'], monitor['top'], monitor['width'], monitor['height'])
+                for index, monitor in enumerate(self.handle().monitors) if index > 0]
+
+    def grab(self, bbox):
+        from PIL import Image
+        left, top, right, bottom = bbox
+        shot = self.handle().grab({'left': left, 'top': top, 'width': right - left, 'height': bottom - top})
+        return Image.frombytes('RGB', shot.size, shot.bgra, 'raw', 'BGRX')
+
+    def close(self):
+        with self.handles_lock:
+            handles, self.handles = self.handles, []
+        for handle in handles:
+            try:
+                handle.close()
+            except Exception:
+                pass  # Its thread may already be gone
+
+
+BACKENDS = {
+    'pillow': PillowBackend,
+    'mss': MssBackend,
+}
+
+
+def create_backend(name='auto'):
+    """Returns the named backend; "auto" prefers mss when installed and falls back to Pillow."""
+    if name in ('auto', 'mss'):
+        try:
+            return MssBackend()
+        except ImportError:
+            if name == 'mss':
+                print("The mss capture backend is not installed (pip install mss), using Pillow.")
+            return PillowBackend()
+    return BACKENDS.get(name, PillowBackend)()
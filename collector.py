@@ -0,0 +1,444 @@
+"""Local collector that agents upload to instead of writing to the object store themselves.
+
+Agents PUT files over keep-alive HTTP/1.1 connections, compressed with gzip or zstd
+and tagged with the SHA-256 of their content. The collector verifies and deduplicates
+them by that hash, spools them to disk, and re-batches them into large bundles (see
+bundler.py) that are written to the object store once they reach the target size or
+age. The store is S3, or a directory standing in for it when testing on one machine.
+
+Usage:
+    python collector.py --store ./collected --port 8765
+    python collector.py --store s3://bucket-name --batch-size 67108864
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime
+from urllib.parse import unquote
+import bundler
+
+# Agent ids become directory names in the bundles
+AGENT_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+MAX_HEADER_LINES = 100
+READ_CHUNK_SIZE = 256 * 1024
+
+REASONS = {
+    200: 'OK',
+    201: 'Created',
+    400: 'Bad Request',
+    401: 'Unauthorized',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    411: 'Length Required',
+    413: 'Payload Too Large',
+    415: 'Unsupported Media Type',
+    500: 'Internal Server Error',
+}
+
+
+class RequestError(Exception):
+    """Rejects a request with an HTTP status; the connection is closed if the body was not read."""
+
+    def __init__(self, status, message, body_read=True):
+        super().__init__(message)
+        self.status = status
+        self.body_read = body_read
+
+
+class FileStore:
+    """Object store backed by a directory; a stand-in for S3 when testing on localhost."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def put(self, key, path):
+        target = os.path.join(self.directory, *key.split('/'))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temp_file = f"{target}.tmp"
+        shutil.copyfile(path, temp_file)
+        os.replace(temp_file, target)  # Readers never see a partial object
+
+    def __repr__(self):
+        return f"FileStore({self.directory!r})"
+
+
+class S3Store:
+    """Object store in an S3 bucket; credentials come from the usual boto3 sources, e.g. AWS_* variables."""
+
+    def __init__(self, bucket_name, endpoint_url=None):
+        import boto3
+        self.bucket_name = bucket_name
+        self.s3_client = boto3.client('s3', endpoint_url=endpoint_url)
+
+    def put(self, key, path):
+        self.s3_client.upload_file(path, self.bucket_name, key,
+                                   ExtraArgs={'ContentType': 'application/octet-stream', 'ACL': 'private'})
+
+    def __repr__(self):
+        return f"S3Store({self.bucket_name!r})"
+
+
+def open_store(location, endpoint_url=None):
+    """Returns the store for an s3://bucket location or a local directory."""
+    if location.startswith('s3://'):
+        return S3Store(location[len('s3://'):].strip('/'), endpoint_url)
+    return FileStore(location)
+
+
+def decompressor(encoding):
+    """Returns a decompressing object for a Content-Encoding, or None for identity."""
+    if encoding in ('', 'identity'):
+        return None
+    if encoding == 'gzip':
+        return zlib.decompressobj(31)
+    if encoding == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise RequestError(415, "zstd uploads need the zstandard package on the collector", body_read=False)
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise RequestError(415, f"Unsupported Content-Encoding: {encoding}", body_read=False)
+
+
+class Collector:
+    """Receives files from agents and writes them to the object store in large batches.
+
+    Received files are spooled under `spool_directory` and recorded in SQLite before
+    the agent is answered, so an acknowledged file survives a restart of the collector.
+    Hashes of batched files are kept for `dedupe_window` seconds, so retries and files
+    sent by several agents are stored once.
+    """
+
+    def __init__(self, store, spool_directory, batch_target_size=64 * 1024 * 1024, batch_max_age=300,
+                 batch_codec='gzip', max_object_size=256 * 1024 * 1024, dedupe_window=7 * 24 * 3600,
+                 token=None, idle_timeout=120):
+        self.store = store
+        self.spool_directory = spool_directory
+        self.incoming_directory = os.path.join(spool_directory, 'incoming')
+        self.batch_target_size = batch_target_size
+        self.batch_max_age = batch_max_age
+        self.batch_codec = bundler.available_codec(batch_codec)
+        self.max_object_size = max_object_size
+        self.dedupe_window = dedupe_window
+        self.token = token
+        self.idle_timeout = idle_timeout
+        self.server = None
+        self.flushing = None  # Task writing the current batch, if any
+        self.stats = {'received': 0, 'duplicates': 0, 'rejected': 0, 'batches': 0, 'bytes_received': 0}
+
+        os.makedirs(self.incoming_directory, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(spool_directory, 'collector.db'), check_same_thread=False,
+                                          isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS objects (
+                sha256 TEXT PRIMARY KEY,
+                agent TEXT NOT NULL,
+                destination TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                received_at REAL NOT NULL,
+                batch TEXT
+            )
+        """)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS objects_batch ON objects (batch, received_at)")
+        self.remove_orphans()
+
+    def spool_path(self, sha256):
+        return os.path.join(self.incoming_directory, sha256)
+
+    def remove_orphans(self):
+        """Deletes spooled files whose upload was interrupted before it was recorded."""
+        pending = {row[0] for row in self.connection.execute("SELECT sha256 FROM objects WHERE batch IS NULL")}
+        for name in os.listdir(self.incoming_directory):
+            if name not in pending:
+                os.remove(os.path.join(self.incoming_directory, name))
+
+    def pending(self):
+        """Returns (count, bytes, oldest receive time) of the files waiting for a batch."""
+        return self.connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), MIN(received_at) FROM objects WHERE batch IS NULL"
+        ).fetchone()
+
+    async def start(self, host='127.0.0.1', port=8765):
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        port = self.server.sockets[0].getsockname()[1]  # The one chosen by the system for port 0
+        print(f"Collecting on http://{host}:{port}/ into {self.store!r}")
+        return self.server
+
+    async def serve_forever(self, host='127.0.0.1', port=8765, check_interval=5):
+        """Serves agents and writes batches as they fill up, until cancelled."""
+        await self.start(host, port)
+        try:
+            while True:
+                await asyncio.sleep(check_interval)
+                self.maybe_flush()
+        finally:
+            await self.close()
+
+    async def close(self):
+        """Stops accepting uploads and writes out whatever is pending."""
+        if self.server is not None:
+            self.server.close()  # Not wait_closed, which would wait for idle keep-alive connections
+            self.server = None
+        if self.flushing is not None:
+            await self.flushing
+        await self.flush()
+        self.connection.close()
+
+    def maybe_flush(self):
+        """Starts writing a batch once the pending files reach the target size or the oldest one the maximum age."""
+        if self.flushing is not None and not self.flushing.done():
+            return
+        count, size, oldest = self.pending()
+        if count and (size >= self.batch_target_size or time.time() - oldest >= self.batch_max_age):
+            self.flushing = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """Writes the pending files to the store in batches of about batch_target_size bytes."""
+        while True:
+            rows = self.connection.execute(
+                "SELECT sha256, agent, destination, size FROM objects WHERE batch IS NULL ORDER BY received_at"
+            ).fetchall()
+            if not rows:
+                return
+            batch, total = [], 0
+            for row in rows:
+                if batch and total + row[3] > self.batch_target_size:
+                    break
+                batch.append(row)
+                total += row[3]
+
+            key = f"batches/{datetime.now().strftime('%Y%m%d/%H%M%S')}_{batch[0][0][:12]}{bundler.EXTENSIONS[self.batch_codec]}"
+            entries = [(self.spool_path(sha256), f"{agent}/{destination}") for sha256, agent, destination, _ in batch]
+            try:
+                # Compressing and writing a large batch would stall every connection, so it runs on a thread
+                await asyncio.get_running_loop().run_in_executor(None, self.write_batch, key, entries)
+            except Exception as e:
+                print(f"Error writing batch {key}: {e}")
+                return  # Left pending for the next attempt
+
+            self.connection.execute("BEGIN")
+            self.connection.executemany("UPDATE objects SET batch = ? WHERE sha256 = ?",
+                                        [(key, row[0]) for row in batch])
+            self.connection.execute("DELETE FROM objects WHERE batch IS NOT NULL AND received_at < ?",
+                                    (time.time() - self.dedupe_window,))
+            self.connection.execute("COMMIT")
+            for path, _ in entries:
+                os.remove(path)
+            self.stats['batches'] += 1
+            print(f"Wrote batch {key}: {len(batch)} files, {total} bytes")
+
+    def write_batch(self, key, entries):
+        bundle_path = os.path.join(self.spool_directory, 'batch' + bundler.EXTENSIONS[self.batch_codec])
+        try:
+            bundler.create_bundle(entries, bundle_path, self.batch_codec)
+            self.store.put(key, bundle_path)
+        finally:
+            if os.path.exists(bundle_path):
+                os.remove(bundle_path)
+
+    async def handle_connection(self, reader, writer):
+        """Serves the requests of one keep-alive connection until the agent closes it or goes idle."""
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                headers = {}
+                for _ in range(MAX_HEADER_LINES):
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                else:
+                    await self.respond(writer, 400, {'error': "Too many headers"}, close=True)
+                    break
+
+                try:
+                    method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                    status, body = await self.handle_request(method, target, headers, reader)
+                    close = headers.get('connection', '').lower() == 'close'
+                except (ValueError, RequestError) as e:
+                    status = getattr(e, 'status', 400)
+                    body = {'error': str(e)}
+                    close = not getattr(e, 'body_read', False)  # The unread body would be parsed as a request
+                    self.stats['rejected'] += 1
+                except ConnectionError:
+                    raise
+                except OSError as e:
+                    print(f"Could not store upload: {e}")
+                    status, body, close = 500, {'error': "The upload could not be stored"}, True
+                    self.stats['rejected'] += 1
+                await self.respond(writer, status, body, close)
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # The agent went away mid-request; nothing was recorded for it
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, body, close=False):
+        data = json.dumps(body).encode('utf-8')
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n".encode('latin-1') + data
+        )
+        await writer.drain()
+
+    async def handle_request(self, method, target, headers, reader):
+        """Returns (status, JSON body) for a request; PUT /upload/<destination> or GET /status."""
+        if target == '/status' and method == 'GET':
+            count, size, _ = self.pending()
+            return 200, dict(self.stats, pending_files=count, pending_bytes=size)
+        if not target.startswith('/upload/'):
+            raise RequestError(404, f"Unknown path {target}", body_read=False)
+        if method != 'PUT':
+            raise RequestError(405, f"{method} is not supported", body_read=False)
+
+        if self.token and headers.get('authorization') != f"Bearer {self.token}":
+            raise RequestError(401, "Missing or wrong collector token", body_read=False)
+        agent = headers.get('x-agent-id', '')
+        sha256 = headers.get('x-content-sha256', '').lower()
+        destination = unquote(target[len('/upload/'):])
+        parts = destination.split('/')
+        if not AGENT_ID_PATTERN.match(agent):
+            raise RequestError(400, "X-Agent-Id is missing or invalid", body_read=False)
+        if not re.fullmatch(r'[0-9a-f]{64}', sha256):
+            raise RequestError(400, "X-Content-SHA256 is missing or invalid", body_read=False)
+        if not destination or any(part in ('', '.', '..') for part in parts):
+            raise RequestError(400, f"Invalid destination {destination!r}", body_read=False)
+
+        known = self.connection.execute("SELECT 1 FROM objects WHERE sha256 = ?", (sha256,)).fetchone()
+        path = self.spool_path(sha256)
+        size, temp_file = await self.read_body(reader, headers, None if known else path, sha256)
+        if not known:
+            # Another upload of the same content may have been stored while this body was read
+            known = self.connection.execute("SELECT 1 FROM objects WHERE sha256 = ?", (sha256,)).fetchone()
+            if known:
+                os.remove(temp_file)
+            else:
+                try:
+                    os.replace(temp_file, path)
+                except OSError:
+                    os.remove(temp_file)
+                    raise
+        if known:
+            self.stats['duplicates'] += 1
+            return 200, {'duplicate': True}
+
+        self.connection.execute(
+            "INSERT OR IGNORE INTO objects (sha256, agent, destination, size, received_at) VALUES (?, ?, ?, ?, ?)",
+            (sha256, agent, destination, size, time.time())
+        )
+        self.stats['received'] += 1
+        self.stats['bytes_received'] += size
+        self.maybe_flush()
+        return 201, {'duplicate': False, 'size': size}
+
+    async def read_body(self, reader, headers, path, sha256):
+        """Reads and decompresses the request body into a temporary file next to `path` (or discards it if None).
+
+        Returns (decompressed size, temporary file or None); the caller moves the file into
+        place. Every request gets its own file, so concurrent uploads of the same content do
+        not write to the same one. Raises RequestError if the body does not match the hash.
+        """
+        decoder = decompressor(headers.get('content-encoding', '').lower())
+        digest = hashlib.sha256()
+        size = 0
+        temp_file = out = None
+        if path:
+            fd, temp_file = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix='.tmp',
+                                             dir=os.path.dirname(path))
+            out = os.fdopen(fd, 'wb')
+        try:
+            async for chunk in self.body_chunks(reader, headers):
+                if decoder is not None:
+                    chunk = decoder.decompress(chunk)
+                size += len(chunk)
+                if size > self.max_object_size:
+                    raise RequestError(413, f"Uploads are limited to {self.max_object_size} bytes", body_read=False)
+                digest.update(chunk)
+                if out is not None:
+                    out.write(chunk)
+            if decoder is not None and hasattr(decoder, 'flush'):
+                tail = decoder.flush()
+                size += len(tail)
+                digest.update(tail)
+                if out is not None:
+                    out.write(tail)
+            if digest.hexdigest() != sha256:
+                raise RequestError(400, "Content does not match X-Content-SHA256")
+        except BaseException as e:
+            if out is not None:
+                out.close()
+                os.remove(temp_file)
+            if isinstance(e, zlib.error):
+                raise RequestError(400, f"Body could not be decompressed: {e}", body_read=False) from e
+            raise
+        if out is not None:
+            out.close()
+        return size, temp_file
+
+    async def body_chunks(self, reader, headers):
+        """Yields the raw body of a request sent with Content-Length or chunked transfer encoding."""
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await reader.readline()).split(b';', 1)[0], 16)
+                if size == 0:
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass  # Trailers
+                    return
+                yield await reader.readexactly(size)
+                await reader.readexactly(2)  # CRLF after the chunk
+        elif 'content-length' in headers:
+            remaining = int(headers['content-length'])
+            while remaining:
+                chunk = await reader.readexactly(min(remaining, READ_CHUNK_SIZE))
+                remaining -= len(chunk)
+                yield chunk
+        else:
+            raise RequestError(411, "Content-Length or chunked encoding is required", body_read=False)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Collect uploads from agents into batches in an object store.")
+    parser.add_argument('--store', required=True, help="s3://bucket-name, or a directory standing in for the bucket")
+    parser.add_argument('--endpoint-url', help="S3 endpoint, e.g. a local S3-compatible server")
+    parser.add_argument('--spool', default='collector_spool', help="Directory for files waiting for a batch")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--batch-size', type=int, default=64 * 1024 * 1024, help="Target batch size in bytes")
+    parser.add_argument('--batch-age', type=float, default=300, help="Seconds before a partial batch is written")
+    parser.add_argument('--codec', default='gzip', choices=sorted(bundler.EXTENSIONS))
+    parser.add_argument('--token', default=os.environ.get('COLLECTOR_TOKEN'),
+                        help="Bearer token agents must send (default: $COLLECTOR_TOKEN)")
+    args = parser.parse_args(argv)
+
+    collector = Collector(open_store(args.store, args.endpoint_url), args.spool, batch_target_size=args.batch_size,
+                          batch_max_age=args.batch_age, batch_codec=args.codec, token=args.token)
+    try:
+        asyncio.run(collector.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        print("Collector stopped.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,195 @@
+import json
+import os
+import threading
+
+# Settings written to a new config.json
+DEFAULT_CONFIG = {
+    "capture_screenshots": True,
+    "capture_blurred": False,
+    "screenshot_interval": 60,
+    "screenshot_diff_threshold": 0.01,
+    "screenshot_format": "png",
+    "screenshot_quality": 80,
+    "screenshot_scale": 1.0,
+    "screenshot_encode_workers": 2,
+    "capture_backend": "auto",
+    "capture_displays": None,
+    "capture_display_intervals": {},
+    "capture_region": None,
+    "capture_adaptive": False,
+    "capture_min_interval": 15,
+    "capture_max_interval": 300,
+    "capture_cpu_limit": 80,
+    "capture_battery_limit": 30,
+    "capture_spool_limit": 0.8,
+    "log_batch_size": 100,
+    "log_flush_interval": 1.0,
+    "aggregate_events": False,
+    "aggregate_window": 5,
+    "scripted_window_size": 10,
+    "scripted_checks": ["fast_repeat"],
+    "scripted_fast_threshold": 0.015,
+    "scripted_jitter_threshold": 0.002,
+    "scripted_periodicity_cv": 0.05,
+    "log_format": "text",
+    "log_rotation": True,
+    "log_rotate_max_bytes": 0,
+    "log_upload": "raw",
+    "analytics_idle_gap": 300,
+    "hourly_index": True,
+    "cloud_upload": False,
+    "upload_backend": "s3",
+    "s3_bucket": "",
+    "s3_endpoint_url": None,
+    "collector_url": "http://127.0.0.1:8765",
+    "collector_token": "",
+    "collector_agent_id": "",
+    "upload_workers": 4,
+    "upload_max_bandwidth": 0,
+    "upload_multipart_threshold": 8388608,
+    "upload_multipart_chunksize": 8388608,
+    "upload_max_concurrency": 4,
+    "bundle_target_size": 33554432,
+    "bundle_max_file_size": 1048576,
+    "bundle_codec": "gzip",
+    "bundle_max_age": 300,
+    "upload_codec": "gzip",
+    "upload_compression_level": 6,
+    "upload_shutdown_timeout": 30,
+    "async_runtime": False,
+    "spool_max_bytes": 2147483648,
+    "spool_check_interval": 30,
+    "spool_degrade_after": 3600,
+    "spool_degrade_scale": 0.5,
+    "spool_degrade_quality": 50,
+    "metrics_enabled": False,
+    "metrics_file": "metrics.json",
+    "metrics_port": 0,
+    "metrics_interval": 10
+}
+
+
+class ConfigStore:
+    """Shared, cached view of config.json.
+
+    The file is parsed once and re-read only when its mtime, inode or size changes.
+    Writes merge into the current content and replace the file atomically, so keys
+    one component does not know about are preserved. Subscribers are called with a
+    dict of the changed keys whenever values change, from a write or an edit on disk.
+    """
+
+    def __init__(self, config_file, defaults=None):
+        self.config_file = config_file
+        self.defaults = dict(DEFAULT_CONFIG if defaults is None else defaults)
+        self.lock = threading.RLock()
+        self.values = {}
+        self.file_key = None  # (mtime_ns, inode, size) of the file the cache was read from
+        self.subscribers = []
+        self.watcher = None
+        self.stop_event = threading.Event()
+
+    def ensure_exists(self):
+        """Writes the default configuration if the file does not exist yet."""
+        with self.lock:
+            if not os.path.exists(self.config_file):
+                self._write(self.defaults)
+            self.reload_if_changed()
+
+    def _stat_key(self):
+        try:
+            stat = os.stat(self.config_file)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+
+    def reload_if_changed(self):
+        """Re-reads the file if it changed on disk; returns True if any value changed."""
+        changed = {}
+        with self.lock:
+            key = self._stat_key()
+            if key is None or key == self.file_key:
+                return False
+            try:
+                with open(self.config_file, 'r') as f:
+                    values = json.load(f)
+            except (OSError, ValueError) as e:
+                # Most likely caught mid-edit; keep the cached values and try again next time
+                print(f"Error reading configuration {self.config_file}: {e}")
+                return False
+            self.file_key = key
+            changed = {k: v for k, v in values.items() if self.values.get(k) != v}
+            changed.update({k: None for k in self.values if k not in values})
+            self.values = values
+        if changed:
+            self._notify(changed)
+        return bool(changed)
+
+    def get(self, key, default=None):
+        """Returns a setting from the cache, or `default` if it is not set."""
+        with self.lock:
+            return self.values.get(key, default)
+
+    def __getitem__(self, key):
+        with self.lock:
+            return self.values[key]
+
+    def snapshot(self):
+        """Returns a copy of all settings."""
+        with self.lock:
+            return dict(self.values)
+
+    def set(self, key, value):
+        """Changes one setting and saves it."""
+        self.update({key: value})
+
+    def update(self, values):
+        """Changes several settings and saves them in one atomic write."""
+        with self.lock:
+            self.reload_if_changed()  # Merge edits made on disk since the last read
+            changed = {k: v for k, v in values.items() if self.values.get(k) != v}
+            if not changed:
+                return
+            merged = dict(self.values)
+            merged.update(changed)
+            self._write(merged)
+            self.values = merged
+            self.file_key = self._stat_key()
+        self._notify(changed)
+
+    def _write(self, values):
+        """Writes the settings through a temporary file so readers never see a partial file."""
+        temp_file = f"{self.config_file}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(values, f, indent=4)
+        os.replace(temp_file, self.config_file)
+
+    def subscribe(self, callback):
+        """Registers `callback(changed)` to be called with the changed settings."""
+        with self.lock:
+            self.subscribers.append(callback)
+
+    def _notify(self, changed):
+        for callback in list(self.subscribers):
+            try:
+                callback(changed)
+            except Exception as e:
+                print(f"Error applying configuration change: {e}")
+
+    def start_watching(self, interval=2.0):
+        """Polls the file's metadata in the background so edits made by hand reach subscribers."""
+        if self.watcher is not None:
+            return
+        self.stop_event.clear()
+
+        def watch():
+            while not self.stop_event.wait(interval):
+                self.reload_if_changed()
+
+        self.watcher = threading.Thread(target=watch, name="ConfigWatcher", daemon=True)
+        self.watcher.start()
+
+    def stop_watching(self):
+        self.stop_event.set()
+        if self.watcher is not None:
+            self.watcher.join()
+            self.watcher = None
@@ -1,48 +1,176 @@
+import http.client
 import os
+import re
 import shutil
-import boto3
-import gzip
-from botocore.exceptions import NoCredentialsError, PartialCredentialsError
+import socket
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
+from urllib.parse import quote, urlsplit
+import bundler
+import metrics
+import upload_queue
+
+# Object name suffix for each upload codec
+CODEC_SUFFIXES = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+    'none': '',
+}
+
+# Inputs that are already compressed and are uploaded as they are
+COMPRESSED_EXTENSIONS = ('.gz', '.zst', '.zip')
+
+
+class CompressingReader:
+    """Read-only file object that compresses another file object chunk by chunk as it is read.
+
+    Used as the body of an upload so no compressed copy is ever written to disk.
+    """
+
+    def __init__(self, fileobj, codec='gzip', level=6, chunk_size=256 * 1024):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.buffer = bytearray()
+        self.finished = False
+        if codec == 'gzip':
+            self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 writes a gzip header
+        elif codec == 'zstd':
+            import zstandard
+            self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        elif codec == 'none':
+            self.compressor = None
+        else:
+            raise ValueError(f"Unknown upload codec: {codec}")
+
+    def read(self, size=-1):
+        while not self.finished and (size is None or size < 0 or len(self.buffer) < size):
+            chunk = self.fileobj.read(self.chunk_size)
+            self.raw_bytes += len(chunk)
+            if chunk:
+                self.buffer += self.compressor.compress(chunk) if self.compressor else chunk
+            else:
+                if self.compressor:
+                    self.buffer += self.compressor.flush()
+                self.finished = True
+        if size is None or size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        self.compressed_bytes += len(data)
+        return data
+
+    def readable(self):
+        return True
+
+    def close(self):
+        self.fileobj.close()
+
 
 class DataUploader:
-    def __init__(self, base_directory, cloud_upload=False, bucket_name=None, aws_access_key_id=None, aws_secret_access_key=None):
+    def __init__(self, base_directory, cloud_upload=False, bucket_name=None, aws_access_key_id=None, aws_secret_access_key=None,
+                 max_workers=4, max_bandwidth=None, multipart_threshold=8 * 1024 * 1024,
+                 multipart_chunksize=8 * 1024 * 1024, max_concurrency=4, endpoint_url=None,
+                 bundle_target_size=0, bundle_max_file_size=1024 * 1024, bundle_codec='gzip', bundle_max_age=300,
+                 upload_codec='gzip', compression_level=6, delete_after_upload=True,
+                 upload_backend='s3', collector_url=None, collector_token=None, agent_id=None):
         self.base_directory = base_directory
         self.cloud_upload = cloud_upload
         self.bucket_name = bucket_name
         self.s3_client = None
-        
-        # Initialize S3 client if cloud upload is enabled
-        if self.cloud_upload and bucket_name and aws_access_key_id and aws_secret_access_key:
+        self.transfer_manager = None
+
+        # "s3" uploads straight to the bucket; "collector" sends files to a collector (collector.py)
+        # that batches the uploads of many agents into large objects
+        self.upload_backend = upload_backend
+        self.collector_url = urlsplit(collector_url or 'http://127.0.0.1:8765')
+        self.collector_token = collector_token
+        self.agent_id = re.sub(r'[^A-Za-z0-9._-]', '_', agent_id or socket.gethostname())[:64]
+        self.local = threading.local()  # One keep-alive connection to the collector per worker thread
+        self.connections = []
+        self.connections_lock = threading.Lock()
+        self.max_workers = max(1, int(max_workers))
+        self.executor = None
+
+        # Small queued files are packed into bundles of about bundle_target_size bytes; 0 disables bundling.
+        # They wait until that much is queued or the oldest has waited bundle_max_age seconds
+        self.bundle_target_size = bundle_target_size
+        self.bundle_max_file_size = bundle_max_file_size
+        self.bundle_max_age = bundle_max_age
+        self.bundle_codec = bundler.available_codec(bundle_codec)
+        self.bundle_directory = os.path.join(self.base_directory, 'bundles')
+
+        # Uploads are compressed while they are streamed; uploaded files are removed from the spool
+        self.upload_codec = bundler.available_codec(upload_codec) if upload_codec != 'none' else 'none'
+        self.compression_level = compression_level
+        self.delete_after_upload = delete_after_upload
+
+        # Initialize S3 client if cloud upload to S3 is enabled; boto3 is not needed for the collector.
+        # Credentials left as None are found by boto3 itself, e.g. in the AWS_* environment variables
+        if self.cloud_upload and upload_backend == 's3' and bucket_name:
+            import boto3
+            from boto3.s3.transfer import TransferConfig, create_transfer_manager
+            from botocore.config import Config
+
+            # Multipart settings; max_bandwidth (bytes per second) caps all uploads together
+            # since every upload goes through the one shared transfer manager below
+            self.transfer_config = TransferConfig(
+                multipart_threshold=multipart_threshold,
+                multipart_chunksize=multipart_chunksize,
+                max_concurrency=max_concurrency,
+                max_bandwidth=max_bandwidth or None
+            )
             self.s3_client = boto3.client(
                 's3',
                 aws_access_key_id=aws_access_key_id,
-                aws_secret_access_key=aws_secret_access_key
+                aws_secret_access_key=aws_secret_access_key,
+                endpoint_url=endpoint_url,  # e.g. a local S3 stand-in for testing
+                # One pooled connection per concurrent part across all workers
+                config=Config(max_pool_connections=self.max_workers * max_concurrency)
             )
+            self.transfer_manager = create_transfer_manager(self.s3_client, self.transfer_config)
+        elif self.cloud_upload and upload_backend == 'collector':
+            if self.collector_url.scheme not in ('http', 'https') or not self.collector_url.hostname:
+                raise ValueError(f"Invalid collector URL: {collector_url}")
         elif self.cloud_upload:
-            raise ValueError("Cloud upload requires valid AWS credentials and a bucket name.")
+            raise ValueError("Cloud upload requires a bucket name.")
         
         # Ensure the base directory exists for local storage
         os.makedirs(self.base_directory, exist_ok=True)
 
+        self.uploads = metrics.registry.counter('uploads_total')
+        self.upload_failures = metrics.registry.counter('upload_failures_total')
+        self.upload_seconds = metrics.registry.histogram('upload_seconds')
+        self.upload_raw_bytes = metrics.registry.counter('upload_raw_bytes_total')
+        self.upload_sent_bytes = metrics.registry.counter('upload_sent_bytes_total')
+        self.upload_throughput = metrics.registry.gauge('upload_throughput_bytes_per_second')
+
     def upload_file(self, file_path, destination_name):
-        """Uploads a single file to either local storage or cloud."""
+        """Uploads a single file to either local storage or cloud; returns True on success."""
         destination = os.path.join(self.base_directory, destination_name)
         try:
             if not os.path.exists(file_path):
                 print(f"File {file_path} not found")
-                return
+                return False
 
+            if self.cloud_upload and self.upload_backend == 'collector':
+                return self.upload_to_collector(file_path, destination_name)
             if self.cloud_upload:
-                self.upload_to_cloud(file_path, destination_name)
+                return self.upload_to_cloud(file_path, destination_name)
             else:
                 # Handle file overwrite by renaming the destination if it exists
                 destination = self.handle_file_conflict(destination_name)
                 shutil.move(file_path, destination)  # Use shutil.move to handle file operations
                 print(f"Saved locally: {file_path} to {destination}")
+                return True
 
         except Exception as e:
             print(f"An error occurred while uploading the file: {e}")
+            return False
 
     def handle_file_conflict(self, destination_name):
         """Handles potential file conflicts by renaming the file."""
@@ -57,54 +185,262 @@ class DataUploader:
             destination = os.path.join(self.base_directory, new_destination_name)
         return destination
 
+    def get_executor(self):
+        """Returns the bounded worker pool used for concurrent uploads."""
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="DataUploader")
+        return self.executor
+
     def upload_multiple_files(self, file_paths):
-        """Uploads multiple files by delegating to `upload_file`."""
-        for file_path in file_paths:
-            destination_name = os.path.basename(file_path)
-            self.upload_file(file_path, destination_name)
+        """Uploads multiple files by delegating to `upload_file`, using the worker pool when it has more than one worker."""
+        if self.max_workers == 1:
+            return [self.upload_file(file_path, os.path.basename(file_path)) for file_path in file_paths]
+        futures = [
+            self.get_executor().submit(self.upload_file, file_path, os.path.basename(file_path))
+            for file_path in file_paths
+        ]
+        return [future.result() for future in futures]
 
-    def upload_to_cloud(self, file_path, destination_name):
-        """Handles file compression and cloud upload to S3."""
-        compressed_file_path = self.compress_file(file_path)
+    def upload_bundle(self, items):
+        """Packs queued items into one compressed bundle and uploads it; returns True on success."""
+        os.makedirs(self.bundle_directory, exist_ok=True)
+        name = f"bundle_{datetime.now().strftime('%Y%m%d-%H%M%S')}_{items[0].id}{bundler.EXTENSIONS[self.bundle_codec]}"
+        bundle_path = os.path.join(self.bundle_directory, name)
+        entries = [(item.path, item.destination) for item in items if os.path.exists(item.path)]
+        if not entries:
+            return True
+        try:
+            bundler.create_bundle(entries, bundle_path, self.bundle_codec)
+            print(f"Bundled {len(entries)} files into {bundle_path} ({os.path.getsize(bundle_path)} bytes)")
+            if not self.upload_file(bundle_path, f"bundles/{name}"):
+                return False
+        except Exception as e:
+            print(f"An error occurred while bundling files: {e}")
+            return False
+        finally:
+            if os.path.exists(bundle_path):
+                os.remove(bundle_path)
+        if self.cloud_upload:
+            for path, _ in entries:
+                self.remove_uploaded(path)
+        return True
 
-        # Create a timestamped directory structure
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        destination_name = os.path.join("screenshots", f"screenshot_{timestamp}.png.gz")  # Modify the extension as needed
+    def remove_uploaded(self, file_path):
+        """Deletes an uploaded file if delete_after_upload is set; a file that cannot be removed is left behind."""
+        if not self.delete_after_upload:
+            return
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Uploaded {file_path} but could not delete it: {e}")
 
+    def shutdown(self):
+        """Waits for running uploads and releases the worker pool."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        if self.transfer_manager is not None:
+            self.transfer_manager.shutdown()
+            self.transfer_manager = None
+        with self.connections_lock:
+            connections, self.connections = self.connections, []
+        for connection in connections:
+            connection.close()
+
+    def drain_queue(self, queue, stop_event, is_online=None, on_uploaded=None,
+                    min_backoff=5, max_backoff=600):
+        """Uploads queued items until `stop_event` is set, backing off exponentially on failures.
+
+        `is_online` is checked before each attempt; `on_uploaded` is called with every
+        item that has been uploaded.
+        """
+        backoff = min_backoff
+        in_flight = {}  # Future -> items being uploaded by the worker pool, several for a bundle
+
+        def finish(items, uploaded):
+            for item in items:
+                if uploaded:
+                    queue.mark_done(item)
+                    if on_uploaded is not None:
+                        on_uploaded(item)
+                else:
+                    # Per-item backoff, so one bad file does not hold up the rest of the queue
+                    queue.mark_failed(item, min(min_backoff * 2 ** item.attempts, max_backoff))
+
+        while not stop_event.is_set():
+            queue.run_tasks()
+
+            # Collect finished uploads
+            for future in [future for future in in_flight if future.done()]:
+                uploaded = future.result()
+                finish(in_flight.pop(future), uploaded)
+                if uploaded:
+                    backoff = min_backoff
+
+            if len(in_flight) >= self.max_workers:
+                wait(list(in_flight), timeout=1, return_when=FIRST_COMPLETED)
+                continue
+
+            busy = [item.id for items in in_flight.values() for item in items]
+            item = queue.next_ready(exclude=busy)
+            hold_until = None
+            if item is not None and self.bundle_target_size and item.size <= self.bundle_max_file_size:
+                # Small files wait for enough others to fill a bundle; larger ones go ahead of them
+                pending, oldest = queue.bundle_backlog(self.bundle_max_file_size, exclude=busy)
+                if pending < self.bundle_target_size and oldest is not None and oldest + self.bundle_max_age > time.time():
+                    hold_until = oldest + self.bundle_max_age
+                    item = queue.next_ready(exclude=busy, min_size=self.bundle_max_file_size + 1)
+            if item is None:
+                if in_flight:
+                    wait(list(in_flight), timeout=1, return_when=FIRST_COMPLETED)
+                    continue
+                # Sleep until a retry or held bundle is due, or a new item is queued
+                deadlines = [t for t in (queue.next_attempt_time(after=time.time()), hold_until) if t is not None]
+                timeout = max(0.1, min(deadlines) - time.time()) if deadlines else max_backoff
+                self.wait_for_item(queue, stop_event, min(timeout, max_backoff))
+                continue
+
+            if not os.path.exists(item.path):
+                print(f"Queued file {item.path} no longer exists, dropping it")
+                queue.mark_done(item, upload_queue.MISSING)
+                continue
+
+            if queue.is_duplicate(item):
+                # The content is already uploaded under another name; record this copy as done too
+                self.remove_uploaded(item.path)
+                finish([item], True)
+                continue
+
+            if is_online is not None and not in_flight and not is_online():
+                print(f"No internet connection. Retrying uploads in {backoff} seconds...")
+                stop_event.wait(backoff)
+                backoff = min(backoff * 2, max_backoff)
+                continue
+
+            if self.bundle_target_size and item.size <= self.bundle_max_file_size:
+                items = queue.next_batch(self.bundle_max_file_size, self.bundle_target_size, exclude=busy)
+                if len(items) > 1:
+                    in_flight[self.get_executor().submit(self.upload_bundle, items)] = items
+                    continue
+            in_flight[self.get_executor().submit(self.upload_file, item.path, item.destination)] = [item]
+
+        # Let running uploads finish so their state is recorded
+        for future in list(in_flight):
+            finish(in_flight.pop(future), future.result())
+
+    def wait_for_item(self, queue, stop_event, timeout):
+        """Sleeps up to `timeout` seconds until an item is queued, waking within a second once `stop_event` is set."""
+        end = time.monotonic() + timeout
+        while not stop_event.is_set():
+            remaining = end - time.monotonic()
+            if remaining <= 0 or queue.item_added.wait(min(remaining, 1.0)):
+                break
+        queue.item_added.clear()
+
+    def upload_to_cloud(self, file_path, destination_name):
+        """Compresses the file while streaming it to S3 under `destination_name`; returns True on success."""
+        from botocore.exceptions import NoCredentialsError, PartialCredentialsError
+        codec = self.upload_codec
+        if file_path.endswith(COMPRESSED_EXTENSIONS):
+            codec = 'none'
+        object_name = destination_name.replace(os.sep, '/') + CODEC_SUFFIXES[codec]
+
+        start = time.perf_counter()
         try:
-            self.s3_client.upload_file(
-                compressed_file_path,
-                self.bucket_name,
-                destination_name,
-                ExtraArgs={'ContentType': 'application/octet-stream', 'ACL': 'private'}
-            )
-            print(f"Uploaded {file_path} to cloud storage as {destination_name}.")
+            with open(file_path, 'rb') as f:
+                body = CompressingReader(f, codec, self.compression_level)
+                self.transfer_manager.upload(
+                    body,
+                    self.bucket_name,
+                    object_name,
+                    extra_args={'ContentType': 'application/octet-stream', 'ACL': 'private'}
+                ).result()
+            self.report_upload(file_path, object_name, body.raw_bytes, body.compressed_bytes,
+                               time.perf_counter() - start)
         except FileNotFoundError:
             print(f"The file {file_path} was not found.")
         except (NoCredentialsError, PartialCredentialsError):
             print("AWS credentials not available.")
         except Exception as e:
             print(f"An error occurred during cloud upload: {e}")
-        finally:
-            # Remove the compressed file after upload
-            if os.path.exists(compressed_file_path):
-                os.remove(compressed_file_path)
+        else:
+            self.remove_uploaded(file_path)  # Outside the try, so a failed delete is not a failed upload
+            return True
+        self.upload_failures.inc()
+        return False
+
+    def collector_connection(self):
+        """Returns this thread's keep-alive connection to the collector, opening it if needed."""
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            url = self.collector_url
+            connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+            # The body is sent as it is compressed, in chunks of this size
+            connection = connection_class(url.hostname, url.port, timeout=60, blocksize=256 * 1024)
+            self.local.connection = connection
+            with self.connections_lock:
+                self.connections.append(connection)
+        return connection
 
-    def compress_file(self, file_path):
-        """Compresses the file using gzip if its size is greater than 5 MB."""
-        compressed_file_path = f"{file_path}.gz"
+    def upload_to_collector(self, file_path, destination_name):
+        """Compresses the file while streaming it to the collector under `destination_name`; returns True on success.
+
+        The collector deduplicates by the SHA-256 sent along, so a retried upload is stored once.
+        """
+        codec = self.upload_codec
+        if file_path.endswith(COMPRESSED_EXTENSIONS):
+            codec = 'none'
+        destination = destination_name.replace(os.sep, '/')
+        headers = {
+            'Content-Type': 'application/octet-stream',
+            'X-Agent-Id': self.agent_id,
+            'X-Content-SHA256': bundler.sha256_of(file_path),
+        }
+        if codec != 'none':
+            headers['Content-Encoding'] = codec
+        if self.collector_token:
+            headers['Authorization'] = f"Bearer {self.collector_token}"
+
+        start = time.perf_counter()
+        connection = self.collector_connection()
         try:
-            # Check file size
-            if os.path.getsize(file_path) > 5 * 1024 * 1024:  # 5 MB in bytes
-                with open(file_path, 'rb') as f_in:
-                    with gzip.open(compressed_file_path, 'wb') as f_out:
-                        shutil.copyfileobj(f_in, f_out)
-                print(f"Compressed {file_path} to {compressed_file_path}")
-                return compressed_file_path
-            else:
-                print(f"File {file_path} is not larger than 5 MB. Skipping compression.")
-                return file_path  # Return the original file path if not compressed
-        except Exception as e:
-            print(f"Error while compressing {file_path}: {e}")
-            return file_path  # Return the original file path in case of an error
+            with open(file_path, 'rb') as f:
+                # No Content-Length, so http.client sends the body with chunked encoding as it is compressed
+                body = CompressingReader(f, codec, self.compression_level)
+                connection.request('PUT', f"{self.collector_url.path.rstrip('/')}/upload/{quote(destination)}",
+                                   body=body, headers=headers)
+                response = connection.getresponse()
+                reply = response.read()
+            if response.status not in (200, 201):
+                print(f"The collector rejected {file_path}: {response.status} {reply.decode('utf-8', 'replace')}")
+                if response.will_close:
+                    connection.close()
+                self.upload_failures.inc()
+                return False
+            self.report_upload(file_path, destination, body.raw_bytes, body.compressed_bytes,
+                               time.perf_counter() - start)
+        except FileNotFoundError:
+            print(f"The file {file_path} was not found.")
+        except (OSError, http.client.HTTPException) as e:
+            connection.close()  # Reconnects on the next upload
+            print(f"An error occurred during upload to the collector: {e}")
+        else:
+            self.remove_uploaded(file_path)  # Outside the try, so a failed delete is not a failed upload
+            return True
+        self.upload_failures.inc()
+        return False
 
+    def report_upload(self, file_path, object_name, raw_bytes, compressed_bytes, seconds):
+        """Prints and records the size and throughput of a finished upload."""
+        self.uploads.inc()
+        self.upload_seconds.observe(seconds)
+        self.upload_raw_bytes.inc(raw_bytes)
+        self.upload_sent_bytes.inc(compressed_bytes)
+        if seconds > 0:
+            self.upload_throughput.set(compressed_bytes / seconds)
+        ratio = compressed_bytes / raw_bytes if raw_bytes else 1.0
+        throughput = raw_bytes / seconds / (1024 * 1024) if seconds > 0 else 0.0
+        print(f"Uploaded {file_path} to cloud storage as {object_name}: {raw_bytes} bytes raw, "
+              f"{compressed_bytes} bytes sent ({ratio:.0%}), {seconds:.2f}s, {throughput:.2f} MB/s")
@@ -0,0 +1,76 @@
+import threading
+import time
+
+# Event kinds counted per window and the log text used for each of them
+EVENT_KINDS = {
+    'move': "Mouse Moved",
+    'click': "Mouse Clicked",
+    'scroll': "Mouse Scrolled",
+    'key': "Key Pressed",
+}
+
+
+class EventAggregator:
+    """Counts input events per fixed time window and optionally logs one summary per window."""
+
+    def __init__(self, window=5, emit=None, format_time=None, on_window=None):
+        self.window = max(1, int(window))
+        self.emit = emit  # Called as emit(activity_type, timestamp) with each summary record
+        self.on_window = on_window  # Called as on_window(window_start, counts) for every window with events
+        self.format_time = format_time or (lambda ts: time.strftime('%H:%M:%S', time.localtime(ts)))
+        self.lock = threading.Lock()
+        self.counts = dict.fromkeys(EVENT_KINDS, 0)
+        self.last_window_counts = dict.fromkeys(EVENT_KINDS, 0)
+        self.last_window_start = None
+        self.window_start = self._window_start(time.time())
+        self.window_end = self.window_start + self.window
+
+    def _window_start(self, now):
+        """Aligns windows to multiples of the window length so summaries line up across runs."""
+        return now - (now % self.window)
+
+    def add(self, kind, now=None):
+        """Counts one event of the given kind, closing the current window first if it has ended."""
+        if now is None:
+            now = time.time()
+        with self.lock:
+            if now >= self.window_end:
+                self._roll(now)
+            self.counts[kind] += 1
+
+    def roll_if_due(self, now=None):
+        """Closes the current window if it has ended; called periodically so idle windows are still reported."""
+        if now is None:
+            now = time.time()
+        with self.lock:
+            if now >= self.window_end:
+                self._roll(now)
+
+    def flush(self):
+        """Closes the current window immediately, e.g. on shutdown."""
+        with self.lock:
+            self._roll(time.time())
+
+    def _roll(self, now):
+        """Publishes the counts of the current window and starts a new one."""
+        if self.emit is not None:
+            for kind, count in self.counts.items():
+                if count:
+                    self.emit(self.summary(kind, count, self.window_start, self.window_end), self.window_start)
+        if self.on_window is not None and any(self.counts.values()):
+            self.on_window(self.window_start, self.counts)
+        self.last_window_counts = self.counts
+        self.last_window_start = self.window_start
+        self.counts = dict.fromkeys(EVENT_KINDS, 0)
+        self.window_start = self._window_start(now)
+        self.window_end = self.window_start + self.window
+
+    def summary(self, kind, count, start, end):
+        """Formats a summary such as 'Mouse Moved x412, 10:01:00–10:01:05'."""
+        return f"{EVENT_KINDS[kind]} x{count}, {self.format_time(start)}–{self.format_time(end)}"
+
+    @property
+    def current_counts(self):
+        """Counts for the window that is still open."""
+        with self.lock:
+            return dict(self.counts)
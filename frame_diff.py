@@ -0,0 +1,45 @@
+import numpy as np
+from PIL import Image
+
+
+class FrameDiffer:
+    """Scores how much a screenshot changed since the last saved one.
+
+    Frames are reduced to a small grayscale thumbnail and split into blocks; the score
+    is the fraction of blocks whose mean absolute difference exceeds `block_threshold`
+    gray levels. Comparing against the last *saved* frame means slow changes still add
+    up to a new screenshot eventually.
+    """
+
+    def __init__(self, size=(128, 72), block=8, block_threshold=4.0):
+        self.size = size
+        self.block = block
+        self.block_threshold = block_threshold
+        self.reference = None  # Thumbnail of the last saved frame
+        self.candidate = None  # Thumbnail of the frame scored last
+
+    def thumbnail(self, image):
+        """Downsamples a frame to a float32 grayscale array of `size`."""
+        small = image.resize(self.size, Image.BOX).convert('L')
+        return np.asarray(small, dtype=np.float32)
+
+    def score(self, image):
+        """Returns the changed fraction (0.0 to 1.0) of `image` against the reference frame."""
+        self.candidate = self.thumbnail(image)
+        if self.reference is None or self.reference.shape != self.candidate.shape:
+            return 1.0
+        diff = np.abs(self.candidate - self.reference)
+        height, width = diff.shape
+        rows, cols = height // self.block, width // self.block
+        blocks = diff[:rows * self.block, :cols * self.block].reshape(rows, self.block, cols, self.block)
+        changed = blocks.mean(axis=(1, 3)) > self.block_threshold
+        return float(changed.mean())
+
+    def accept(self):
+        """Makes the frame scored last the new reference, once it has been saved."""
+        if self.candidate is not None:
+            self.reference = self.candidate
+
+    def reset(self):
+        self.reference = None
+        self.candidate = None
@@ -0,0 +1,240 @@
+"""Hourly rollup of screenshots and input activity, kept up to date as they are written.
+
+Usage:
+    python hourly_index.py data_to_upload/hourly_index.db "2026-03-03 14:00" "2026-03-03 15:30"
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+# Screenshot states
+LOCAL = 'local'
+QUEUED = 'queued'
+UPLOADED = 'uploaded'
+DELETED = 'deleted'  # Removed to stay within the disk quota before it was uploaded
+
+# Hourly event counters, by EventAggregator kind, plus detections of scripted activity
+EVENT_COLUMNS = {
+    'move': 'mouse_moves',
+    'click': 'mouse_clicks',
+    'scroll': 'mouse_scrolls',
+    'key': 'key_presses',
+    'scripted': 'scripted',
+}
+SCREENSHOT_EXTENSIONS = ('.png', '.jpg', '.webp')
+
+
+class HourlyIndex:
+    """Per-hour index of screenshots and event counts in SQLite, for time-range queries without listing directories.
+
+    Screenshots are recorded with their size, diff score and upload state as they are
+    saved. Event counts arrive once per aggregation window from the input thread, so
+    they are summed in memory and written by `flush`, which is scheduled periodically
+    and also runs before every query. A new index is filled with the screenshots
+    already on disk by `backfill`.
+    """
+
+    def __init__(self, db_file, screenshot_directory):
+        self.db_file = db_file
+        self.screenshot_directory = screenshot_directory
+        self.lock = threading.Lock()
+        self.pending = {}  # Hour -> [hour start, {column: count}] not yet written
+        self.pending_lock = threading.Lock()
+        self.current_hour = (0, 0, '')  # (start, end, name), replaced as a whole since several threads read it
+        self.created = not os.path.exists(db_file)
+        self.connection = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(f"""
+            CREATE TABLE IF NOT EXISTS hours (
+                hour TEXT PRIMARY KEY,
+                start REAL NOT NULL,
+                {', '.join(f'{column} INTEGER NOT NULL DEFAULT 0' for column in EVENT_COLUMNS.values())},
+                screenshots INTEGER NOT NULL DEFAULT 0,
+                screenshot_bytes INTEGER NOT NULL DEFAULT 0,
+                unchanged INTEGER NOT NULL DEFAULT 0,
+                uploaded INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS hours_start ON hours (start)")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS screenshots (
+                path TEXT PRIMARY KEY,
+                hour TEXT NOT NULL,
+                taken_at REAL NOT NULL,
+                size INTEGER NOT NULL,
+                diff_score REAL,
+                state TEXT NOT NULL
+            )
+        """)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS screenshots_taken_at ON screenshots (taken_at)")
+
+    def hour_key(self, ts):
+        """Returns (hour directory name, hour start) for a timestamp, cached for the current hour."""
+        start, end, hour = self.current_hour
+        if not start <= ts < end:
+            local = time.localtime(ts)
+            hour = time.strftime('%Y%m%d-%H', local)
+            start = ts - local.tm_min * 60 - local.tm_sec - (ts % 1)
+            self.current_hour = (start, start + 3600, hour)
+        return hour, start
+
+    def relative(self, path):
+        return os.path.relpath(path, self.screenshot_directory).replace(os.sep, '/')
+
+    def _add_to_hour(self, hour, start, **counts):
+        """Adds to the counters of an hour, creating its row; the caller holds the lock."""
+        columns = ', '.join(counts)
+        self.connection.execute(
+            f"INSERT INTO hours (hour, start, {columns}) VALUES (?, ?, {', '.join('?' * len(counts))}) "
+            f"ON CONFLICT (hour) DO UPDATE SET {', '.join(f'{c} = {c} + excluded.{c}' for c in counts)}",
+            (hour, start, *counts.values())
+        )
+
+    def add_screenshot(self, path, taken_at, size, diff_score=None, state=LOCAL):
+        """Records a saved screenshot."""
+        with self.lock:
+            hour, start = self.hour_key(taken_at)
+            self.connection.execute("BEGIN")
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO screenshots (path, hour, taken_at, size, diff_score, state) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self.relative(path), hour, taken_at, size, diff_score, state)
+            )
+            if cursor.rowcount:
+                self._add_to_hour(hour, start, screenshots=1, screenshot_bytes=size)
+            self.connection.execute("COMMIT")
+
+    def add_unchanged(self, taken_at):
+        """Counts a capture that was skipped as a near-duplicate of the previous screenshot."""
+        with self.lock:
+            hour, start = self.hour_key(taken_at)
+            self._add_to_hour(hour, start, unchanged=1)
+
+    def set_screenshot_state(self, path, state):
+        """Updates the upload state of a screenshot, e.g. once it has been uploaded."""
+        with self.lock:
+            self.connection.execute("BEGIN")
+            row = self.connection.execute(
+                "SELECT hour, state FROM screenshots WHERE path = ?", (self.relative(path),)
+            ).fetchone()
+            if row is not None and row[1] != state:
+                self.connection.execute(
+                    "UPDATE screenshots SET state = ? WHERE path = ?", (state, self.relative(path))
+                )
+                if UPLOADED in (state, row[1]):
+                    self.connection.execute(
+                        "UPDATE hours SET uploaded = uploaded + ? WHERE hour = ?",
+                        (1 if state == UPLOADED else -1, row[0])
+                    )
+            self.connection.execute("COMMIT")
+
+    def add_events(self, window_start, counts):
+        """Adds a window's event counts by kind; called from the input thread, so only memory is touched."""
+        with self.pending_lock:
+            hour, start = self.hour_key(window_start)
+            entry = self.pending.get(hour)
+            if entry is None:
+                entry = self.pending[hour] = [start, dict.fromkeys(EVENT_COLUMNS.values(), 0)]
+            totals = entry[1]
+            for kind, count in counts.items():
+                if count and kind in EVENT_COLUMNS:
+                    totals[EVENT_COLUMNS[kind]] += count
+
+    def flush(self):
+        """Writes the event counts summed since the last flush in one transaction."""
+        with self.pending_lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        with self.lock:
+            self.connection.execute("BEGIN")
+            for hour, (start, totals) in pending.items():
+                self._add_to_hour(hour, start, **totals)
+            self.connection.execute("COMMIT")
+
+    def backfill(self):
+        """Indexes the screenshots already on disk, e.g. when the index has just been created."""
+        added = 0
+        for root, _, files in os.walk(self.screenshot_directory):
+            for name in sorted(files):
+                if name.endswith(SCREENSHOT_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    self.add_screenshot(path, stat.st_mtime, stat.st_size)
+                    added += 1
+        if added:
+            print(f"Indexed {added} existing screenshots")
+
+    def hours_between(self, start, end):
+        """Rows of the hours overlapping the epoch time range [start, end), oldest first."""
+        self.flush()
+        with self.lock:
+            cursor = self.connection.execute(
+                "SELECT * FROM hours WHERE start < ? AND start > ? ORDER BY start", (end, start - 3600)
+            )
+            columns = [description[0] for description in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def screenshots_between(self, start, end):
+        """Screenshots taken within [start, end) as dicts with path, taken_at, size, diff_score and state."""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT path, taken_at, size, diff_score, state FROM screenshots "
+                "WHERE taken_at >= ? AND taken_at < ? ORDER BY taken_at", (start, end)
+            ).fetchall()
+        return [
+            {'path': os.path.join(self.screenshot_directory, path), 'taken_at': taken_at, 'size': size,
+             'diff_score': diff_score, 'state': state}
+            for path, taken_at, size, diff_score, state in rows
+        ]
+
+    def summary(self, start, end):
+        """Totals of every hourly counter over the hours overlapping [start, end)."""
+        totals = {}
+        for row in self.hours_between(start, end):
+            for column, value in row.items():
+                if column not in ('hour', 'start'):
+                    totals[column] = totals.get(column, 0) + value
+        return totals
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.connection.close()
+
+
+def parse_time(text):
+    return datetime.strptime(text, '%Y-%m-%d %H:%M').timestamp()
+
+
+def main(argv):
+    if len(argv) != 3:
+        print(__doc__)
+        return 1
+    db_file = argv[0]
+    if not os.path.exists(db_file):
+        print(f"No index at {db_file}")
+        return 1
+    start, end = parse_time(argv[1]), parse_time(argv[2])
+    index = HourlyIndex(db_file, os.path.join(os.path.dirname(os.path.abspath(db_file)), 'screenshots'))
+    try:
+        for row in index.hours_between(start, end):
+            counts = ', '.join(f"{column} {value}" for column, value in row.items() if column not in ('hour', 'start'))
+            print(f"{row['hour']}: {counts}")
+        for shot in index.screenshots_between(start, end):
+            score = '' if shot['diff_score'] is None else f", diff {shot['diff_score']:.4f}"
+            print(f"{shot['path']} ({shot['size']} bytes{score}, {shot['state']})")
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
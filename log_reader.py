@@ -0,0 +1,184 @@
+"""Reads binary activity logs and converts between the text and binary formats.
+
+Usage:
+    python log_reader.py to-binary activity_tracker_log.txt activity_tracker_log.bin
+    python log_reader.py to-text activity_tracker_log.bin activity_tracker_log.txt
+    python log_reader.py stats activity_tracker_log.bin
+
+Converting to binary is lossy in two cases (see binary_log.py): key presses that
+reported several characters keep only the first, and activity strings the format
+does not know become "Unknown activity". Aggregated summaries of more than 65535
+events are written as several records and read back as several summary lines.
+"""
+import sys
+from datetime import datetime
+
+import binary_log
+
+# Structured dtype matching binary_log.RECORD, for NumPy based readers
+RECORD_DTYPE = [
+    ('ts_ms', '<i8'),
+    ('event', 'u1'),
+    ('flags', 'u1'),
+    ('count', '<u2'),
+    ('payload', '<u4'),
+]
+
+READ_SIZE = 1024 * 1024
+
+
+def read_header(f):
+    """Reads and validates the file header."""
+    header = f.read(binary_log.FILE_HEADER.size)
+    if len(header) < binary_log.FILE_HEADER.size:
+        raise ValueError("File is too short to be a binary activity log")
+    magic, version, record_size, _ = binary_log.FILE_HEADER.unpack(header)
+    if magic != binary_log.MAGIC:
+        raise ValueError("Not a binary activity log")
+    if version != binary_log.VERSION or record_size != binary_log.RECORD.size:
+        raise ValueError(f"Unsupported binary log version {version} with {record_size} byte records")
+
+
+def iter_chunks(path):
+    """Yields the raw record bytes of each chunk; a chunk cut short by a crash is truncated to whole records."""
+    with open(path, 'rb') as f:
+        read_header(f)
+        while True:
+            header = f.read(binary_log.CHUNK_HEADER.size)
+            if len(header) < binary_log.CHUNK_HEADER.size:
+                return
+            magic, count = binary_log.CHUNK_HEADER.unpack(header)
+            if magic != binary_log.CHUNK_MAGIC:
+                print(f"Corrupt chunk in {path}, stopping")
+                return
+            data = f.read(count * binary_log.RECORD.size)
+            data = data[:len(data) - len(data) % binary_log.RECORD.size]
+            yield data
+            if len(data) < count * binary_log.RECORD.size:
+                return
+
+
+def iter_records(path):
+    """Streams (ts_ms, event, flags, count, payload) tuples from a binary log."""
+    for data in iter_chunks(path):
+        yield from binary_log.RECORD.iter_unpack(data)
+
+
+def chunk_offsets(path):
+    """Returns (offset, record count) for the records of every chunk, without reading the records."""
+    offsets = []
+    with open(path, 'rb') as f:
+        read_header(f)
+        size = f.seek(0, 2)
+        offset = binary_log.FILE_HEADER.size
+        while offset + binary_log.CHUNK_HEADER.size <= size:
+            f.seek(offset)
+            magic, count = binary_log.CHUNK_HEADER.unpack(f.read(binary_log.CHUNK_HEADER.size))
+            if magic != binary_log.CHUNK_MAGIC:
+                break
+            offset += binary_log.CHUNK_HEADER.size
+            count = min(count, (size - offset) // binary_log.RECORD.size)
+            offsets.append((offset, count))
+            offset += count * binary_log.RECORD.size
+    return offsets
+
+
+def read_arrays(path, mmap=True):
+    """Loads a binary log as a NumPy structured array with the fields of RECORD_DTYPE.
+
+    With `mmap` the file is memory-mapped and only the record slices are copied out.
+    Index the result by field name, e.g. `records['ts_ms']`, for column arrays.
+    """
+    import numpy as np  # Only needed for offline analysis
+
+    dtype = np.dtype(RECORD_DTYPE)
+    offsets = chunk_offsets(path)
+    if not offsets:
+        return np.zeros(0, dtype=dtype)
+    if mmap:
+        data = np.memmap(path, dtype=np.uint8, mode='r')
+        parts = [data[offset:offset + count * dtype.itemsize].view(dtype) for offset, count in offsets]
+    else:
+        parts = [np.frombuffer(chunk, dtype=dtype) for chunk in iter_chunks(path)]
+    return np.concatenate(parts)
+
+
+def parse_text_line(line):
+    """Splits a text log line into (timestamp, activity_type), or returns None for malformed lines."""
+    stamp, sep, activity_type = line.rstrip('\n').partition(' - ')
+    if not sep:
+        return None
+    try:
+        ts = datetime.strptime(stamp, '%Y-%m-%d %H:%M:%S').timestamp()
+    except ValueError:
+        return None
+    return ts, activity_type
+
+
+def text_to_binary(text_path, binary_path, chunk_size=4096):
+    """Converts a text log to the binary format; returns the number of records written."""
+    written = 0
+    with open(text_path, 'r', encoding='utf-8', errors='replace') as src, open(binary_path, 'wb') as dst:
+        dst.write(binary_log.file_header())
+        batch = []
+        for line in src:
+            record = parse_text_line(line)
+            if record is None:
+                continue
+            batch.append(record)
+            if len(batch) >= chunk_size:
+                dst.write(binary_log.encode_chunk(batch))
+                written += len(batch)
+                batch = []
+        if batch:
+            dst.write(binary_log.encode_chunk(batch))
+            written += len(batch)
+    return written
+
+
+def binary_to_text(binary_path, text_path):
+    """Converts a binary log back to the text format; returns the number of lines written."""
+    written = 0
+    with open(text_path, 'w', encoding='utf-8') as dst:
+        for data in iter_chunks(binary_path):
+            lines = []
+            for ts_ms, event, flags, count, payload in binary_log.RECORD.iter_unpack(data):
+                activity_type = binary_log.format_activity(ts_ms, event, flags, count, payload)
+                lines.append(f"{binary_log.format_timestamp(ts_ms)} - {activity_type}\n")
+            dst.write(''.join(lines))
+            written += len(lines)
+    return written
+
+
+def print_stats(path):
+    """Prints record counts per event type."""
+    counts = {}
+    first = last = None
+    for ts_ms, event, flags, count, payload in iter_records(path):
+        name = binary_log.EVENT_NAMES.get(event, binary_log.EVENT_NAMES[binary_log.OTHER])
+        counts[name] = counts.get(name, 0) + count
+        first = ts_ms if first is None else first
+        last = ts_ms
+    if first is None:
+        print("No records")
+        return
+    print(f"From {binary_log.format_timestamp(first)} to {binary_log.format_timestamp(last)}")
+    for name, count in sorted(counts.items()):
+        print(f"{name}: {count}")
+
+
+def main(argv):
+    if len(argv) == 3 and argv[0] == 'to-binary':
+        print(f"Wrote {text_to_binary(argv[1], argv[2])} records to {argv[2]}")
+    elif len(argv) == 3 and argv[0] == 'to-text':
+        print(f"Wrote {binary_to_text(argv[1], argv[2])} lines to {argv[2]}")
+    elif len(argv) == 2 and argv[0] == 'stats':
+        print_stats(argv[1])
+    else:
+        print(__doc__)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,188 @@
+import json
+import os
+import threading
+import time
+
+# Upload states of a log segment
+OPEN = 'open'
+CLOSED = 'closed'
+UPLOADED = 'uploaded'
+DELETED = 'deleted'  # Evicted by the spool quota before it was uploaded
+
+# Appended to a segment's path for the analytics summary written when it closes
+SUMMARY_SUFFIX = '.summary.json'
+
+
+class SegmentManifest:
+    """JSON index of activity log segments with their time range, record count and upload state."""
+
+    def __init__(self, manifest_file):
+        self.manifest_file = manifest_file
+        self.lock = threading.Lock()
+        self.segments = {}  # Segment path relative to the manifest directory -> entry
+        self.base_directory = os.path.dirname(manifest_file)
+        self.load()
+
+    def load(self):
+        """Loads the manifest, closing segments a previous run left open."""
+        if not os.path.exists(self.manifest_file):
+            return
+        try:
+            with open(self.manifest_file, 'r') as f:
+                entries = json.load(f).get('segments', [])
+        except (OSError, ValueError) as e:
+            print(f"Error reading log manifest {self.manifest_file}: {e}")
+            return
+        with self.lock:
+            self.segments = {entry['path']: entry for entry in entries}
+            for entry in self.segments.values():
+                if entry['state'] == OPEN:
+                    full_path = os.path.join(self.base_directory, entry['path'])
+                    entry['bytes'] = os.path.getsize(full_path) if os.path.exists(full_path) else 0
+                    entry['state'] = CLOSED
+        self.save()
+
+    def save(self):
+        """Writes the manifest atomically through a temporary file."""
+        with self.lock:
+            data = {'segments': sorted(self.segments.values(), key=lambda entry: entry['start'])}
+            temp_file = f"{self.manifest_file}.tmp"
+            with open(temp_file, 'w') as f:
+                json.dump(data, f, indent=1)
+            os.replace(temp_file, self.manifest_file)
+
+    def relative(self, path):
+        return os.path.relpath(path, self.base_directory).replace(os.sep, '/')
+
+    def add_segment(self, path, start):
+        with self.lock:
+            self.segments[self.relative(path)] = {
+                'path': self.relative(path),
+                'start': start,
+                'end': start,
+                'records': 0,
+                'bytes': 0,
+                'state': OPEN,
+            }
+        self.save()
+
+    def record(self, path, start, end, records, size):
+        """Adds a written batch to the running totals of a segment; persisted on the next save."""
+        with self.lock:
+            entry = self.segments[self.relative(path)]
+            entry['start'] = min(entry['start'], start)
+            entry['end'] = max(entry['end'], end)
+            entry['records'] += records
+            entry['bytes'] += size
+
+    def set_state(self, path, state):
+        with self.lock:
+            entry = self.segments.get(self.relative(path))
+            if entry is None:
+                return
+            entry['state'] = state
+        self.save()
+
+    def state_of(self, path):
+        """Upload state of a segment, or None if the path is not a segment."""
+        with self.lock:
+            entry = self.segments.get(self.relative(path))
+            return entry['state'] if entry is not None else None
+
+    def segments_in_state(self, state):
+        """Absolute paths of the segments in the given state, oldest first."""
+        with self.lock:
+            entries = sorted(self.segments.values(), key=lambda entry: entry['start'])
+            return [os.path.join(self.base_directory, entry['path']) for entry in entries if entry['state'] == state]
+
+    def segments_between(self, start, end):
+        """Entries of the segments overlapping the epoch time range [start, end]."""
+        with self.lock:
+            return [dict(entry) for entry in sorted(self.segments.values(), key=lambda entry: entry['start'])
+                    if entry['start'] <= end and entry['end'] >= start]
+
+
+class LogRotator:
+    """Chooses the activity log segment for each record, starting a new one every hour or at a size limit.
+
+    Segments are written to hourly `%Y%m%d-%H` directories, like the screenshots, and are
+    tracked in a SegmentManifest stored next to them.
+    """
+
+    # How often the running totals of the open segment are persisted
+    SAVE_INTERVAL = 60
+
+    def __init__(self, directory, file_name, hourly=True, max_bytes=0, on_close=None):
+        self.directory = directory
+        self.prefix, self.extension = os.path.splitext(file_name)
+        self.hourly = hourly
+        self.max_bytes = max_bytes
+        self.on_close = on_close  # Called with the path of every segment that is closed
+        os.makedirs(self.directory, exist_ok=True)
+        self.manifest = SegmentManifest(os.path.join(self.directory, 'index.json'))
+        self.current_path = None
+        self.current_bytes = 0
+        self.current_end = 0  # End of the hour the current segment belongs to
+        self.hour_start = self.hour_end = 0
+        self.hour = ''
+        self.last_save = time.monotonic()
+
+    def hour_key(self, ts):
+        """Hour directory name for a timestamp, cached for the current hour."""
+        if not self.hourly:
+            return ''
+        if not self.hour_start <= ts < self.hour_end:
+            local = time.localtime(ts)
+            self.hour = time.strftime('%Y%m%d-%H', local)
+            self.hour_start = ts - local.tm_min * 60 - local.tm_sec - (ts % 1)
+            self.hour_end = self.hour_start + 3600
+        return self.hour
+
+    def is_due(self, ts):
+        """Returns True if the current segment's hour has ended by `ts`, so it should be closed."""
+        return self.current_path is not None and self.hourly and ts >= self.current_end
+
+    def segment_path(self, ts):
+        """Returns the segment a record at `ts` belongs to, rotating if needed.
+
+        Records older than the current segment's hour, e.g. aggregated summaries whose
+        window started before the hour, go to the current segment, since earlier ones
+        are closed and may already be uploaded.
+        """
+        if self.current_path is not None:
+            if not self.is_due(ts) and (not self.max_bytes or self.current_bytes < self.max_bytes):
+                return self.current_path
+            self.close_segment()
+
+        hour = self.hour_key(ts)
+
+        segment_dir = os.path.join(self.directory, hour) if hour else self.directory
+        os.makedirs(segment_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(ts))
+        path = os.path.join(segment_dir, f"{self.prefix}_{stamp}{self.extension}")
+        counter = 1
+        while os.path.exists(path):
+            path = os.path.join(segment_dir, f"{self.prefix}_{stamp}_{counter}{self.extension}")
+            counter += 1
+        self.manifest.add_segment(path, ts)
+        self.current_path = path
+        self.current_bytes = 0
+        self.current_end = self.hour_end if self.hourly else float('inf')
+        return path
+
+    def record(self, path, start, end, records, size):
+        """Accounts for a batch written to the current segment."""
+        self.current_bytes += size
+        self.manifest.record(path, start, end, records, size)
+        if time.monotonic() - self.last_save >= self.SAVE_INTERVAL:
+            self.manifest.save()
+            self.last_save = time.monotonic()
+
+    def close_segment(self):
+        """Marks the current segment as closed so it can be uploaded."""
+        if self.current_path is None:
+            return
+        path, self.current_path = self.current_path, None
+        self.manifest.set_state(path, CLOSED)
+        if self.on_close is not None:
+            self.on_close(path)
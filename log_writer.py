@@ -0,0 +1,146 @@
+import queue
+import threading
+import time
+import metrics
+
+
+class TextEncoder:
+    """LogWriter encoder producing one UTF-8 text line per record."""
+
+    def __init__(self, format_record):
+        self.format_record = format_record  # Turns a (timestamp, activity_type) record into a log line
+
+    def header(self):
+        return b''
+
+    def encode(self, batch):
+        return ''.join(self.format_record(ts, activity_type) for ts, activity_type in batch).encode('utf-8')
+
+
+class LogWriter:
+    """Writes activity records to the log file from a background thread in batches."""
+
+    def __init__(self, log_file, encoder, batch_size=100, flush_interval=1.0, rotator=None, spool=None):
+        self.log_file = log_file
+        self.encoder = encoder  # TextEncoder or binary_log.BinaryEncoder
+        self.rotator = rotator  # Optional log_rotation.LogRotator choosing the segment to write to
+        self.spool = spool  # Optional spool_manager.SpoolManager told about every byte written
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.01, float(flush_interval))
+        self.records = queue.SimpleQueue()
+        self.running = False
+        self.thread = None
+        self._file = None
+        self._path = None
+        self.write_seconds = metrics.registry.histogram('log_write_seconds')
+        self.records_written = metrics.registry.counter('log_records_total')
+        self.bytes_written = metrics.registry.counter('log_bytes_total')
+
+    def start(self):
+        """Starts the background writer thread."""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="LogWriter", daemon=True)
+        self.thread.start()
+
+    def write(self, activity_type, timestamp=None):
+        """Queues a record; called from the input callbacks, so it must stay cheap."""
+        self.records.put((time.time() if timestamp is None else timestamp, activity_type))
+
+    def _run(self):
+        """Drains the queue and flushes whenever the batch is full or the interval has passed."""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while self.running or not self.records.empty():
+            timeout = deadline - time.monotonic()
+            if timeout > 0:
+                try:
+                    batch.append(self.records.get(timeout=timeout))
+                except queue.Empty:
+                    pass
+
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+        self._flush(batch)
+
+    def _flush(self, batch):
+        """Writes a batch of records to the open log file."""
+        # Pick up anything queued since the batch was started
+        while True:
+            try:
+                batch.append(self.records.get_nowait())
+            except queue.Empty:
+                break
+        if not batch:
+            self._close_if_due()
+            return
+        if self.rotator is None:
+            self._write(self.log_file, batch)
+            return
+        # Records go to the segment of their own timestamp, so a batch spanning the hour is split
+        while batch:
+            if self.rotator.is_due(batch[0][0]):
+                self._close_file()  # Before the rotator hands the finished segment on for upload
+            path = self.rotator.segment_path(batch[0][0])
+            split = next((i for i, (ts, _) in enumerate(batch) if self.rotator.is_due(ts)), len(batch))
+            self._write(path, batch[:split])
+            batch = batch[split:]
+
+    def _close_if_due(self):
+        """Closes the current segment once its hour is over, so an idle machine does not keep it open."""
+        if self.rotator is not None and self.rotator.is_due(time.time()):
+            self._close_file()
+            self.rotator.close_segment()
+
+    def _write(self, path, batch):
+        start = time.perf_counter()
+        try:
+            if path != self._path:
+                self._close_file()
+                self._open(path)
+            data = self.encoder.encode(batch)
+            self._file.write(data)
+            self._file.flush()
+            if self.spool is not None:
+                self.spool.grow(path, len(data))
+            self.write_seconds.observe(time.perf_counter() - start)
+            self.records_written.inc(len(batch))
+            self.bytes_written.inc(len(data))
+            if self.rotator is not None:
+                timestamps = [ts for ts, _ in batch]
+                self.rotator.record(path, min(timestamps), max(timestamps), len(batch), len(data))
+        except Exception as e:
+            print(f"Error writing activity log: {e}")
+
+    def _open(self, path):
+        """Opens a log file for appending, writing the format header to a new file."""
+        self._file = open(path, 'ab')
+        self._path = path
+        if self._file.tell() == 0:
+            header = self.encoder.header()
+            self._file.write(header)
+            if self.spool is not None:
+                self.spool.grow(path, len(header))
+        if self.spool is not None:
+            self.spool.protect(path)  # Never evict the file being appended to
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            if self.spool is not None:
+                self.spool.unprotect(self._path)
+            self._file = None
+            self._path = None
+
+    def close(self):
+        """Stops the writer thread after flushing every pending record."""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self._close_file()
+        if self.rotator is not None:
+            self.rotator.close_segment()
@@ -1,71 +1,102 @@
+import startup_report  # First, so --startup-report can time every other import
+import sys
+if '--startup-report' in sys.argv:
+    startup_report.enable()
+import importlib.util
 import os
-import json
 import threading
 import time
 import socket
-from botocore.exceptions import NoCredentialsError, ClientError  # Handle AWS errors
+from urllib.parse import urlsplit
 from activity_tracker import ActivityTracker
-from screenshot_manager import ScreenshotManager
+from scripted_detector import ScriptedActivityDetector
 from timezone_manager import TimeZoneManager
-from tray_icon import run_tray_icon
-from data_uploader import DataUploader  # Import the DataUploader class
-
-def load_config(config_file):
-    """Loads configuration from the JSON file."""
-    with open(config_file, 'r') as f:
-        return json.load(f)
-
-def initialize_config(config_file):
-    """Initializes default configuration if not present."""
-    if not os.path.exists(config_file):
-        default_config = {
-            "capture_screenshots": True,
-            "capture_blurred": False,
-            "screenshot_interval": 60
-        }
-        with open(config_file, 'w') as f:
-            json.dump(default_config, f, indent=4)
+import log_rotation
+from config_store import ConfigStore
+from scheduler import Scheduler
+from spool_manager import SpoolManager
+import hourly_index
+import metrics
+# Pillow, NumPy, boto3, pystray, tkinter and asyncio are imported where they are first
+# needed, so input tracking starts before they load and is not delayed by unused features
+
+# Activity log file name for each log format
+LOG_FILE_NAMES = {
+    'text': 'activity_tracker_log.txt',
+    'binary': 'activity_tracker_log.bin',
+}
 
 def is_internet_available():
     """Checks if the internet is available."""
     try:
         # Attempt to connect to a public DNS server
-        socket.create_connection(("8.8.8.8", 53))
+        socket.create_connection(("8.8.8.8", 53), timeout=3).close()
         return True
     except OSError:
         return False
 
-def upload_data_files(data_uploader):
-    """Uploads data files using DataUploader."""
-    if data_uploader.cloud_upload:  # Check if cloud upload is enabled
-        log_file = os.path.join(data_uploader.base_directory, 'activity_tracker_log.txt')
-        screenshot_directory = os.path.join(data_uploader.base_directory, 'screenshots')
-
-        # Upload log file
-        if os.path.exists(log_file):
-            try:
-                data_uploader.upload_file(log_file, 'activity_tracker_log.txt')  # Specify destination name
-            except (NoCredentialsError, ClientError) as e:
-                print(f"Error uploading log file: {e}. This might be due to firewall restrictions.")
-            except Exception as e:
-                print(f"Error uploading log file: {e}")
-        else:
-            print(f"Log file not found: {log_file}")
-
-        # Upload screenshots
-        for screenshot_file in os.listdir(screenshot_directory):
-            if screenshot_file.endswith('.png'):  # Assuming screenshots are in PNG format
-                full_screenshot_path = os.path.join(screenshot_directory, screenshot_file)
-                if os.path.exists(full_screenshot_path):
-                    try:
-                        data_uploader.upload_file(full_screenshot_path, f"screenshots/{screenshot_file}")  # Specify destination name
-                    except (NoCredentialsError, ClientError) as e:
-                        print(f"Error uploading screenshot file: {e}. This might be due to firewall restrictions.")
-                    except Exception as e:
-                        print(f"Error uploading screenshot file: {e}")
-                else:
-                    print(f"Screenshot file not found: {full_screenshot_path}")
+def enqueue_log_segment(upload_queue, log_rotator, path, config=None, spool=None):
+    """Queues a closed log segment for upload, or only its analytics summary if log_upload is "summary".
+
+    Called on the LogWriter thread when a segment closes, so the summary is made by a
+    task on the upload thread rather than here.
+    """
+    destination = f"logs/{log_rotator.manifest.relative(path)}"
+    if config is not None and config.get('log_upload', 'raw') == 'summary':
+        upload_queue.add_task(lambda: enqueue_log_summary(upload_queue, path, destination, config, spool))
+        return True
+    return upload_queue.enqueue(path, destination)
+
+def enqueue_log_summary(upload_queue, path, destination, config, spool=None):
+    """Summarizes a closed log segment, unless that was done before, and queues the summary for upload."""
+    summary_path = path + log_rotation.SUMMARY_SUFFIX
+    if not os.path.exists(summary_path):
+        import analytics  # NumPy; only loaded when summaries are uploaded
+        try:
+            analytics.summarize_segment(path, config.get('analytics_idle_gap', 300))
+        except (OSError, ValueError) as e:
+            print(f"Error summarizing log segment {path}: {e}")
+            return False
+        if spool is not None:
+            spool.record(summary_path)
+    return upload_queue.enqueue(summary_path, destination + log_rotation.SUMMARY_SUFFIX)
+
+def on_spool_delete(path, log_rotator=None, index=None):
+    """Records a file evicted to stay within the disk quota, so it is not queued again on the next start."""
+    if log_rotator is not None and log_rotator.manifest.state_of(path) not in (None, log_rotation.UPLOADED):
+        log_rotator.manifest.set_state(path, log_rotation.DELETED)
+    if index is not None:
+        index.set_screenshot_state(path, hourly_index.DELETED)
 
+def enqueue_existing_files(upload_queue, screenshot_directory, log_file, log_rotator=None, config=None, spool=None):
+    """Queues files written while the uploader was not running; already uploaded content is skipped."""
+    added = upload_queue.enqueue_directory(screenshot_directory, 'screenshots', extensions=['.png', '.jpg', '.webp'])
+    if log_rotator is not None:
+        for segment in log_rotator.manifest.segments_in_state(log_rotation.CLOSED):
+            if enqueue_log_segment(upload_queue, log_rotator, segment, config, spool):
+                added += 1
+    else:
+        # Without rotation the log is always open for writing, so it is never uploaded or deleted
+        upload_queue.drop_pending(log_file)
+    if added:
+        print(f"Queued {added} existing files for upload")
+
+
+def upload_config_error(config):
+    """Returns why the upload settings cannot work, or None; checked before anything is started."""
+    backend = config.get('upload_backend', 's3')
+    if backend == 's3':
+        if not config.get('s3_bucket'):
+            return "cloud_upload needs s3_bucket to be set"
+        if importlib.util.find_spec('boto3') is None:
+            return "uploading to S3 needs boto3 (pip install boto3)"
+    elif backend == 'collector':
+        url = urlsplit(config.get('collector_url', 'http://127.0.0.1:8765') or '')
+        if url.scheme not in ('http', 'https') or not url.hostname:
+            return f"invalid collector_url: {config.get('collector_url')}"
+    else:
+        return f"unknown upload_backend: {backend}"
+    return None
 
 def check_single_instance():
     """Ensures that only one instance of the application can run at a time."""
@@ -82,16 +113,82 @@ def remove_lock():
     if os.path.exists("app.lock"):
         os.remove("app.lock")
 
-def handle_uploads(data_uploader):
-    """Handles upload attempts, queuing them if there is no internet connection."""
-    while True:
-        if is_internet_available():
-            print("Internet connection restored. Attempting to upload data files...")
-            upload_data_files(data_uploader)
-            break
-        else:
-            print("No internet connection. Queuing uploads...")
-            time.sleep(5)  # Wait before retrying
+def handle_uploads(data_uploader, upload_queue, stop_event, log_rotator=None, spool=None, index=None):
+    """Drains the upload queue until shutdown, waiting out periods without internet connection."""
+    def on_uploaded(item):
+        if log_rotator is not None and item.destination.startswith('logs/'):
+            segment = item.path
+            if segment.endswith(log_rotation.SUMMARY_SUFFIX):
+                segment = segment[:-len(log_rotation.SUMMARY_SUFFIX)]  # The summary stands in for the segment
+            log_rotator.manifest.set_state(segment, log_rotation.UPLOADED)
+        if index is not None and item.destination.startswith('screenshots/'):
+            index.set_screenshot_state(item.path, hourly_index.UPLOADED)
+        if spool is not None:
+            spool.forget(item.path)  # No-op unless the uploader deleted it
+
+    # A collector may be on the local network, so failed uploads to it are retried with backoff instead
+    errors = ()
+    is_online = None
+    if data_uploader.upload_backend == 's3':
+        from botocore.exceptions import NoCredentialsError, ClientError  # Handle AWS errors
+        errors = (NoCredentialsError, ClientError)
+        is_online = is_internet_available
+    try:
+        data_uploader.drain_queue(upload_queue, stop_event, is_online=is_online, on_uploaded=on_uploaded)
+    except errors as e:
+        print(f"Error uploading data files: {e}. This might be due to firewall restrictions.")
+    finally:
+        data_uploader.shutdown()  # Waits for running uploads and closes the worker pool and connections
+
+
+def start_metrics(config, upload_queue, spool):
+    """Starts exporting metrics if metrics_enabled is set; returns the metrics file, if any."""
+    registry = metrics.registry
+    if not registry.enabled:
+        return None
+    if upload_queue is not None:
+        registry.add_collector(lambda: {'upload_queue_depth': upload_queue.pending_count()})
+    registry.add_collector(lambda: {'spool_bytes': spool.total_bytes})
+    metrics_file = config.get('metrics_file', 'metrics.json')
+    metrics_file = os.path.join(os.getcwd(), metrics_file) if metrics_file else None
+    registry.start_export(metrics_file, port=config.get('metrics_port', 0), interval=config.get('metrics_interval', 10))
+    return metrics_file
+
+
+def run_async(config, data_uploader, upload_queue, tz_manager, activity_tracker, screenshot_manager,
+              screenshot_directory, log_file, log_rotator, spool, metrics_file, index=None):
+    """Runs the agent on the asyncio runtime until Quit in the tray or Ctrl+C."""
+    from async_runtime import AsyncRuntime
+    from tray_icon import run_tray_icon
+    upload = None
+    wake_upload = None
+    if upload_queue is not None:
+        enqueue_existing_files(upload_queue, screenshot_directory, log_file, log_rotator, config, spool)
+        upload = lambda stop_event: handle_uploads(data_uploader, upload_queue, stop_event, log_rotator, spool, index)
+        wake_upload = upload_queue.item_added.set
+    jobs = [(config.get('spool_check_interval', 30), spool.enforce)]
+    if index is not None:
+        jobs.append((60, index.flush))
+    runtime = AsyncRuntime(
+        activity_tracker, screenshot_manager, tz_manager, config, upload=upload,
+        jobs=jobs,
+        on_started=startup_report.report,
+        wake_upload=wake_upload,
+        upload_timeout=config.get('upload_shutdown_timeout', 30)
+    )
+
+    tray_thread = threading.Thread(
+        target=run_tray_icon, args=(screenshot_manager, config, activity_tracker, runtime.request_stop, spool)
+    )
+    tray_thread.daemon = True
+    tray_thread.start()
+    try:
+        runtime.run()
+    finally:
+        if index is not None:
+            index.close()  # Write the event counts of the last windows
+        metrics.registry.stop_export(metrics_file)  # Write a final snapshot
+        remove_lock()  # Remove the lock file
 
 
 def main():
@@ -107,66 +204,175 @@ def main():
     os.makedirs(data_directory, exist_ok=True)
     os.makedirs(screenshot_directory, exist_ok=True)  # Create screenshot directory
 
-    # Initialize default configuration if not available
-    initialize_config(config_file)
+    # Initialize default configuration if not available and load it into the shared store
+    config = ConfigStore(config_file)
+    config.ensure_exists()
+    metrics.configure(config)  # Before any component is built, so they get live metrics when enabled
+
+    # Periodic work (capture, time zone and config checks, log window rollover) runs on one scheduler
+    # thread, or as tasks on an asyncio event loop with --asyncio
+    use_asyncio = '--asyncio' in sys.argv or config.get('async_runtime', False)
+    scheduler = None if use_asyncio else Scheduler()
+
+    # Upload settings; boto3 is only loaded when uploading to S3. AWS credentials are not kept in
+    # the code or config.json: boto3 reads them from the AWS_* environment variables or ~/.aws
+    cloud_upload = config.get('cloud_upload', False)
+    error = upload_config_error(config) if cloud_upload else None
+    if error:
+        print(f"Uploads disabled: {error}")
+        cloud_upload = False
+
+    # Persistent queue that new screenshots and closed log segments are added to
+    upload_queue = None
+    upload_stop_event = threading.Event()
+    if cloud_upload:
+        from upload_queue import UploadQueue
+        upload_queue = UploadQueue(os.path.join(data_directory, 'upload_queue.db'))
+
+    # Disk usage of data_to_upload; the tree is scanned once tracking has started
+    spool = SpoolManager.from_config(data_directory, config)
 
-    # Load the configuration
-    config = load_config(config_file)
+    # Hourly rollup of screenshots and event counts for time-range queries
+    index = None
+    if config.get('hourly_index', True):
+        index = hourly_index.HourlyIndex(os.path.join(data_directory, 'hourly_index.db'), screenshot_directory)
 
     # Initialize TimeZone Manager
     tz_manager = TimeZoneManager()
-    tz_manager_thread = threading.Thread(target=tz_manager.check_time_zone_change)
-    tz_manager_thread.daemon = True
-    tz_manager_thread.start()
+    startup_report.mark("configuration loaded")
 
     # Initialize and start the activity tracker
-    log_file = os.path.join(data_directory, 'activity_tracker_log.txt')
-    activity_tracker = ActivityTracker(log_file=log_file, tz_manager=tz_manager)
-    activity_tracker_thread = threading.Thread(target=activity_tracker.start_tracking)
-    activity_tracker_thread.daemon = True
-    activity_tracker_thread.start()
+    log_format = config.get('log_format', 'text')
+    log_file = os.path.join(data_directory, LOG_FILE_NAMES.get(log_format, LOG_FILE_NAMES['text']))
+    log_rotator = None
+    if config.get('log_rotation', True):
+        # Hourly segments under data_to_upload/logs/%Y%m%d-%H, indexed in logs/index.json
+        log_rotator = log_rotation.LogRotator(
+            os.path.join(data_directory, 'logs'),
+            os.path.basename(log_file),
+            max_bytes=config.get('log_rotate_max_bytes', 0),
+            on_close=(lambda path: enqueue_log_segment(upload_queue, log_rotator, path, config, spool)) if upload_queue else None
+        )
+    spool.on_delete = lambda path: on_spool_delete(path, log_rotator, index)
+    if upload_queue is not None:
+        spool.on_degrade = upload_queue.refresh  # Keep the queued hash and size in step with the smaller file
+    activity_tracker = ActivityTracker(
+        log_file=log_file,
+        tz_manager=tz_manager,
+        log_batch_size=config.get('log_batch_size', 100),
+        log_flush_interval=config.get('log_flush_interval', 1.0),
+        aggregate_events=config.get('aggregate_events', False),
+        aggregate_window=config.get('aggregate_window', 5),
+        scripted_detector=ScriptedActivityDetector.from_config(config),
+        log_format=log_format,
+        log_rotator=log_rotator,
+        spool=spool,
+        index=index
+    )
+    # Input is tracked before the slow startup steps below, in both modes
+    if use_asyncio:
+        activity_tracker.start_listeners()  # Events are handled on the listener threads until the runtime takes over
+    else:
+        activity_tracker.start_tracking(scheduler)
+    spool.scan()
+    if index is not None and index.created:
+        index.backfill()  # Screenshots taken before the index existed
 
-    # Initialize and start the screenshot manager
+    # Initialize the screenshot manager (Pillow and NumPy)
+    from screenshot_manager import ScreenshotManager
     screenshot_manager = ScreenshotManager(
         base_directory=screenshot_directory,
         activity_tracker=activity_tracker,
-        config_file=config_file
+        config_store=config,
+        upload_queue=upload_queue,
+        spool=spool,
+        index=index
     )
-    screenshot_thread = threading.Thread(target=screenshot_manager.start_capturing)
-    screenshot_thread.daemon = True
-    screenshot_thread.start()
+    startup_report.mark("screenshot manager ready")
 
-    # Start the tray icon in a separate thread
-    tray_thread = threading.Thread(target=run_tray_icon, args=(screenshot_manager, config_file, activity_tracker))
-    tray_thread.start()
+    data_uploader = None
+    if cloud_upload:
+        from data_uploader import DataUploader
+        data_uploader = DataUploader(
+            base_directory=data_directory,
+            cloud_upload=cloud_upload,
+            bucket_name=config.get('s3_bucket'),
+            endpoint_url=config.get('s3_endpoint_url'),
+            max_workers=config.get('upload_workers', 4),
+            max_bandwidth=config.get('upload_max_bandwidth', 0),
+            multipart_threshold=config.get('upload_multipart_threshold', 8 * 1024 * 1024),
+            multipart_chunksize=config.get('upload_multipart_chunksize', 8 * 1024 * 1024),
+            max_concurrency=config.get('upload_max_concurrency', 4),
+            bundle_target_size=config.get('bundle_target_size', 32 * 1024 * 1024),
+            bundle_max_file_size=config.get('bundle_max_file_size', 1024 * 1024),
+            bundle_codec=config.get('bundle_codec', 'gzip'),
+            bundle_max_age=config.get('bundle_max_age', 300),
+            upload_codec=config.get('upload_codec', 'gzip'),
+            compression_level=config.get('upload_compression_level', 6),
+            upload_backend=config.get('upload_backend', 's3'),
+            collector_url=config.get('collector_url', 'http://127.0.0.1:8765'),
+            collector_token=os.environ.get('COLLECTOR_TOKEN') or config.get('collector_token'),
+            agent_id=config.get('collector_agent_id')
+        )
+        startup_report.mark("uploader ready")
+
+    metrics_file = start_metrics(config, upload_queue, spool)
 
-    # Initialize DataUploader
-    cloud_upload = False  # Set to True if you want to upload files to cloud
-    BUCKET_NAME = 'your-s3-bucket-name'
-    AWS_ACCESS_KEY_ID = 'your-access-key-id'
-    AWS_SECRET_ACCESS_KEY = 'your-secret-access-key'
-
-    data_uploader = DataUploader(
-        base_directory=data_directory,
-        cloud_upload=cloud_upload,
-        bucket_name=BUCKET_NAME,
-        aws_access_key_id=AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=AWS_SECRET_ACCESS_KEY
+    if use_asyncio:
+        run_async(config, data_uploader, upload_queue, tz_manager, activity_tracker, screenshot_manager,
+                  screenshot_directory, log_file, log_rotator, spool, metrics_file, index)
+        return
+
+    scheduler.every('config', 2, config.reload_if_changed)  # Pick up edits made to config.json by hand
+    scheduler.every('timezone', 60, tz_manager.check_time_zone_change)  # Check every minute
+    scheduler.every('spool', config.get('spool_check_interval', 30), spool.enforce)  # Keep within the disk quota
+    if index is not None:
+        scheduler.every('index', 60, index.flush)  # Write the summed event counts
+    screenshot_manager.start_capturing(scheduler)
+    scheduler.start()
+
+    # Start the tray icon in a separate thread; Quit in its menu ends the loop below
+    from tray_icon import run_tray_icon
+    stop_requested = threading.Event()
+    tray_thread = threading.Thread(
+        target=run_tray_icon, args=(screenshot_manager, config, activity_tracker, stop_requested.set, spool)
     )
+    tray_thread.start()
 
     # Handle data uploads in a separate thread
-    upload_thread = threading.Thread(target=handle_uploads, args=(data_uploader,))
-    upload_thread.start()
+    upload_thread = None
+    if upload_queue is not None:
+        enqueue_existing_files(upload_queue, screenshot_directory, log_file, log_rotator, config, spool)
+        upload_thread = threading.Thread(
+            target=handle_uploads,
+            args=(data_uploader, upload_queue, upload_stop_event, log_rotator, spool, index)
+        )
+        upload_thread.daemon = True
+        upload_thread.start()
+    startup_report.mark("agent started")
+    startup_report.report()
 
     # Keep the main thread alive and monitor for shutdown
     try:
-        while True:
-            time.sleep(1)
+        while not stop_requested.wait(1):  # A timeout keeps Ctrl+C working on Windows
+            pass
+        print("Shutting down...")
     except KeyboardInterrupt:
         print("Shutting down...")
     finally:
         activity_tracker.stop_tracking()  # Stop activity tracking
-        screenshot_manager.stop_capturing()  # Stop screenshot capturing           
+        screenshot_manager.stop_capturing()  # Stop screenshot capturing
+        scheduler.stop()  # Returns at once, even mid-interval
+        upload_stop_event.set()  # Stop draining the upload queue
+        if upload_thread is not None:
+            upload_queue.item_added.set()  # Wake the drain if it is waiting for new files
+            timeout = config.get('upload_shutdown_timeout', 30)
+            upload_thread.join(timeout)  # Let running uploads complete
+            if upload_thread.is_alive():
+                print(f"Uploads still running after {timeout} seconds, exiting without them")
+        if index is not None:
+            index.close()  # Write the event counts of the last windows
+        metrics.registry.stop_export(metrics_file)  # Write a final snapshot
         remove_lock()  # Remove the lock file
         
 
@@ -26,7 +26,7 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=False,  # Decompressing UPX-packed libraries on every launch delays startup
     upx_exclude=[],
     runtime_tmpdir=None,
     console=True,
@@ -0,0 +1,254 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+# Upper bounds of the histogram buckets, for durations in seconds and for sizes in bytes
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = tuple(2 ** exponent for exponent in range(10, 28, 2))  # 1 KB to 128 MB
+
+
+class NullMetric:
+    """Stand-in returned while metrics are disabled; every update is a no-op."""
+
+    def inc(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+
+NULL_METRIC = NullMetric()
+
+
+class Counter:
+    """Monotonically increasing total, e.g. bytes uploaded."""
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount  # Not locked: an occasional lost increment is acceptable for monitoring
+
+    def export(self):
+        return self.value
+
+
+class Gauge:
+    """Value that goes up and down, e.g. the upload queue depth."""
+
+    def __init__(self):
+        self.value = None
+
+    def set(self, value):
+        self.value = value
+
+    def export(self):
+        return self.value
+
+
+class Histogram:
+    """Counts observations in fixed buckets; quantiles are estimated from the bucket bounds."""
+
+    def __init__(self, buckets=SECONDS_BUCKETS):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # The last bucket holds everything above the largest bound
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q):
+        """Returns the upper bound of the bucket holding the q-th observation."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds[index] if index < len(self.bounds) else float('inf')
+        return float('inf')
+
+    def export(self):
+        with self.lock:
+            buckets = {str(bound): count for bound, count in zip(self.bounds + ('inf',), self.counts)}
+            return {
+                'count': self.count,
+                'sum': self.sum,
+                'mean': self.sum / self.count if self.count else None,
+                'p50': self.quantile(0.5),
+                'p99': self.quantile(0.99),
+                'buckets': buckets,
+            }
+
+
+class ProcessStats:
+    """Resident memory and CPU use of this process, from psutil when it is installed."""
+
+    def __init__(self):
+        try:
+            import psutil
+            self.process = psutil.Process()
+        except ImportError:
+            self.process = None
+        self.last_cpu = time.process_time()
+        self.last_wall = time.monotonic()
+
+    def rss_bytes(self):
+        if self.process is not None:
+            return self.process.memory_info().rss
+        try:
+            # Linux without psutil: the second field of statm is the resident set in pages
+            with open('/proc/self/statm', 'r') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def collect(self):
+        cpu, wall = time.process_time(), time.monotonic()
+        elapsed = wall - self.last_wall
+        cpu_percent = (cpu - self.last_cpu) / elapsed * 100 if elapsed > 0 else None
+        self.last_cpu, self.last_wall = cpu, wall
+        return {
+            'process_rss_bytes': self.rss_bytes(),
+            'process_cpu_percent': cpu_percent,
+            'process_cpu_seconds_total': cpu,
+            'process_threads': threading.active_count(),
+        }
+
+
+class MetricsRegistry:
+    """Named counters, gauges and histograms plus collectors evaluated at export time.
+
+    While disabled, `counter`, `gauge` and `histogram` return a shared no-op metric, so
+    instrumented code pays one empty method call and nothing else. Collectors are
+    callables returning a dict of values; they are only called when a snapshot is taken,
+    which suits values that are cheap to read but wasteful to push, like queue depths.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.metrics = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.process_stats = None
+        self.exporter = None
+        self.server = None
+        self.stop_event = threading.Event()
+
+    def _get(self, name, factory):
+        if not self.enabled:
+            return NULL_METRIC
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = factory()
+            return metric
+
+    def counter(self, name):
+        return self._get(name, Counter)
+
+    def gauge(self, name):
+        return self._get(name, Gauge)
+
+    def histogram(self, name, buckets=SECONDS_BUCKETS):
+        return self._get(name, lambda: Histogram(buckets))
+
+    def add_collector(self, collector):
+        """Registers `collector()` returning {name: value} to be read on every snapshot."""
+        if self.enabled:
+            self.collectors.append(collector)
+
+    def snapshot(self):
+        """Returns every metric's current value as a JSON-serialisable dict."""
+        values = {'timestamp': time.time(), 'uptime_seconds': time.time() - self.started}
+        with self.lock:
+            metrics = list(self.metrics.items())
+        for name, metric in metrics:
+            values[name] = metric.export()
+        for collector in list(self.collectors):
+            try:
+                values.update(collector())
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+        return values
+
+    def write_file(self, path):
+        """Writes a snapshot atomically, so readers never see a partial file."""
+        temp_file = f"{path}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(self.snapshot(), f, indent=1, sort_keys=True)
+        os.replace(temp_file, path)
+
+    def start_export(self, path=None, port=0, interval=10):
+        """Writes snapshots to `path` every `interval` seconds and/or serves them on 127.0.0.1:`port`."""
+        if not self.enabled:
+            return
+        self.process_stats = ProcessStats()
+        self.add_collector(self.process_stats.collect)
+
+        if path:
+            def export():
+                while not self.stop_event.wait(interval):
+                    try:
+                        self.write_file(path)
+                    except OSError as e:
+                        print(f"Error writing metrics to {path}: {e}")
+
+            self.exporter = threading.Thread(target=export, name="MetricsExporter", daemon=True)
+            self.exporter.start()
+
+        if port:
+            from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+            registry = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    body = json.dumps(registry.snapshot(), indent=1, sort_keys=True).encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass  # Keep scrapes out of the console
+
+            # Bound to localhost only; the endpoint is for profiling on the machine itself
+            self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+            threading.Thread(target=self.server.serve_forever, name="MetricsServer", daemon=True).start()
+            print(f"Serving metrics on http://127.0.0.1:{port}/")
+
+    def stop_export(self, path=None):
+        """Stops exporting, writing a final snapshot to `path`."""
+        self.stop_event.set()
+        if self.exporter is not None:
+            self.exporter.join()
+            self.exporter = None
+        if self.server is not None:
+            self.server.shutdown()
+            self.server = None
+        if path and self.enabled:
+            self.write_file(path)
+
+
+# Process-wide registry; main enables it from the configuration before building any component
+registry = MetricsRegistry()
+
+
+def configure(config):
+    """Enables the registry if metrics_enabled is set in the configuration."""
+    registry.enabled = bool(config.get('metrics_enabled', False))
+    return registry
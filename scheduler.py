@@ -0,0 +1,161 @@
+import heapq
+import itertools
+import threading
+import time
+
+# Returned by a job's callback to stop being run until `Scheduler.resume` is called
+PAUSE = 'pause'
+
+
+class Job:
+    """A callback run by the Scheduler every `interval` seconds."""
+
+    def __init__(self, name, interval, callback):
+        self.name = name
+        self.interval = interval  # Seconds, or a callable returning seconds so changes apply at once
+        self.callback = callback
+        self.deadline = None  # Monotonic time of the next run
+        self.last_run = None  # Monotonic time the callback last started
+        self.paused = False
+        self.cancelled = False
+        self.version = 0  # Bumped on every reschedule; stale heap entries are skipped
+
+    def get_interval(self):
+        interval = self.interval() if callable(self.interval) else self.interval
+        return max(0.01, float(interval))
+
+
+class Scheduler:
+    """Runs periodic jobs on one thread from a heap of monotonic deadlines.
+
+    Deadlines advance by the interval from the previous deadline rather than from when
+    the callback finished, so slow callbacks do not make the schedule drift. The thread
+    sleeps on a condition until the earliest deadline, is woken at once by reschedules
+    and `stop`, and does not wake at all while every job is paused.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+    def every(self, name, interval, callback, delay=None):
+        """Adds a job; the first run is after `delay` seconds, or after one interval by default."""
+        job = Job(name, interval, callback)
+        with self.condition:
+            self._push(job, time.monotonic() + (job.get_interval() if delay is None else delay))
+        return job
+
+    def _push(self, job, deadline):
+        job.version += 1
+        job.deadline = deadline
+        heapq.heappush(self.heap, (deadline, next(self.counter), job.version, job))
+        self.condition.notify()
+
+    def reschedule(self, job):
+        """Re-applies the job's interval now, e.g. after it was changed, counting from its last run."""
+        with self.condition:
+            if job.cancelled or job.paused:
+                return
+            now = time.monotonic()
+            last_run = job.last_run if job.last_run is not None else now
+            self._push(job, max(now, last_run + job.get_interval()))
+
+    def pause(self, job):
+        with self.condition:
+            job.paused = True
+            job.version += 1
+
+    def pause_until(self, job, register):
+        """Pauses a job from its own callback, then calls `register` to arrange the `resume`; returns PAUSE.
+
+        The job is paused before the waiter exists, so a resume that comes before the
+        callback returns is not lost. Callers re-check their wake-up condition afterwards
+        and resume the job themselves if it is already met.
+        """
+        self.pause(job)
+        register()
+        return PAUSE
+
+    def resume(self, job):
+        """Resumes a paused job at its next slot on the original cadence."""
+        with self.condition:
+            if not job.paused or job.cancelled:
+                return
+            job.paused = False
+            now = time.monotonic()
+            interval = job.get_interval()
+            deadline = job.deadline if job.deadline is not None else now
+            if deadline < now:
+                deadline += ((now - deadline) // interval + 1) * interval
+            self._push(job, deadline)
+
+    def cancel(self, job):
+        with self.condition:
+            job.cancelled = True
+            job.version += 1
+
+    def start(self):
+        """Runs the jobs on a background thread."""
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self.run, name="Scheduler", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            with self.condition:
+                job = None
+                while self.running:
+                    # Drop entries superseded by a reschedule, pause or cancel
+                    while self.heap and self.heap[0][2] != self.heap[0][3].version:
+                        heapq.heappop(self.heap)
+                    if not self.heap:
+                        self.condition.wait()
+                        continue
+                    timeout = self.heap[0][0] - time.monotonic()
+                    if timeout > 0:
+                        self.condition.wait(timeout)
+                        continue
+                    _, _, _, job = heapq.heappop(self.heap)
+                    break
+                if not self.running:
+                    return
+                deadline = job.deadline
+                version = job.version
+                job.last_run = time.monotonic()
+
+            try:
+                result = job.callback()
+            except Exception as e:
+                print(f"Error in scheduled job {job.name}: {e}")
+                result = None
+
+            with self.condition:
+                if job.cancelled or job.paused:
+                    continue
+                if job.version != version:
+                    continue  # Rescheduled, or paused and resumed again, while it was running
+                if result == PAUSE:
+                    job.paused = True
+                    continue
+                interval = job.get_interval()
+                next_deadline = deadline + interval
+                now = time.monotonic()
+                if next_deadline <= now:
+                    # Fell behind, e.g. after the machine slept: skip the missed runs
+                    next_deadline = now + interval
+                self._push(job, next_deadline)
+
+    def stop(self):
+        """Stops the scheduler thread promptly, without waiting for any deadline."""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+            self.thread = None
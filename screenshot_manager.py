@@ -1,98 +1,348 @@
 import os
 import time
-import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from PIL import ImageGrab, Image, ImageFilter
-from data_uploader import DataUploader
+from PIL import Image, ImageFilter
+from frame_diff import FrameDiffer
+import capture_backends
+from adaptive_interval import AdaptiveInterval, INTERVAL_KEYS, ResourceMonitor
+from scheduler import PAUSE
+from hourly_index import LOCAL, QUEUED
+import metrics
 
-# Function to read configuration from a JSON file
-def read_config(config_file):
-    with open(config_file, 'r') as f:
-        config = json.load(f)
-    return config
+# File extension and Pillow save options for each screenshot format
+FORMATS = {
+    'png': ('.png', lambda quality: {'format': 'PNG', 'compress_level': 6}),
+    'jpeg': ('.jpg', lambda quality: {'format': 'JPEG', 'quality': quality, 'optimize': True}),
+    'webp': ('.webp', lambda quality: {'format': 'WEBP', 'quality': quality, 'method': 4}),
+}
+
+def screenshot_extension(image_format):
+    """Returns the file extension used for a screenshot format."""
+    return FORMATS.get(image_format, FORMATS['png'])[0]
+
+def encode_screenshot(image, path, image_format='png', quality=80, scale=1.0, blur=False):
+    """Downscales, blurs and encodes an in-memory screenshot in one pass and saves it to `path`."""
+    if scale < 1.0:
+        size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+        image = image.resize(size, Image.BILINEAR)
+    if blur:
+        image = image.filter(ImageFilter.GaussianBlur(10 * scale))
+    if image_format == 'jpeg' and image.mode != 'RGB':
+        image = image.convert('RGB')  # JPEG has no alpha channel
+    extension, options = FORMATS.get(image_format, FORMATS['png'])
+    # Written under a temporary name so a half-written file is never queued or uploaded
+    temp_path = f"{path}.tmp"
+    image.save(temp_path, **options(quality))
+    os.replace(temp_path, path)
+    return os.path.getsize(path)
 
 class ScreenshotManager:
-    def __init__(self, base_directory, activity_tracker, config_file):
+    def __init__(self, base_directory, activity_tracker, config_store, upload_queue=None, spool=None, index=None,
+                 backend=None):
         self.base_directory = base_directory
-        self.data_uploader = DataUploader(self.base_directory)
         self.screenshot_interval = 60  # Default interval
         self.activity_tracker = activity_tracker
         self.capture_screenshots = True
         self.capture_blurred = False
-        self.config_file = config_file
+        self.config = config_store  # Shared ConfigStore
         self.running = True
+        self.upload_queue = upload_queue  # Persistent upload queue new screenshots are added to
+        self.spool = spool  # Optional SpoolManager keeping track of disk usage
+        self.index = index  # Optional HourlyIndex recording every capture
+        self.diff_threshold = 0.01  # Frames changing less than this fraction are not saved again
+        self.frame_differs = {}  # Display name -> FrameDiffer, so each display is compared with itself
+        self.last_saved_paths = {}  # Display name -> last screenshot saved of it
+        self.last_captures = {}  # Display name -> monotonic time it was last grabbed
+
+        # Displays are captured one by one through a capture backend, created on the capture thread
+        self.capture_backend = 'auto'
+        self.capture_displays = None  # Names of the displays to capture; None captures every display
+        self.display_intervals = {}  # Display name -> its own capture interval in seconds
+        self.capture_region = None  # [left, top, right, bottom] on the virtual desktop, or 'focus'
+        self.backend = backend
+        self.backend_setting = None if backend is None else 'fixed'  # The capture_backend value it was created for
+        self.scheduler = None
+        self.capture_job = None
+        self.adaptive = None  # AdaptiveInterval while capture_adaptive is on
+
+        # Encoding settings; frames are blurred, encoded and saved by a small worker pool
+        self.image_format = 'png'
+        self.image_quality = 80
+        self.image_scale = 1.0
+        self.encode_workers = 2
+        self.encoder = None
+        self.encode_slots = None
+
+        self.capture_seconds = metrics.registry.histogram('screenshot_capture_seconds')
+        self.encode_seconds = metrics.registry.histogram('screenshot_encode_seconds')
+        self.frame_bytes = metrics.registry.histogram('screenshot_bytes', metrics.BYTES_BUCKETS)
+        self.diff_score = metrics.registry.gauge('screenshot_diff_score')
+        self.saved_count = metrics.registry.counter('screenshots_saved_total')
+        self.unchanged_count = metrics.registry.counter('screenshots_unchanged_total')
+        self.dropped_count = metrics.registry.counter('screenshots_dropped_total')
+        self.interval_gauge = metrics.registry.gauge('capture_interval_seconds')
 
         if not os.path.exists(self.base_directory):
             os.makedirs(self.base_directory)
 
-        # Load initial configuration
+        # Load initial configuration and follow later changes
+        self.load_config()
+        self.config.subscribe(self.on_config_changed)
+
+    def on_config_changed(self, changed):
+        """Applies configuration changes made by the tray menu or on disk."""
         self.load_config()
+        if any(key in changed for key in INTERVAL_KEYS) and self.capture_job is not None:
+            self.scheduler.reschedule(self.capture_job)  # Apply a new interval without waiting out the old one
 
     def load_config(self):
-        """Loads configuration settings from the JSON file."""
-        config = read_config(self.config_file)
+        """Loads configuration settings from the shared configuration store."""
+        config = self.config
         self.capture_screenshots = config.get('capture_screenshots', True)
         self.capture_blurred = config.get('capture_blurred', False)
         self.screenshot_interval = config.get('screenshot_interval', 60)
+        self.diff_threshold = config.get('screenshot_diff_threshold', 0.01)
+        self.image_format = config.get('screenshot_format', 'png')
+        self.image_quality = config.get('screenshot_quality', 80)
+        self.image_scale = config.get('screenshot_scale', 1.0)
+        self.encode_workers = config.get('screenshot_encode_workers', 2)
+        self.capture_backend = config.get('capture_backend', 'auto')
+        self.capture_displays = config.get('capture_displays', None)
+        self.display_intervals = {str(name): interval for name, interval
+                                  in config.get('capture_display_intervals', {}).items()}
+        self.capture_region = config.get('capture_region', None)
+        if not config.get('capture_adaptive', False):
+            self.adaptive = None
+        elif self.adaptive is None:
+            self.adaptive = AdaptiveInterval.from_config(config, ResourceMonitor(self.spool))
+        else:
+            self.adaptive.configure(config)
 
     def save_config(self):
-        """Saves the current configuration settings to the JSON file."""
-        config = {
+        """Saves the current configuration settings, keeping every other setting in the file."""
+        self.config.update({
             'capture_screenshots': self.capture_screenshots,
             'capture_blurred': self.capture_blurred,
             'screenshot_interval': self.screenshot_interval
-        }
-        with open(self.config_file, 'w') as f:
-            json.dump(config, f, indent=4)
+        })
+
+    def get_encoder(self, displays=1):
+        """Returns the encoding worker pool, created on first use."""
+        if self.encoder is None:
+            self.encoder = ThreadPoolExecutor(max_workers=self.encode_workers, thread_name_prefix="ScreenshotEncoder")
+            # At most two runs of frames per worker may wait, so a slow disk cannot pile up full-size bitmaps
+            self.encode_slots = threading.BoundedSemaphore(self.encode_workers * 2 * displays)
+        return self.encoder
+
+    def encode_and_save(self, screenshot, screenshot_path, destination_name, blur, taken_at=None, diff_score=None):
+        """Runs on an encoding worker: blurs and encodes the frame, then queues it for upload."""
+        try:
+            start = time.perf_counter()
+            size = encode_screenshot(
+                screenshot, screenshot_path, self.image_format, self.image_quality, self.image_scale, blur
+            )
+            elapsed = time.perf_counter() - start
+            print(f"Screenshot saved at {screenshot_path} ({size} bytes, {elapsed * 1000:.0f} ms)")
+            self.encode_seconds.observe(elapsed)
+            self.frame_bytes.observe(size)
+            self.saved_count.inc()
+            if self.spool is not None:
+                self.spool.record(screenshot_path)
+
+            # Index first, so a fast upload marking it uploaded finds the row to update
+            if self.index is not None:
+                self.index.add_screenshot(
+                    screenshot_path, taken_at or time.time(), size, diff_score,
+                    QUEUED if self.upload_queue is not None else LOCAL
+                )
+            if self.upload_queue is not None:
+                self.upload_queue.enqueue(screenshot_path, destination_name)
+        except Exception as e:
+            print(f"Failed to save screenshot: {e}")
+        finally:
+            self.encode_slots.release()
+
+    def capture_interval(self):
+        """Seconds between capture runs: the shortest of the screenshot and per-display intervals.
+
+        In adaptive mode runs are every capture_min_interval, and each display is skipped
+        until the adaptive interval has passed since it was last captured.
+        """
+        base = self.adaptive.min_interval if self.adaptive is not None else self.screenshot_interval
+        return min([base] + list(self.display_intervals.values()))
 
-    def blur_image(self, image_path):
-        """Blurs the image and saves it."""
-        img = Image.open(image_path)
-        blurred_img = img.filter(ImageFilter.GaussianBlur(10))
-        blurred_img.save(image_path)
-        print(f"Blurred image saved: {image_path}")
+    def effective_interval(self):
+        """Seconds between screenshots of a display without its own interval."""
+        adaptive = self.adaptive
+        return adaptive.interval if adaptive is not None else self.screenshot_interval
+
+    def interval_text(self):
+        """Describes the effective interval for the tray menu."""
+        adaptive = self.adaptive
+        if adaptive is None:
+            return f"{self.screenshot_interval:.0f}s"
+        pressure = f", slowed by {', '.join(adaptive.reasons)}" if adaptive.reasons else ''
+        return f"{adaptive.interval:.0f}s (adaptive {adaptive.min_interval}-{adaptive.max_interval}s{pressure})"
+
+    def get_backend(self):
+        """Returns the capture backend, creating it again when capture_backend changes; runs on the capture thread."""
+        if self.backend_setting != 'fixed' and self.backend_setting != self.capture_backend:
+            if self.backend is not None:
+                self.backend.close()
+            self.backend = capture_backends.create_backend(self.capture_backend)
+            self.backend_setting = self.capture_backend
+            print(f"Capturing with the {self.backend.name} backend: {self.backend.displays()}")
+        return self.backend
+
+    def capture_targets(self, displays):
+        """Returns (display, bbox) for each display due for capture, cropped to the capture region."""
+        region = self.capture_region
+        if region == 'focus':
+            region = capture_backends.foreground_window_bbox()  # None where it is unknown: whole displays
+        now = time.monotonic()
+        targets = []
+        default_interval = self.effective_interval()
+        slack = self.capture_interval() / 2
+        for display in displays:
+            if self.capture_displays and display.name not in [str(name) for name in self.capture_displays]:
+                continue
+            interval = self.display_intervals.get(display.name) or default_interval
+            last_capture = self.last_captures.get(display.name)
+            # Half a run of slack, so a display on twice the base interval is not pushed back by scheduling jitter
+            if last_capture is not None and now - last_capture < interval - slack:
+                continue
+            bbox = display.bbox if region is None else capture_backends.intersect(display.bbox, tuple(region))
+            if bbox is not None:
+                targets.append((display, bbox))
+        return targets
 
     def capture_screenshot(self):
-        """Captures a screenshot based on the current configuration."""
-        self.load_config()  # Load updated config settings before each screenshot
+        """Captures each display due based on the current configuration; returns PAUSE when there was no activity."""
         if not self.capture_screenshots:
             print("Screenshot capture is disabled in the config.")
             return
+        if time.time() - self.activity_tracker.last_activity_time > self.effective_interval():
+            return PAUSE
 
-        timestamp = datetime.now().strftime('%Y%m%d-%H')
+        now = datetime.now()
+        timestamp = now.strftime('%Y%m%d-%H')
         screenshot_dir = os.path.join(self.base_directory, timestamp)
         if not os.path.exists(screenshot_dir):
             os.makedirs(screenshot_dir)
 
-        screenshot_file = f"screenshot_{datetime.now().strftime('%Y%m%d-%H%M%S')}.png"
+        adaptive = self.adaptive
+        if adaptive is not None:
+            adaptive.update(self.activity_tracker.event_rates())
+            self.interval_gauge.set(adaptive.interval)
+
+        try:
+            displays = self.get_backend().displays()
+            targets = self.capture_targets(displays)
+        except Exception as e:
+            print(f"Failed to capture screenshot: {e}")
+            return
+        scores = []
+        try:
+            for display, bbox in targets:
+                # Single-display setups keep the plain file name
+                suffix = f"_{display.name}" if len(displays) > 1 else ''
+                screenshot_file = f"screenshot_{now.strftime('%Y%m%d-%H%M%S')}{suffix}{screenshot_extension(self.image_format)}"
+                score = self.capture_display(display, bbox, timestamp, screenshot_file, len(displays))
+                if score is not None:
+                    scores.append(score)
+        finally:
+            self.backend.finish_run()
+        if adaptive is not None and scores:
+            adaptive.observe_diff(max(scores))
+
+    def capture_display(self, display, bbox, timestamp, screenshot_file, displays=1):
+        """Grabs one display and hands it to the encoder unless it is unchanged since its last screenshot.
+
+        Returns the diff score of the frame, or None if it was not compared.
+        """
+        screenshot_dir = os.path.join(self.base_directory, timestamp)
         screenshot_path = os.path.join(screenshot_dir, screenshot_file)
+        try:
+            start = time.perf_counter()
+            taken_at = time.time()
+            screenshot = self.backend.grab(bbox)
+            self.last_captures[display.name] = time.monotonic()
 
-        if time.time() - self.activity_tracker.last_activity_time <= self.screenshot_interval:
-            try:
-                # Capture the screenshot using Pillow's ImageGrab on Windows
-                screenshot = ImageGrab.grab()
-                screenshot.save(screenshot_path)
-                print(f"Screenshot saved at {screenshot_path}")
-
-                if self.capture_blurred:
-                    self.blur_image(screenshot_path)
-            except Exception as e:
-                print(f"Failed to capture screenshot: {e}")
-        else:
-            print("No activity detected, skipping screenshot.")
+            score = None
+            if self.diff_threshold > 0:
+                differ = self.frame_differs.get(display.name)
+                if differ is None:
+                    differ = self.frame_differs[display.name] = FrameDiffer()
+                score = differ.score(screenshot)
+                self.diff_score.set(score)
+                if score < self.diff_threshold and display.name in self.last_saved_paths:
+                    self.capture_seconds.observe(time.perf_counter() - start)
+                    self.unchanged_count.inc()
+                    self.mark_unchanged(screenshot_dir, screenshot_file, score, self.last_saved_paths[display.name])
+                    return score
+            self.capture_seconds.observe(time.perf_counter() - start)
+
+            encoder = self.get_encoder(displays)
+            if not self.encode_slots.acquire(blocking=False):
+                print("Screenshot encoding is falling behind, skipping screenshot.")
+                self.dropped_count.inc()
+                return score
+            if self.diff_threshold > 0:
+                differ.accept()
+            self.last_saved_paths[display.name] = screenshot_path
+            encoder.submit(
+                self.encode_and_save, screenshot, screenshot_path,
+                f"screenshots/{timestamp}/{screenshot_file}", self.capture_blurred, taken_at, score
+            )
+            return score
+        except Exception as e:
+            print(f"Failed to capture screenshot of display {display.name}: {e}")
+
+    def mark_unchanged(self, screenshot_dir, screenshot_file, score, last_saved_path):
+        """Records a skipped near-duplicate frame instead of saving it."""
+        reference = os.path.relpath(last_saved_path, self.base_directory).replace(os.sep, '/')
+        unchanged_file = os.path.join(screenshot_dir, 'unchanged.txt')
+        with open(unchanged_file, 'a') as f:
+            f.write(f"{screenshot_file} unchanged from {reference} (score {score:.4f})\n")
+        if self.spool is not None:
+            self.spool.record(unchanged_file)
+        if self.index is not None:
+            self.index.add_unchanged(time.time())
+        print(f"Screen unchanged since {reference}, skipping screenshot.")
+
+    def start_capturing(self, scheduler):
+        """Schedules a capture every screenshot interval on `scheduler`, starting now."""
+        self.scheduler = scheduler
+        self.capture_job = scheduler.every('capture', self.capture_interval, self.run_capture, delay=0)
 
-    def start_capturing(self):
-        """Starts the screenshot capturing process and polls for configuration updates."""
-        while self.running:  # Check if the capturing is still running
-            self.capture_screenshot()  # Capture screenshots at the configured interval
-            time.sleep(self.screenshot_interval)
+    def run_capture(self):
+        """Scheduled capture; while there is no activity it sleeps until the next input event."""
+        if not self.running:
+            return PAUSE
+        if self.capture_screenshot() == PAUSE:
+            print("No activity detected, pausing screenshots until there is activity.")
+            # Resumed at the next slot on the current cadence
+            job = self.capture_job
+            self.scheduler.pause_until(job, lambda: self.activity_tracker.notify_on_activity(
+                lambda: self.scheduler.resume(job)))
+            if time.time() - self.activity_tracker.last_activity_time <= self.effective_interval():
+                self.scheduler.resume(job)  # Input arrived before the waiter was registered
+            return PAUSE
 
     def set_screenshot_interval(self, interval):
         """Allows manual setting of screenshot interval and saves the new interval to config."""
         self.screenshot_interval = interval
-        self.save_config()  # Save the updated interval to the config file
+        self.save_config()  # Save the updated interval; the config change reschedules the next capture
         print(f"Screenshot interval updated to: {interval} seconds")
 
     def stop_capturing(self):
-        """Stops the screenshot capturing process."""
+        """Stops the screenshot capturing process, waiting for frames still being encoded."""
         self.running = False
+        if self.capture_job is not None:
+            self.scheduler.cancel(self.capture_job)
+        if self.encoder is not None:
+            self.encoder.shutdown(wait=True)
+        if self.backend is not None:
+            self.backend.close()
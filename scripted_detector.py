@@ -0,0 +1,204 @@
+import math
+import threading
+
+
+class FastRepeatCheck:
+    """Flags a full window in which every gap between events is below a threshold."""
+
+    name = 'fast_repeat'
+    uses_stats = False
+
+    def __init__(self, threshold=0.015):
+        self.threshold = threshold
+        self.slow = 0  # Number of gaps in the window at or above the threshold
+
+    def push(self, value, evicted):
+        if value >= self.threshold:
+            self.slow += 1
+        if evicted is not None and evicted >= self.threshold:
+            self.slow -= 1
+
+    def reset(self):
+        self.slow = 0
+
+    def triggered(self, detector):
+        return self.slow == 0
+
+
+class LowJitterCheck:
+    """Flags a full window whose gaps barely vary, as produced by timers rather than people."""
+
+    name = 'low_jitter'
+    uses_stats = True
+
+    def __init__(self, max_stddev=0.002):
+        self.max_stddev = max_stddev
+
+    def triggered(self, detector):
+        return detector.stddev < self.max_stddev
+
+
+class PeriodicityCheck:
+    """Flags a full window whose gaps are regular relative to their mean (low coefficient of variation)."""
+
+    name = 'periodicity'
+    uses_stats = True
+
+    def __init__(self, max_cv=0.05):
+        self.max_cv = max_cv
+
+    def triggered(self, detector):
+        return detector.mean > 0 and detector.stddev < self.max_cv * detector.mean
+
+
+# Checks that can be enabled by name from the configuration
+CHECKS = {
+    FastRepeatCheck.name: lambda config: FastRepeatCheck(config.get('scripted_fast_threshold', 0.015)),
+    LowJitterCheck.name: lambda config: LowJitterCheck(config.get('scripted_jitter_threshold', 0.002)),
+    PeriodicityCheck.name: lambda config: PeriodicityCheck(config.get('scripted_periodicity_cv', 0.05)),
+}
+
+
+class ScriptedActivityDetector:
+    """Streaming detector over a fixed window of gaps between input events.
+
+    The window is a ring buffer with a running sum and sum of squares, so every update
+    costs the same regardless of the window size; the sums are only kept while a check
+    uses them (`uses_stats`). Checks are evaluated once the window is full, and
+    `on_change` is only called when the detected state flips. `push` and `reset` are
+    optional on a check that only reads the rolling statistics.
+    """
+
+    # Rolling sums are recomputed from the buffer this often to stop floating point drift
+    RESYNC_EVERY = 4096
+
+    def __init__(self, window_size=10, checks=None, on_change=None):
+        self.window_size = max(2, int(window_size))
+        self.checks = list(checks) if checks is not None else [FastRepeatCheck()]
+        self.on_change = on_change  # Called as on_change(active, check_name)
+        self.ring = [None] * self.window_size  # Gaps, oldest at `position` once full
+        self.position = 0
+        self.count = 0
+        self.full = False
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.updates = 0
+        self.active = False
+        self.active_check = None
+        self.lock = threading.Lock()
+        self.pushes = []
+        self.track_stats = False
+        self._bind_checks()
+
+    def _bind_checks(self):
+        """Caches what update() needs from the checks, so it does no attribute lookups per check."""
+        self.pushes = [check.push for check in self.checks if hasattr(check, 'push')]
+        self.track_stats = any(getattr(check, 'uses_stats', True) for check in self.checks)
+
+    @classmethod
+    def from_config(cls, config, on_change=None):
+        """Builds a detector from the scripted_* keys of the configuration."""
+        checks = []
+        for name in config.get('scripted_checks', [FastRepeatCheck.name]):
+            if name in CHECKS:
+                checks.append(CHECKS[name](config))
+            else:
+                print(f"Unknown scripted activity check: {name}")
+        return cls(window_size=config.get('scripted_window_size', 10), checks=checks, on_change=on_change)
+
+    def add_check(self, check):
+        """Registers an extra check object with `name`, `triggered` and optionally `push` and `reset`."""
+        with self.lock:
+            self.checks.append(check)
+            if hasattr(check, 'push'):
+                for value in self.values:
+                    check.push(value, None)
+            if getattr(check, 'uses_stats', True) and not self.track_stats:
+                self.resync()
+            self._bind_checks()
+
+    @property
+    def values(self):
+        """The gaps in the window, oldest first."""
+        if not self.full:
+            return self.ring[:self.count]
+        return self.ring[self.position:] + self.ring[:self.position]
+
+    def resync(self):
+        """Recomputes the rolling sums from the window, stopping floating point drift."""
+        values = self.values
+        self.total = math.fsum(values)
+        self.total_sq = math.fsum(v * v for v in values)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def variance(self):
+        n = self.count
+        if n < 2:
+            return 0.0
+        mean = self.total / n
+        return max(0.0, self.total_sq / n - mean * mean)
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+    def update(self, value):
+        """Adds the gap since the previous event and returns whether scripted activity is detected."""
+        with self.lock:
+            ring = self.ring
+            position = self.position
+            evicted = ring[position]  # None until the window is full
+            ring[position] = value
+            position += 1
+            self.position = 0 if position == self.window_size else position
+            for push in self.pushes:
+                push(value, evicted)
+            if self.track_stats:
+                if evicted is None:
+                    self.total += value
+                    self.total_sq += value * value
+                else:
+                    self.total += value - evicted
+                    self.total_sq += value * value - evicted * evicted
+                self.updates += 1
+                if self.updates >= self.RESYNC_EVERY:
+                    self.updates = 0
+                    self.resync()
+
+            if evicted is None:
+                self.count += 1
+                self.full = self.count == self.window_size
+                if not self.full:
+                    return self.active  # Checks need a full window
+            triggered = None
+            for check in self.checks:
+                if check.triggered(self):
+                    triggered = check.name
+                    break
+            if (triggered is not None) == self.active:
+                return self.active
+            self.active = triggered is not None
+            if self.active:
+                self.active_check = triggered
+
+        if self.on_change is not None:
+            self.on_change(self.active, self.active_check)
+        return self.active
+
+    def reset(self):
+        """Clears the window, e.g. after a long idle period."""
+        with self.lock:
+            self.ring = [None] * self.window_size
+            self.position = 0
+            self.count = 0
+            self.full = False
+            self.total = 0.0
+            self.total_sq = 0.0
+            self.updates = 0
+            for check in self.checks:
+                if hasattr(check, 'reset'):
+                    check.reset()
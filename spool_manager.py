@@ -0,0 +1,221 @@
+import json
+import os
+import threading
+import time
+
+# Files the agent keeps open or needs to run; they count towards usage but are never evicted
+PROTECTED_EXTENSIONS = ('.db', '.db-wal', '.db-shm', '.json', '.tmp', '.lock')
+# Screenshot format by extension, as in screenshot_manager.FORMATS; Pillow is only loaded to degrade one
+SCREENSHOT_EXTENSIONS = {'.png': 'png', '.jpg': 'jpeg', '.webp': 'webp'}
+STATE_FILE = 'spool_state.json'
+
+
+class SpoolManager:
+    """Keeps the data_to_upload tree within a disk quota.
+
+    The tree is walked once at startup; after that, writers report the files they
+    create or grow and the uploader reports the files it deletes, so the total is kept
+    up to date without listing directories again. Over quota, `enforce` first
+    re-encodes screenshots older than `degrade_after` seconds at a lower scale and
+    quality, then deletes the oldest files until usage is back under 90% of the quota.
+    """
+
+    def __init__(self, directory, max_bytes=0, degrade_after=3600, degrade_scale=0.5, degrade_quality=50):
+        self.directory = directory
+        self.max_bytes = max_bytes  # 0 only tracks usage
+        self.degrade_after = degrade_after
+        self.degrade_scale = degrade_scale
+        self.degrade_quality = degrade_quality
+        self.lock = threading.Lock()
+        self.files = {}  # Path -> [size, mtime]
+        self.total_bytes = 0
+        self.protected = set()  # Files open for writing, e.g. the current log segment
+        self.state_file = os.path.join(directory, STATE_FILE)
+        self.degraded = set()  # Relative paths of screenshots already re-encoded
+        self.on_delete = None  # Called with the path of every file deleted to stay within the quota
+        self.on_degrade = None  # Called with the path of every screenshot re-encoded smaller
+        self.load_state()
+
+    @classmethod
+    def from_config(cls, directory, config):
+        """Builds a spool manager from the spool_* configuration keys."""
+        return cls(
+            directory,
+            max_bytes=config.get('spool_max_bytes', 0),
+            degrade_after=config.get('spool_degrade_after', 3600),
+            degrade_scale=config.get('spool_degrade_scale', 0.5),
+            degrade_quality=config.get('spool_degrade_quality', 50)
+        )
+
+    def load_state(self):
+        if not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, 'r') as f:
+                self.degraded = set(json.load(f).get('degraded', []))
+        except (OSError, ValueError) as e:
+            print(f"Error reading spool state {self.state_file}: {e}")
+
+    def save_state(self):
+        """Writes the list of degraded screenshots atomically, so they are not degraded again after a restart."""
+        temp_file = f"{self.state_file}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump({'degraded': sorted(self.degraded)}, f)
+        os.replace(temp_file, self.state_file)
+
+    def relative(self, path):
+        return os.path.relpath(path, self.directory).replace(os.sep, '/')
+
+    def scan(self):
+        """Walks the tree once to learn the size of every file already on disk."""
+        files = {}
+        stack = [self.directory]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            stat = entry.stat()
+                            files[entry.path] = [stat.st_size, stat.st_mtime]
+            except OSError as e:
+                print(f"Error scanning {self.directory}: {e}")
+        with self.lock:
+            self.files = files
+            self.total_bytes = sum(size for size, _ in files.values())
+            self.degraded &= {self.relative(path) for path in files}
+        print(f"Spool usage: {self.usage_text()}")
+
+    def record(self, path):
+        """Updates the size of a file that was written or replaced."""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self.forget(path)
+            return
+        with self.lock:
+            old_size = self.files.get(path, [0, 0])[0]
+            self.files[path] = [stat.st_size, stat.st_mtime]
+            self.total_bytes += stat.st_size - old_size
+
+    def grow(self, path, nbytes):
+        """Counts bytes appended to a file without a stat call; used by the log writer on every flush."""
+        with self.lock:
+            entry = self.files.get(path)
+            if entry is None:
+                self.files[path] = [nbytes, time.time()]
+            else:
+                entry[0] += nbytes
+                entry[1] = time.time()
+            self.total_bytes += nbytes
+
+    def forget(self, path):
+        """Drops a file that was deleted, e.g. after it was uploaded."""
+        if os.path.exists(path):
+            return
+        with self.lock:
+            entry = self.files.pop(path, None)
+            if entry is not None:
+                self.total_bytes -= entry[0]
+
+    def protect(self, path):
+        with self.lock:
+            self.protected.add(path)
+
+    def unprotect(self, path):
+        with self.lock:
+            self.protected.discard(path)
+
+    def usage(self):
+        """Returns (bytes used, quota in bytes or 0)."""
+        return self.total_bytes, self.max_bytes
+
+    def usage_text(self):
+        used = self.total_bytes / (1024 * 1024)
+        if not self.max_bytes:
+            return f"{used:.0f} MB"
+        return f"{used:.0f} MB of {self.max_bytes / (1024 * 1024):.0f} MB"
+
+    def evictable(self, now):
+        """Returns (mtime, path) of files that may be degraded or deleted, oldest first."""
+        with self.lock:
+            candidates = [
+                (mtime, path) for path, (size, mtime) in self.files.items()
+                if path not in self.protected
+                and not path.endswith(PROTECTED_EXTENSIONS)
+                and now - mtime > 60  # Leave files alone that may still be being written
+            ]
+        candidates.sort()
+        return candidates
+
+    def enforce(self):
+        """Brings usage back under the quota; scheduled periodically."""
+        if not self.max_bytes or self.total_bytes <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)  # Free a margin so this does not run again on the next write
+        used = self.total_bytes
+        now = time.time()
+        candidates = self.evictable(now)
+        degraded = deleted = 0
+
+        for mtime, path in candidates:
+            if self.total_bytes <= target or now - mtime < self.degrade_after:
+                break
+            if self.degrade(path):
+                degraded += 1
+        if degraded:
+            self.save_state()
+
+        for mtime, path in candidates:
+            if self.total_bytes <= target:
+                break
+            if self.delete(path):
+                deleted += 1
+
+        print(f"Spool over quota ({used} > {self.max_bytes} bytes): degraded {degraded} screenshots, "
+              f"deleted {deleted} files, now {self.usage_text()}")
+
+    def degrade(self, path):
+        """Re-encodes an old screenshot at the degraded scale and quality; returns True if it was done."""
+        image_format = SCREENSHOT_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+        relative = self.relative(path)
+        if image_format is None or relative in self.degraded:
+            return False
+        from PIL import Image
+        from screenshot_manager import encode_screenshot
+        try:
+            mtime = os.path.getmtime(path)
+            with Image.open(path) as image:
+                image.load()
+                encode_screenshot(image, path, image_format, self.degrade_quality, self.degrade_scale)
+            os.utime(path, (mtime, mtime))  # Keep its place in the oldest-first order
+        except (OSError, ValueError) as e:
+            print(f"Error degrading screenshot {path}: {e}")
+            return False
+        self.degraded.add(relative)
+        self.record(path)
+        if self.on_degrade is not None:
+            self.on_degrade(path)
+        return True
+
+    def delete(self, path):
+        """Deletes a file and its directory once empty; returns True if it was deleted."""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Error deleting {path}: {e}")
+            return False
+        self.forget(path)
+        self.degraded.discard(self.relative(path))
+        if self.on_delete is not None:
+            self.on_delete(path)
+        directory = os.path.dirname(path)
+        if directory != self.directory:
+            try:
+                os.rmdir(directory)  # Only succeeds for an empty hourly directory
+            except OSError:
+                pass
+        return True
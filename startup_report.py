@@ -0,0 +1,55 @@
+import builtins
+import sys
+import time
+
+# Set when the module is first imported, which main.py does before anything else
+STARTED = time.perf_counter()
+
+enabled = False
+phases = []  # (seconds since start, phase name)
+imports = {}  # Module name -> [cumulative seconds, self seconds]
+_stack = []  # Child time accumulated by the imports currently in progress
+_original_import = builtins.__import__
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    """Times the first import of each module, like `python -X importtime`."""
+    if level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    _stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - start
+        children = _stack.pop()
+        if _stack:
+            _stack[-1] += elapsed
+        imports[name] = [elapsed, elapsed - children]
+
+
+def enable():
+    """Starts recording import times and phases; called for --startup-report."""
+    global enabled
+    enabled = True
+    builtins.__import__ = _timed_import
+
+
+def mark(phase):
+    """Records that a startup phase was reached; a no-op unless the report is enabled."""
+    if enabled:
+        phases.append((time.perf_counter() - STARTED, phase))
+
+
+def report(top=15):
+    """Prints the phases reached so far and the slowest imports, then stops timing imports."""
+    if not enabled:
+        return
+    builtins.__import__ = _original_import
+    print("Startup report (seconds since main.py was loaded):")
+    for seconds, phase in phases:
+        print(f"{seconds:>8.3f}  {phase}")
+    print(f"Slowest imports, of {len(imports)} modules imported (cumulative / self seconds):")
+    slowest = sorted(imports.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    for name, (cumulative, own) in slowest:
+        print(f"{cumulative:>8.3f} {own:>8.3f}  {name}")
@@ -0,0 +1,190 @@
+import asyncio
+import gzip
+import hashlib
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bundler
+from collector import Collector, FileStore
+from data_uploader import DataUploader
+
+
+@pytest.fixture
+def collector(tmp_path):
+    """Runs a Collector with a FileStore on localhost; yields (collector, port, loop)."""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    collector = Collector(FileStore(str(tmp_path / 'store')), str(tmp_path / 'spool'), batch_max_age=3600)
+    server = asyncio.run_coroutine_threadsafe(collector.start('127.0.0.1', 0), loop).result(5)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        yield collector, port, loop
+    finally:
+        asyncio.run_coroutine_threadsafe(collector.close(), loop).result(10)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+
+
+def flush(collector, loop):
+    asyncio.run_coroutine_threadsafe(collector.flush(), loop).result(10)
+
+
+def put(connection, destination, data, sha256=None, body=None, headers=None):
+    """PUTs `data` (or a different `body`, e.g. compressed or chunked) and returns (status, JSON reply)."""
+    request_headers = {
+        'X-Agent-Id': 'agent-1',
+        'X-Content-SHA256': sha256 or hashlib.sha256(data).hexdigest(),
+    }
+    request_headers.update(headers or {})
+    connection.request('PUT', f"/upload/{destination}", body=data if body is None else body, headers=request_headers)
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def stored_files(tmp_path, output):
+    """Extracts every batch written to the store into `output`; returns {name: content}."""
+    batches = []
+    for root, _, files in os.walk(tmp_path / 'store'):
+        batches += [os.path.join(root, name) for name in files if not name.endswith('.tmp')]
+    extracted = {}
+    for batch in batches:
+        assert bundler.extract_bundle(batch, str(output)) == []
+    for root, _, files in os.walk(output):
+        for name in files:
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                extracted[os.path.relpath(path, output).replace(os.sep, '/')] = f.read()
+    return extracted
+
+
+def test_round_trip(collector, tmp_path):
+    collector, port, loop = collector
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    log = b'2026-03-03 14:00:00 - Mouse Moved\n' * 100
+    assert put(connection, 'logs/activity.txt', log)[0] == 201
+    image = os.urandom(5000)
+    assert put(connection, 'screenshots/20260303-14/a.png', image, body=gzip.compress(image),
+               headers={'Content-Encoding': 'gzip'})[0] == 201
+    connection.close()
+
+    flush(collector, loop)
+    assert collector.pending()[0] == 0
+    assert stored_files(tmp_path, tmp_path / 'out') == {
+        'agent-1/logs/activity.txt': log,
+        'agent-1/screenshots/20260303-14/a.png': image,
+    }
+
+
+def test_round_trip_from_data_uploader(collector, tmp_path):
+    collector, port, loop = collector
+    source = tmp_path / 'screenshot.png'
+    content = os.urandom(300 * 1024)  # More than one compressed chunk
+    source.write_bytes(content)
+    uploader = DataUploader(str(tmp_path / 'agent'), cloud_upload=True, upload_backend='collector',
+                            collector_url=f"http://127.0.0.1:{port}", agent_id='agent-2', delete_after_upload=False)
+    try:
+        assert uploader.upload_file(str(source), 'screenshots/20260303-14/b.png')
+    finally:
+        uploader.shutdown()
+
+    flush(collector, loop)
+    assert stored_files(tmp_path, tmp_path / 'out') == {'agent-2/screenshots/20260303-14/b.png': content}
+
+
+def test_duplicates_are_stored_once(collector, tmp_path):
+    collector, port, loop = collector
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    data = b'same content'
+    assert put(connection, 'screenshots/a.png', data) == (201, {'duplicate': False, 'size': len(data)})
+    assert put(connection, 'screenshots/b.png', data) == (200, {'duplicate': True})
+    flush(collector, loop)
+    # Still known after it was written in a batch
+    assert put(connection, 'screenshots/c.png', data) == (200, {'duplicate': True})
+    connection.close()
+
+    assert collector.stats['received'] == 1
+    assert collector.stats['duplicates'] == 2
+    assert stored_files(tmp_path, tmp_path / 'out') == {'agent-1/screenshots/a.png': data}
+
+
+def test_bad_hash_is_rejected(collector, tmp_path):
+    collector, port, loop = collector
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    status, reply = put(connection, 'screenshots/a.png', b'content', sha256='0' * 64)
+    assert status == 400 and 'X-Content-SHA256' in reply['error']
+    status, _ = put(connection, 'screenshots/a.png', b'content', sha256='not-a-hash')
+    assert status == 400
+    assert collector.pending()[0] == 0
+    assert os.listdir(collector.incoming_directory) == []
+
+    # The rejected body was read, so the connection is still usable
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    put(connection, 'screenshots/a.png', b'content', sha256='0' * 64)
+    assert put(connection, 'screenshots/a.png', b'content')[0] == 201
+    connection.close()
+
+
+def test_chunked_body(collector, tmp_path):
+    collector, port, loop = collector
+    data = os.urandom(100 * 1024)
+    compressed = gzip.compress(data)
+    chunks = [compressed[i:i + 7000] for i in range(0, len(compressed), 7000)]
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    # An iterable body without Content-Length is sent with chunked transfer encoding
+    status, reply = put(connection, 'logs/segment.bin', data, body=iter(chunks), headers={'Content-Encoding': 'gzip'})
+    assert (status, reply['size']) == (201, len(data))
+    connection.close()
+
+    flush(collector, loop)
+    assert stored_files(tmp_path, tmp_path / 'out') == {'agent-1/logs/segment.bin': data}
+
+
+def test_corrupt_compressed_body_is_rejected(collector, tmp_path):
+    collector, port, loop = collector
+    data = b'content'
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    status, _ = put(connection, 'logs/a.txt', data, body=b'not gzip at all', headers={'Content-Encoding': 'gzip'})
+    assert status == 400
+    connection.close()
+    assert collector.pending()[0] == 0
+    assert os.listdir(collector.incoming_directory) == []
+
+
+def test_concurrent_uploads_of_the_same_content(collector, tmp_path):
+    collector, port, loop = collector
+    data = os.urandom(200 * 1024)
+    sha256 = hashlib.sha256(data).hexdigest()
+    connections = []
+    for name in ('a.png', 'b.png'):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        connection.putrequest('PUT', f"/upload/screenshots/{name}")
+        connection.putheader('X-Agent-Id', 'agent-1')
+        connection.putheader('X-Content-SHA256', sha256)
+        connection.putheader('Content-Length', str(len(data)))
+        connection.endheaders()
+        connection.send(data[:len(data) // 2])
+        connections.append(connection)
+    time.sleep(0.2)  # Both bodies are now being written at the same time
+    for connection in connections:
+        connection.send(data[len(data) // 2:])
+    statuses = []
+    for connection in connections:
+        response = connection.getresponse()
+        statuses.append(response.status)
+        response.read()
+        connection.close()
+    assert sorted(statuses) == [200, 201]
+
+    flush(collector, loop)
+    assert list(stored_files(tmp_path, tmp_path / 'out').values()) == [data]
+    assert os.listdir(collector.incoming_directory) == []
@@ -0,0 +1,47 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_uploader import DataUploader
+from upload_queue import UploadQueue
+
+
+def test_drain_stops_promptly_when_idle(tmp_path):
+    queue = UploadQueue(str(tmp_path / 'upload_queue.db'))
+    uploader = DataUploader(str(tmp_path / 'uploaded'))
+    stop_event = threading.Event()
+    drain = threading.Thread(target=uploader.drain_queue, args=(queue, stop_event), kwargs={'max_backoff': 600})
+    drain.start()
+    time.sleep(0.2)  # Idle, waiting for an item
+    start = time.monotonic()
+    stop_event.set()
+    drain.join(5)
+    assert not drain.is_alive()
+    assert time.monotonic() - start < 2
+    uploader.shutdown()
+    queue.close()
+
+
+def test_drain_uploads_queued_file(tmp_path):
+    queue = UploadQueue(str(tmp_path / 'upload_queue.db'))
+    uploader = DataUploader(str(tmp_path / 'uploaded'))
+    source = tmp_path / 'screenshot.png'
+    source.write_bytes(b'frame')
+    stop_event = threading.Event()
+    uploaded = threading.Event()
+    drain = threading.Thread(target=uploader.drain_queue, args=(queue, stop_event),
+                             kwargs={'on_uploaded': lambda item: uploaded.set()})
+    drain.start()
+    try:
+        assert queue.enqueue(str(source), 'screenshot.png')
+        assert uploaded.wait(5)
+        assert (tmp_path / 'uploaded' / 'screenshot.png').read_bytes() == b'frame'
+        assert queue.pending_count() == 0
+    finally:
+        stop_event.set()
+        drain.join(5)
+        uploader.shutdown()
+        queue.close()
@@ -0,0 +1,161 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import PAUSE, Scheduler
+
+
+def wait_until(condition, timeout=2.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if condition():
+            return True
+        time.sleep(0.005)
+    return condition()
+
+
+def test_runs_job_every_interval():
+    scheduler = Scheduler()
+    runs = []
+    scheduler.every('tick', 0.02, lambda: runs.append(time.monotonic()), delay=0)
+    scheduler.start()
+    try:
+        assert wait_until(lambda: len(runs) >= 5)
+    finally:
+        scheduler.stop()
+
+
+def test_pause_and_resume():
+    scheduler = Scheduler()
+    runs = []
+    job = scheduler.every('tick', 0.02, lambda: runs.append(1), delay=0)
+    scheduler.start()
+    try:
+        assert wait_until(lambda: runs)
+        scheduler.pause(job)
+        time.sleep(0.05)  # A run already under way may still finish
+        count = len(runs)
+        time.sleep(0.1)
+        assert len(runs) == count
+        scheduler.resume(job)
+        assert wait_until(lambda: len(runs) > count)
+    finally:
+        scheduler.stop()
+
+
+def test_callback_returning_pause_stays_paused_until_resumed():
+    scheduler = Scheduler()
+    runs = []
+
+    def callback():
+        runs.append(1)
+        return PAUSE
+
+    job = scheduler.every('idle', 0.01, callback, delay=0)
+    scheduler.start()
+    try:
+        assert wait_until(lambda: runs)
+        time.sleep(0.1)
+        assert len(runs) == 1 and job.paused
+        scheduler.resume(job)
+        assert wait_until(lambda: len(runs) == 2)
+    finally:
+        scheduler.stop()
+
+
+def test_resume_before_callback_returns_is_not_lost():
+    scheduler = Scheduler()
+    runs = []
+    job = None
+
+    def callback():
+        runs.append(1)
+        if len(runs) == 1:
+            # The wake-up event fires while the callback is still deciding to pause
+            return scheduler.pause_until(job, lambda: scheduler.resume(job))
+        return None
+
+    job = scheduler.every('capture', 0.01, callback, delay=0)
+    scheduler.start()
+    try:
+        assert wait_until(lambda: len(runs) >= 3)
+        assert not job.paused
+    finally:
+        scheduler.stop()
+
+
+def test_pause_until_waits_for_the_registered_waiter():
+    scheduler = Scheduler()
+    runs = []
+    waiters = []
+    job = None
+
+    def callback():
+        runs.append(1)
+        return scheduler.pause_until(job, lambda: waiters.append(lambda: scheduler.resume(job)))
+
+    job = scheduler.every('capture', 0.01, callback, delay=0)
+    scheduler.start()
+    try:
+        assert wait_until(lambda: waiters)
+        time.sleep(0.1)
+        assert len(runs) == 1
+        waiters.pop()()
+        assert wait_until(lambda: len(runs) == 2)
+    finally:
+        scheduler.stop()
+
+
+def test_reschedule_applies_new_interval():
+    scheduler = Scheduler()
+    interval = [10.0]
+    ran = threading.Event()
+    job = scheduler.every('slow', lambda: interval[0], ran.set)
+    scheduler.start()
+    try:
+        assert not ran.wait(0.05)
+        interval[0] = 0.01
+        scheduler.reschedule(job)
+        assert ran.wait(1)
+    finally:
+        scheduler.stop()
+
+
+def test_reschedule_while_running_keeps_new_deadline():
+    scheduler = Scheduler()
+    runs = []
+    job = None
+
+    def callback():
+        runs.append(time.monotonic())
+        if len(runs) == 1:
+            job.interval = 0.5
+            scheduler.reschedule(job)  # Counts from this run's start
+        return None
+
+    job = scheduler.every('job', 0.01, callback, delay=0)
+    scheduler.start()
+    try:
+        assert wait_until(lambda: runs)
+        time.sleep(0.2)
+        assert len(runs) == 1
+    finally:
+        scheduler.stop()
+
+
+def test_cancel_and_stop():
+    scheduler = Scheduler()
+    runs = []
+    job = scheduler.every('tick', 0.01, lambda: runs.append(1), delay=0)
+    scheduler.start()
+    assert wait_until(lambda: runs)
+    scheduler.cancel(job)
+    time.sleep(0.03)
+    count = len(runs)
+    time.sleep(0.05)
+    assert len(runs) == count
+    scheduler.stop()
+    assert scheduler.thread is None
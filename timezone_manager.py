@@ -1,20 +1,136 @@
+import os
+import sys
 import time
 import threading
+from datetime import datetime
+from dateutil import tz
+
+SECONDS = [f"{second:02d}" for second in range(60)]
+
+
+def elapsed_clock():
+    """Returns a monotonic clock that keeps counting while the machine is suspended.
+
+    time.monotonic stops during suspend on Linux (CLOCK_MONOTONIC) and macOS, which would
+    make timestamps lag by the time asleep until the next resync. CLOCK_BOOTTIME on Linux
+    and CLOCK_MONOTONIC on macOS include it; Windows' monotonic clock already does.
+    """
+    if sys.platform.startswith('linux') and hasattr(time, 'CLOCK_BOOTTIME'):
+        clock_id = time.CLOCK_BOOTTIME
+    elif sys.platform == 'darwin' and hasattr(time, 'CLOCK_MONOTONIC'):
+        clock_id = time.CLOCK_MONOTONIC
+    else:
+        return time.monotonic
+    try:
+        time.clock_gettime(clock_id)
+    except OSError:
+        return time.monotonic
+    return lambda: time.clock_gettime(clock_id)
 
 class TimeZoneManager:
     def __init__(self):
         self.current_timezone = self.get_current_timezone()
+        self.tzinfo = self.load_tzinfo(self.current_timezone)
+        self.version = 0  # Bumped on every change so cached timestamps can be invalidated cheaply
 
     def get_current_timezone(self):
-        # This gets the current system time zone
-        return time.tzname[0]  # This may return something like 'GMT' or 'UTC'
+        """Returns the system time zone's IANA name, e.g. 'Asia/Kolkata', else a Windows display name or abbreviation."""
+        name = os.environ.get('TZ')
+        if name:
+            return name.lstrip(':')
+        # Most Unix systems link /etc/localtime into the zoneinfo database
+        try:
+            target = os.path.realpath('/etc/localtime')
+            marker = f"zoneinfo{os.sep}"
+            if marker in target:
+                return target.split(marker, 1)[1]
+        except OSError:
+            pass
+        tzwinlocal = getattr(tz, 'tzwinlocal', None)
+        if tzwinlocal is not None:
+            return tzwinlocal().display()  # Windows: the zone currently set in the registry
+        # Abbreviations such as 'IST' are ambiguous, so they are only used to notice changes
+        if hasattr(time, 'tzset'):
+            time.tzset()
+        return time.tzname[0]
+
+    def load_tzinfo(self, name):
+        """Resolves a zone name to a tzinfo, falling back to the system's local time rules."""
+        tzinfo = tz.gettz(name) if name and '/' in name else None
+        if tzinfo is None:
+            tzwinlocal = getattr(tz, 'tzwinlocal', None)
+            tzinfo = tzwinlocal() if tzwinlocal is not None else tz.tzlocal()
+        return tzinfo
 
     def check_time_zone_change(self):
-        while True:
-            new_timezone = self.get_current_timezone()
-            if new_timezone != self.current_timezone:
-                print(f"Time zone changed from {self.current_timezone} to {new_timezone}")
-                self.current_timezone = new_timezone
-                # Here, you could add logic to update timestamps in logs if necessary
-            time.sleep(60)  # Check every minute
+        """Checks once for a time zone change; run every minute by the scheduler."""
+        new_timezone = self.get_current_timezone()
+        if new_timezone != self.current_timezone:
+            print(f"Time zone changed from {self.current_timezone} to {new_timezone}")
+            self.tzinfo = self.load_tzinfo(new_timezone)
+            self.current_timezone = new_timezone
+            self.version += 1
+
+
+class TimestampService:
+    """Cheap wall-clock timestamps and log time strings for the input event path.
+
+    `now()` adds the time elapsed since an anchor, on a clock that includes suspend (see
+    elapsed_clock), to the wall-clock time read at the anchor, and is re-anchored every
+    `resync_interval` seconds so clock corrections still show up. A correction never makes
+    timestamps go backwards: after a backward step they hold at the last value until the
+    wall clock catches up. Formatting reuses the string of the current minute and only appends
+    the seconds; the minute is recomputed with the cached tzinfo when a timestamp falls
+    outside it or the time zone changes.
+    """
+
+    def __init__(self, tz_manager, resync_interval=60.0):
+        self.tz_manager = tz_manager
+        self.resync_interval = resync_interval
+        self.clock = elapsed_clock()
+        self.anchor = (0.0, 0.0, 0.0, 0.0)  # (wall time, clock time, clock time of the next resync, floor)
+        self.minute = (0.0, 0.0, '', -1)  # (start, end, 'YYYY-mm-dd HH:MM:' prefix, tz_manager version)
+        self.resync()
+
+    def resync(self):
+        """Re-reads the wall clock, e.g. after it was adjusted."""
+        wall, anchor, _, floor = self.anchor
+        elapsed = self.clock()
+        floor = max(floor, wall + (elapsed - anchor))  # The latest timestamp handed out so far
+        self.anchor = (time.time(), elapsed, elapsed + self.resync_interval, floor)
+
+    def now(self):
+        """Returns the current time as seconds since the epoch."""
+        wall, anchor, resync_at, floor = self.anchor
+        elapsed = self.clock()
+        if elapsed >= resync_at:
+            self.resync()
+            wall, anchor, _, floor = self.anchor
+        now = wall + (elapsed - anchor)
+        return now if now >= floor else floor
+
+    def _minute(self, ts):
+        start, end, prefix, version = self.minute
+        if start <= ts < end and version == self.tz_manager.version:
+            return start, prefix
+        return self._new_minute(ts)
+
+    def _new_minute(self, ts):
+        version = self.tz_manager.version
+        local = datetime.fromtimestamp(ts, self.tz_manager.tzinfo)
+        start = ts - local.second - local.microsecond / 1e6
+        prefix = local.strftime('%Y-%m-%d %H:%M:')
+        self.minute = (start, start + 60, prefix, version)
+        return start, prefix
+
+    def format(self, ts):
+        """Formats a timestamp as 'YYYY-mm-dd HH:MM:SS' in the local time zone."""
+        start, end, prefix, version = self.minute
+        if not (start <= ts < end and version == self.tz_manager.version):
+            start, prefix = self._new_minute(ts)
+        return prefix + SECONDS[int(ts - start)]
 
+    def format_clock(self, ts):
+        """Formats the time of day of a timestamp as 'HH:MM:SS'."""
+        start, prefix = self._minute(ts)
+        return prefix[11:] + SECONDS[int(ts - start)]
@@ -1,8 +1,8 @@
 import os
+import threading
 import pystray
 from PIL import Image, ImageDraw
 from pystray import MenuItem, Menu
-import json
 from tkinter import simpledialog, Tk  # Import Tkinter for dialog
 
 def remove_lock():
@@ -10,18 +10,6 @@ def remove_lock():
     if os.path.exists("app.lock"):
         os.remove("app.lock")
 
-def load_config(config_file):
-    """Loads configuration from the specified JSON file."""
-    with open(config_file, 'r') as f:
-        return json.load(f)
-
-def update_config(config_file, key, value):
-    """Updates a specific key in the configuration file."""
-    config = load_config(config_file)
-    config[key] = value
-    with open(config_file, 'w') as f:
-        json.dump(config, f, indent=4)
-
 def create_image(width, height, color1, color2):
     """Creates an icon for the tray."""
     image = Image.new('RGB', (width, height), color1)
@@ -30,22 +18,22 @@ def create_image(width, height, color1, color2):
     dc.rectangle((0, height // 2, width // 2, height), fill=color2)
     return image
 
-def run_tray_icon(screenshot_manager, config_file, activity_tracker):
-    """Runs the tray icon with options to manage screenshot settings."""
+def run_tray_icon(screenshot_manager, config_store, activity_tracker, request_stop=None, spool=None):
+    """Runs the tray icon with options to manage screenshot settings.
+
+    `request_stop`, if given, is called on Quit to shut the agent down in order
+    instead of stopping the components here and exiting the process; the process
+    is only forced to exit if that shutdown hangs. With a `spool`, the menu shows
+    the disk space used by data waiting for upload.
+    """
 
     # Function to toggle screenshot capturing
     def toggle_screenshots(icon, item):
-        new_value = not screenshot_manager.capture_screenshots
-        update_config(config_file, 'capture_screenshots', new_value)
-        screenshot_manager.capture_screenshots = new_value
-        update_menu(icon)  # Refresh menu
+        config_store.set('capture_screenshots', not screenshot_manager.capture_screenshots)
 
     # Function to toggle blur option
     def toggle_blur(icon, item):
-        new_value = not screenshot_manager.capture_blurred
-        update_config(config_file, 'capture_blurred', new_value)
-        screenshot_manager.capture_blurred = new_value
-        update_menu(icon)  # Refresh menu
+        config_store.set('capture_blurred', not screenshot_manager.capture_blurred)
 
     # Function to set screenshot interval
     def set_screenshot_interval(icon, item):
@@ -58,11 +46,19 @@ def run_tray_icon(screenshot_manager, config_file, activity_tracker):
 
         if user_input is not None:
             screenshot_manager.set_screenshot_interval(user_input)  # Update the interval
-            update_menu(icon)  # Refresh menu
 
     # Function to handle quit
     def on_quit(icon, item):
         print("Tray icon clicked, exiting...")
+        if request_stop is not None:
+            icon.stop()
+            request_stop()  # The agent flushes logs, the index and uploads and removes the lock file
+            # Last resort: exit anyway well after running uploads were given up on
+            timeout = config_store.get('upload_shutdown_timeout', 30) + 30
+            timer = threading.Timer(timeout, os._exit, args=(1,))
+            timer.daemon = True
+            timer.start()
+            return
         activity_tracker.stop_tracking()  # Stop activity tracking
         screenshot_manager.stop_capturing()  # Stop screenshot capturing
         remove_lock()  # Remove the lock file
@@ -87,6 +83,17 @@ def run_tray_icon(screenshot_manager, config_file, activity_tracker):
                 "Set Screenshot Interval",
                 set_screenshot_interval  # New menu item for setting interval
             ),
+            MenuItem(
+                lambda item: f"Capture Interval: {screenshot_manager.interval_text()}",  # Changes with activity in adaptive mode
+                lambda icon, item: None,
+                enabled=False
+            ),
+            MenuItem(
+                lambda item: f"Disk Usage: {spool.usage_text()}" if spool is not None else "",  # Re-evaluated each time the menu opens
+                lambda icon, item: None,
+                enabled=False,
+                visible=spool is not None
+            ),
             MenuItem("Quit", on_quit)
         )
 
@@ -96,5 +103,7 @@ def run_tray_icon(screenshot_manager, config_file, activity_tracker):
     # Create and run the tray icon
     icon = pystray.Icon("activity_tracker_icon", icon_image)
     update_menu(icon)  # Set initial menu
+    # Refresh the menu whenever a setting changes, from the menu itself or in config.json
+    config_store.subscribe(lambda changed: update_menu(icon))
     print("User's activity is being tracked...")
     icon.run()
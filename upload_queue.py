@@ -0,0 +1,264 @@
+import collections
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+# Item states
+PENDING = 'pending'
+DONE = 'done'
+MISSING = 'missing'
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """Returns the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadItem:
+    """A queued file with its destination name and retry state."""
+
+    def __init__(self, item_id, path, destination, sha256, size, attempts, enqueued_at):
+        self.id = item_id
+        self.path = path
+        self.destination = destination
+        self.sha256 = sha256
+        self.size = size
+        self.attempts = attempts
+        self.enqueued_at = enqueued_at
+
+
+class UploadQueue:
+    """Persistent upload queue stored in SQLite under the data directory.
+
+    Files are deduplicated by content hash: enqueueing the same file again (e.g. after a
+    restart) is ignored, and a different file with content that is already queued waits
+    for the first one and is then marked done without being uploaded (see is_duplicate).
+    State changes are committed in a single transaction, so a restart resumes with the
+    items still pending.
+    """
+
+    # Items next_batch may bundle: ready, small and not a duplicate of content queued earlier
+    BUNDLE_CONDITION = (
+        "state = ? AND next_attempt <= ? AND size <= ? AND id NOT IN ({}) "
+        "AND NOT EXISTS (SELECT 1 FROM items AS earlier WHERE earlier.sha256 = items.sha256 "
+        "AND earlier.id < items.id AND earlier.state IN (?, ?))"
+    )
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        schema = self.connection.execute("SELECT sql FROM sqlite_master WHERE name = 'items'").fetchone()
+        if schema is not None and 'UNIQUE' in schema[0]:
+            self.drop_unique_hash()
+        self.create_table()
+        self.connection.execute("CREATE INDEX IF NOT EXISTS items_pending ON items (state, next_attempt)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS items_path ON items (path)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS items_sha256 ON items (sha256)")
+        self.item_added = threading.Event()  # Set whenever an item is enqueued, to wake the uploader
+        self.tasks = collections.deque()  # Callables run on the upload thread, e.g. to make a file to queue
+
+    def create_table(self):
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT NOT NULL,
+                destination TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL DEFAULT 0,
+                enqueued_at REAL NOT NULL,
+                done_at REAL
+            )
+        """)
+
+    def drop_unique_hash(self):
+        """Rebuilds a queue created when the content hash was unique, so duplicates can be recorded."""
+        self.connection.execute("BEGIN")
+        self.connection.execute("ALTER TABLE items RENAME TO items_old")
+        self.create_table()
+        self.connection.execute("INSERT INTO items SELECT * FROM items_old")
+        self.connection.execute("DROP TABLE items_old")
+        self.connection.execute("COMMIT")
+
+    def enqueue(self, path, destination):
+        """Adds a file to the queue; returns False if this file with this content has been queued before."""
+        try:
+            sha256 = file_hash(path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            print(f"Cannot queue {path} for upload: {e}")
+            return False
+        with self.lock:
+            known = self.connection.execute(
+                "SELECT 1 FROM items WHERE path = ? AND sha256 = ? LIMIT 1", (path, sha256)
+            ).fetchone()
+            if known is not None:
+                return False
+            self.connection.execute(
+                "INSERT INTO items (path, destination, sha256, size, state, enqueued_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (path, destination, sha256, size, PENDING, time.time())
+            )
+        self.item_added.set()
+        return True
+
+    def add_task(self, task):
+        """Has the uploader run `task()` on its thread before its next upload; tasks are not persisted."""
+        self.tasks.append(task)
+        self.item_added.set()
+
+    def run_tasks(self):
+        while self.tasks:
+            task = self.tasks.popleft()
+            try:
+                task()
+            except Exception as e:
+                print(f"Error in upload task: {e}")
+
+    def is_known(self, path):
+        """Returns whether a file at this path has been queued before."""
+        with self.lock:
+            row = self.connection.execute("SELECT 1 FROM items WHERE path = ? LIMIT 1", (path,)).fetchone()
+        return row is not None
+
+    def enqueue_directory(self, directory, destination_prefix, extensions=None):
+        """Queues files under a directory that were written before the queue existed or while it was not running."""
+        added = 0
+        for root, _, files in os.walk(directory):
+            for name in sorted(files):
+                if extensions and not name.endswith(tuple(extensions)):
+                    continue
+                path = os.path.join(root, name)
+                if self.is_known(path):
+                    continue
+                relative = os.path.relpath(path, directory).replace(os.sep, '/')
+                if self.enqueue(path, f"{destination_prefix}/{relative}"):
+                    added += 1
+        return added
+
+    def next_ready(self, now=None, exclude=(), min_size=0):
+        """Returns the oldest pending item whose retry time has come, or None.
+
+        Items whose ids are in `exclude`, e.g. uploads already in progress, and items
+        smaller than `min_size` bytes are skipped.
+        """
+        if now is None:
+            now = time.time()
+        exclude = list(exclude)
+        placeholders = ','.join('?' * len(exclude))
+        # A duplicate waits until the item queued before it with the same content is done
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT id, path, destination, sha256, size, attempts, enqueued_at FROM items "
+                f"WHERE state = ? AND next_attempt <= ? AND size >= ? AND id NOT IN ({placeholders}) "
+                "AND NOT EXISTS (SELECT 1 FROM items AS earlier WHERE earlier.sha256 = items.sha256 "
+                "AND earlier.id < items.id AND earlier.state = ?) ORDER BY id LIMIT 1",
+                (PENDING, now, min_size, *exclude, PENDING)
+            ).fetchone()
+        return UploadItem(*row) if row else None
+
+    def is_duplicate(self, item):
+        """Returns whether the same content has already been uploaded from another queued file."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM items WHERE sha256 = ? AND id != ? AND state = ? LIMIT 1", (item.sha256, item.id, DONE)
+            ).fetchone()
+        return row is not None
+
+    def next_batch(self, max_item_size, target_size, exclude=(), now=None, limit=10000):
+        """Returns the oldest ready items no larger than `max_item_size`, up to `target_size` bytes in total.
+
+        Duplicates of content queued earlier are left out; next_ready hands them out one by one.
+        """
+        if now is None:
+            now = time.time()
+        exclude = list(exclude)
+        placeholders = ','.join('?' * len(exclude))
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT id, path, destination, sha256, size, attempts, enqueued_at FROM items "
+                f"WHERE {self.BUNDLE_CONDITION.format(placeholders)} ORDER BY id LIMIT ?",
+                (PENDING, now, max_item_size, *exclude, PENDING, DONE, limit)
+            ).fetchall()
+        items = []
+        total = 0
+        for row in rows:
+            if items and total + row[4] > target_size:
+                break
+            items.append(UploadItem(*row))
+            total += row[4]
+        return items
+
+    def bundle_backlog(self, max_item_size, exclude=(), now=None):
+        """Returns (bytes, oldest enqueue time) of the items next_batch would choose from; the time is None without any."""
+        if now is None:
+            now = time.time()
+        exclude = list(exclude)
+        placeholders = ','.join('?' * len(exclude))
+        with self.lock:
+            row = self.connection.execute(
+                f"SELECT COALESCE(SUM(size), 0), MIN(enqueued_at) FROM items WHERE {self.BUNDLE_CONDITION.format(placeholders)}",
+                (PENDING, now, max_item_size, *exclude, PENDING, DONE)
+            ).fetchone()
+        return row[0], row[1]
+
+    def next_attempt_time(self, after=0):
+        """Returns the earliest retry time after `after` of the pending items, or None if there is none."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT MIN(next_attempt) FROM items WHERE state = ? AND next_attempt > ?", (PENDING, after)
+            ).fetchone()
+        return row[0]
+
+    def mark_done(self, item, state=DONE):
+        """Marks an item as uploaded (or missing) so it is never picked up again."""
+        with self.lock:
+            self.connection.execute(
+                "UPDATE items SET state = ?, done_at = ? WHERE id = ?", (state, time.time(), item.id)
+            )
+
+    def mark_failed(self, item, retry_delay):
+        """Records a failed attempt and schedules the next one."""
+        with self.lock:
+            self.connection.execute(
+                "UPDATE items SET attempts = attempts + 1, next_attempt = ? WHERE id = ?",
+                (time.time() + retry_delay, item.id)
+            )
+
+    def refresh(self, path):
+        """Updates the hash and size of a pending file that was rewritten, e.g. re-encoded by the spool."""
+        try:
+            sha256 = file_hash(path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            print(f"Cannot refresh queued file {path}: {e}")
+            return
+        with self.lock:
+            self.connection.execute(
+                "UPDATE items SET sha256 = ?, size = ? WHERE path = ? AND state = ?", (sha256, size, path, PENDING)
+            )
+
+    def drop_pending(self, path):
+        """Stops a file that must not be uploaded from being picked up, e.g. one still being written."""
+        with self.lock:
+            self.connection.execute(
+                "UPDATE items SET state = ?, done_at = ? WHERE path = ? AND state = ?", (MISSING, time.time(), path, PENDING)
+            )
+
+    def pending_count(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM items WHERE state = ?", (PENDING,)).fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()